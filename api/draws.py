@@ -1,15 +1,22 @@
 # api/draws.py
-import binascii
-from time import time
+import asyncio, binascii
+from time import time, perf_counter
 from fastapi import APIRouter, Body
 from fastapi.responses import JSONResponse
 from settings import settings
 from streams import hub
 from models import SolDrawIn, SolDrawOut
-from rng.local_pool import clear_draw, root_hex, bytes_total
+from rng.local_pool import root_hex, bytes_total, health
+from services.registry import registry, DrawStateError, MIXED
 from sources.solana import solana_beacon
+from sources.solana_tracker import tracker
 from services.collect import CollectParams, collect_server_entropy
+from services.health import EntropyHealthError
+from services.progress import progress
 from services.mix import emit_mix_and_result
+from services.cluster import cluster, route
+from services.scheduler import scheduler
+from services.metrics import draw_seconds
 from services.store import save_draw, set_current_draw, get_current_draw, list_draws  # <<-- добавь импорт
 
 router = APIRouter()
@@ -17,27 +24,126 @@ router = APIRouter()
 
 @router.post("/draws/solana", response_model=SolDrawOut)
 async def draw_solana(body: SolDrawIn = Body(...)):
-    draw_id = body.draw_id
-    blocks = body.blocks or settings.SOL_BLOCKS
+    # в кластере тиражи ведёт лидер: у него реестр, трекер и нумерация событий
+    fwd = await cluster.forward("draws.solana", body.model_dump())
+    if fwd is not None:
+        return fwd
+    # состояние тиража живёт в реестре; закрываем при любом исходе (в т.ч. ошибке/отмене)
+    try:
+        st = registry.open(body.draw_id)
+    except DrawStateError as e:
+        # тот же draw_id уже идёт — не трогаем его пул
+        return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+    t0 = perf_counter()
+    outcome = "cancelled"
+    try:
+        res = await _run_draw(body)
+        outcome = "ok" if isinstance(res, SolDrawOut) else "error"
+        return res
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        draw_seconds.labels(outcome).observe(perf_counter() - t0)
+        # id мог уже занять новый запуск (наше состояние вытеснено) — его не трогаем
+        cur = registry.get(body.draw_id)
+        if cur is None or cur is st:
+            registry.close(body.draw_id, owner=st)
+            progress.discard(body.draw_id)
+            hub.close_draw(body.draw_id)
 
-    clear_draw(draw_id)
 
-    await hub.emit(draw_id, {"type": "commit", "drawId": draw_id, "blocks": blocks, "source": "SOLANA"})
-    await hub.emit(draw_id, {"type": "block.waiting", "drawId": draw_id,
-                             "note": f"Fetching last {blocks} finalized Solana blocks"})
+@route("draws.solana")
+async def _draw_solana_rpc(args: dict):
+    return await draw_solana(SolDrawIn(**args))
+
+
+async def _stage_timeout(draw_id: str, stage: str, limit_s: float) -> JSONResponse:
+    msg = f"stage '{stage}' exceeded {limit_s:g}s deadline"
+    await hub.emit(draw_id, {"type": "error", "drawId": draw_id, "stage": stage, "message": msg})
+    return JSONResponse(status_code=504, content={"error": msg, "stage": stage})
 
+
+class _StageFailed(Exception):
+    """Стадия тиража завершилась ошибкой; response — готовый HTTP-ответ."""
+    def __init__(self, response: JSONResponse):
+        super().__init__(response.status_code)
+        self.response = response
+
+
+async def _beacon_stage(draw_id: str, blocks: int, timing: dict):
     try:
-        beacon_bytes, details = await solana_beacon(blocks)
+        # свежие блоки из фонового трекера; если буфер протух — живой скан RPC
+        cached = tracker.beacon(blocks) if settings.SOL_TRACKER else None
+        async with asyncio.timeout(settings.DRAW_BEACON_TIMEOUT_S):
+            beacon_bytes, details = cached if cached is not None else await solana_beacon(blocks)
+    except TimeoutError:
+        raise _StageFailed(await _stage_timeout(draw_id, "solana", settings.DRAW_BEACON_TIMEOUT_S))
     except Exception as e:
         msg = f"Solana RPC error: {e}"
         await hub.emit(draw_id, {"type": "error", "drawId": draw_id, "stage": "solana", "message": msg})
-        return JSONResponse(status_code=500, content={"error": msg})
+        raise _StageFailed(JSONResponse(status_code=500, content={"error": msg}))
 
+    timing["beaconFinalizedAt"] = int(time() * 1000)
     beacon_hex = binascii.hexlify(beacon_bytes).decode()
     await hub.emit(draw_id, {
         "type": "block.finalized_all", "drawId": draw_id,
-        "explorers": details, "beaconHex": beacon_hex
+        "explorers": details, "beaconHex": beacon_hex,
+        "finalizedAt": timing["beaconFinalizedAt"],
     })
+    return beacon_bytes, beacon_hex, details
+
+
+async def _collect_stage(draw_id: str, p: CollectParams, timing: dict):
+    collect_deadline = p.collect_ms / 1000.0 + settings.DRAW_COLLECT_GRACE_S
+    try:
+        async with asyncio.timeout(collect_deadline):
+            await collect_server_entropy(draw_id, p)
+    except TimeoutError:
+        raise _StageFailed(await _stage_timeout(draw_id, "collect", collect_deadline))
+    except EntropyHealthError as e:
+        # отказал серверный источник — это не ошибка запроса
+        raise _StageFailed(JSONResponse(status_code=503, content={
+            "error": str(e), "stage": "collect", "health": {e.source: e.report}}))
+    except ValueError as e:
+        raise _StageFailed(JSONResponse(status_code=400, content={"error": str(e)}))
+    except Exception as e:
+        # упал пул воркеров джиттера (BrokenProcessPool и т.п.) — сервер, не запрос
+        msg = f"server entropy collection failed: {e!r}"
+        await hub.emit(draw_id, {"type": "error", "drawId": draw_id, "stage": "collect", "message": msg})
+        raise _StageFailed(JSONResponse(status_code=503, content={"error": msg, "stage": "collect"}))
+    timing["collectClosedAt"] = int(time() * 1000)
+
+
+async def _run_stages(*coros) -> list:
+    """
+    Независимые стадии параллельно. Первая упавшая отменяет остальные
+    (как и отмена самого тиража); исключение поднимается как есть.
+    """
+    tasks = [asyncio.create_task(c) for c in coros]
+    try:
+        done, _pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        for t in tasks:
+            if not t.done():
+                t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    # причина — упавшая к моменту пробуждения wait, а не первая по списку: отменённые
+    # ею стадии могли успеть упасть следом (например, на своём таймауте)
+    for t in tasks:
+        if t in done and not t.cancelled() and t.exception() is not None:
+            raise t.exception()
+    return [t.result() for t in tasks]
+
+
+async def _run_draw(body: SolDrawIn):
+    draw_id = body.draw_id
+    blocks = body.blocks or settings.SOL_BLOCKS
+    timing = {"startedAt": int(time() * 1000)}
+
+    await hub.emit(draw_id, {"type": "commit", "drawId": draw_id, "blocks": blocks, "source": "SOLANA"})
+    await hub.emit(draw_id, {"type": "block.waiting", "drawId": draw_id,
+                             "note": f"Fetching last {blocks} finalized Solana blocks"})
 
     p = CollectParams(
         collect_ms=getattr(body, "collect_ms", 8000) or 0,
@@ -47,13 +153,24 @@ async def draw_solana(body: SolDrawIn = Body(...)):
         require_loc=getattr(body, "require_loc", False),
         min_loc_bytes=getattr(body, "min_loc_bytes", 0) or 0,
     )
+    # маяк и сбор локальной энтропии независимы до смешивания: длительность тиража — max, а не сумма.
+    # В потоке block.finalized_all приходит между collect.* событиями, когда маяк готов.
     try:
-        await collect_server_entropy(draw_id, p)
-    except ValueError as e:
-        return JSONResponse(status_code=400, content={"error": str(e)})
+        (beacon_bytes, beacon_hex, details), _ = await _run_stages(
+            _beacon_stage(draw_id, blocks, timing),
+            _collect_stage(draw_id, p, timing),
+        )
+    except _StageFailed as e:
+        return e.response
 
     # ——— MIX + RESULT (возвращает inputs/compare/trace для истории)
+    # под блокировкой тиража: пакет, пришедший параллельно, не вклинится в снимок корня
+    async with registry.require(draw_id).lock:
+        registry.set_status(draw_id, MIXED)
+    # пакеты, пришедшие после collect.close: их loc.progress — до событий смешивания
+    await progress.flush(draw_id)
     mix_res = await emit_mix_and_result(draw_id, beacon_bytes, beacon_hex)
+    timing["mixedAt"] = int(time() * 1000)
     seed_hex = mix_res["seed_hex"]
     number_u64 = mix_res["number_u64"]
     inputs = mix_res["inputs"]
@@ -72,11 +189,12 @@ async def draw_solana(body: SolDrawIn = Body(...)):
         },
         "inputs": inputs,  # например ["PUB"] или ["PUB","LOC"]
         "entropy": {
-            "locRoot": root_hex(draw_id) if bytes_total(draw_id) > 0 else None
-            # при желании: сюда можно добавить summary из collect_server_entropy
+            "locRoot": root_hex(draw_id) if bytes_total(draw_id) > 0 else None,
+            "health": health(draw_id),  # RCT/APT и оценка min-entropy по источникам
         },
         "compare": compare_obj,  # PUB vs PUB+LOC
         "trace": trace_obj,  # пошаговая трассировка
+        "timing": timing,  # startedAt / beaconFinalizedAt / collectClosedAt / mixedAt, мс
         "result": {
             "seedHex": seed_hex,
             "u64": number_u64
@@ -109,3 +227,17 @@ async def draws_current():
         except Exception:
             cur = None
     return {"drawId": cur}
+
+
+@router.get("/draws/schedule")
+async def draws_schedule():
+    """Сетка авто-тиражей: следующий draw_id/старт, опоздания, длительности, пропуски."""
+    fwd = await cluster.forward("draws.schedule", {})
+    if fwd is not None:
+        return fwd
+    return scheduler.snapshot()
+
+
+@route("draws.schedule")
+async def _draws_schedule_rpc(args: dict):
+    return scheduler.snapshot()
@@ -1,34 +1,161 @@
 # api/entropy.py
-from fastapi import APIRouter, Body
+import asyncio, json
+from concurrent.futures.process import BrokenProcessPool
+from typing import Union
+from fastapi import APIRouter, Body, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
 from models import UserEntropyIn
-from streams import hub
-from rng.local_pool import add_packet, bytes_total, packet_count, root_hex
-from sources.loc_entropy import cpu_jitter_bytes
+from rng.local_pool import add_packet, root_hex
+from services.registry import registry, DrawStateError
+from services.health import EntropyHealthError
+from services.progress import progress
+from sources.loc_entropy import cpu_jitter_bytes_async, JitterBusyError
+from services.cluster import cluster, route
+from settings import settings
 
 router = APIRouter()
 
+def _too_large() -> JSONResponse:
+    return JSONResponse(status_code=413, content={"error": f"packet too large (max {settings.USER_PACKET_MAX_BYTES} bytes)"})
+
+async def _add_user(draw_id: str, data: bytes) -> Union[dict, JSONResponse]:
+    """Один пользовательский пакет в пул тиража (общий путь для hex, raw и WebSocket)."""
+    if not data:
+        return JSONResponse(status_code=400, content={"error": "empty payload"})
+    if len(data) > settings.USER_PACKET_MAX_BYTES:
+        return _too_large()
+    # в кластере пул у лидера; шина — JSON, поэтому байты едут в hex
+    fwd = await cluster.forward("entropy.user", {"draw_id": draw_id, "payload_hex": data.hex()})
+    if fwd is not None:
+        return fwd
+    try:
+        # блокировка тиража: пакет не вклинится в снимок корня перед смешиванием
+        async with registry.require(draw_id).lock:
+            add_packet(draw_id, data, "user")
+            # loc.progress — не на каждый пакет, а не чаще LOC_PROGRESS_MAX_HZ на тираж
+            await progress.notify(draw_id, "USER")
+            return {"ok": True, "root_hex": root_hex(draw_id)}
+    except EntropyHealthError as e:
+        # пакет не принят; пул тиража не изменился
+        return JSONResponse(status_code=e.status_code, content={"error": str(e), "health": e.report})
+    except DrawStateError as e:
+        return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+
 @router.post("/entropy/{draw_id}/user")
 async def entropy_user(draw_id: str, body: UserEntropyIn = Body(...)):
     try:
         data = bytes.fromhex(body.payload_hex)
     except Exception:
         return JSONResponse(status_code=400, content={"error": "payload_hex must be hex"})
-    add_packet(draw_id, data)
-    await hub.emit(draw_id, {
-        "type":"loc.progress","drawId":draw_id,"source":"USER",
-        "bytesTotal": bytes_total(draw_id),"packets": packet_count(draw_id),
-        "rootHex": root_hex(draw_id),
-    })
-    return {"ok": True, "root_hex": root_hex(draw_id)}
+    return await _add_user(draw_id, data)
+
+@router.post("/entropy/{draw_id}/user/raw", openapi_extra={"requestBody": {"required": True, "content": {
+    "application/octet-stream": {"schema": {"type": "string", "format": "binary"}}}}})
+async def entropy_user_raw(draw_id: str, request: Request):
+    """Тот же пакет сырыми байтами (application/octet-stream): без hex и JSON-разбора."""
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > settings.USER_PACKET_MAX_BYTES:
+        return _too_large()
+    buf = bytearray()
+    async for chunk in request.stream():
+        buf += chunk
+        if len(buf) > settings.USER_PACKET_MAX_BYTES:
+            return _too_large()
+    return await _add_user(draw_id, bytes(buf))
+
+@router.websocket("/entropy/{draw_id}/user/ws")
+async def entropy_user_ws(ws: WebSocket, draw_id: str):
+    """
+    Непрерывный поток энтропии: каждый бинарный кадр — пакет.
+    Кадры обрабатываются строго по одному; пока пакет не принят, следующий не читаем —
+    очередь сервера ограничена (ws_max_queue uvicorn), дальше подпирает TCP-окно клиента.
+    Подтверждения {"ok", "bytes", "packets", "rootHex"} — не чаще LOC_PROGRESS_MAX_HZ,
+    текстовый кадр "ack" — подтверждение сразу. Отвергнутый health-тестами пакет —
+    {"ok": false, ...} без разрыва; тираж закрыт или лимит соединения исчерпан — close.
+    """
+    await ws.accept()
+    loop = asyncio.get_running_loop()
+    interval = 1.0 / settings.LOC_PROGRESS_MAX_HZ if settings.LOC_PROGRESS_MAX_HZ > 0 else 0.0
+    received = packets = 0
+    root = None
+    last_ack = float("-inf")
+
+    async def ack():
+        nonlocal last_ack
+        last_ack = loop.time()
+        await ws.send_json({"ok": True, "bytes": received, "packets": packets, "rootHex": root})
+
+    try:
+        while True:
+            msg = await ws.receive()
+            if msg["type"] == "websocket.disconnect":
+                return
+            data = msg.get("bytes")
+            if data is None:
+                if (msg.get("text") or "").strip() == "ack":
+                    await ack()
+                    continue
+                await ws.close(code=1003, reason="binary frames only")
+                return
+            if len(data) > settings.USER_PACKET_MAX_BYTES:
+                await ws.close(code=1009, reason=f"packet too large (max {settings.USER_PACKET_MAX_BYTES} bytes)")
+                return
+            if received + len(data) > settings.USER_WS_MAX_BYTES:
+                await ws.send_json({"ok": False, "error": f"connection limit reached ({settings.USER_WS_MAX_BYTES} bytes)",
+                                    "bytes": received, "packets": packets})
+                await ws.close(code=1008, reason="connection byte limit")
+                return
+            res = await _add_user(draw_id, data)
+            # JSONResponse — ошибка или ответ лидера через шину кластера
+            status, body = (res.status_code, json.loads(res.body)) if isinstance(res, JSONResponse) else (200, res)
+            if status != 200:
+                await ws.send_json({"ok": False, "status": status, **body})
+                if status == 422:
+                    continue                 # отвергнут только этот пакет
+                # тираж закрыт/неизвестен, пул полон, лидер недоступен — приём по соединению окончен
+                await ws.close(code=1000 if status in (404, 409) else 1011, reason=body.get("error", "")[:120])
+                return
+            received += len(data)
+            packets += 1
+            root = body.get("root_hex")
+            if loop.time() - last_ack >= interval:
+                await ack()
+    except WebSocketDisconnect:
+        return
 
 @router.post("/entropy/{draw_id}/server-jitter")
 async def entropy_server_jitter(draw_id: str, samples: int = 20000):
-    data = cpu_jitter_bytes(samples=samples)
-    add_packet(draw_id, data)
-    await hub.emit(draw_id, {
-        "type":"loc.progress","drawId":draw_id,"source":"SRV",
-        "bytesTotal": bytes_total(draw_id),"packets": packet_count(draw_id),
-        "rootHex": root_hex(draw_id),
-    })
-    return {"ok": True, "added_bytes": len(data), "root_hex": root_hex(draw_id)}
+    fwd = await cluster.forward("entropy.server_jitter", {"draw_id": draw_id, "samples": samples})
+    if fwd is not None:
+        return fwd
+    try:
+        st = registry.require(draw_id)
+    except DrawStateError as e:
+        return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+    try:
+        # samples ограничивается JITTER_MAX_SAMPLES; сама выборка — вне event loop
+        data = await cpu_jitter_bytes_async(samples=samples, wait=False)
+    except JitterBusyError as e:
+        return JSONResponse(status_code=503, content={"error": str(e)})
+    except BrokenProcessPool as e:
+        # пул пересоздастся при следующем вызове
+        return JSONResponse(status_code=503, content={"error": f"jitter worker failed: {e!r}"})
+    try:
+        async with st.lock:
+            add_packet(draw_id, data, "jitter")
+            await progress.notify(draw_id, "SRV")
+            return {"ok": True, "added_bytes": len(data), "root_hex": root_hex(draw_id)}
+    except EntropyHealthError as e:
+        # сломан серверный таймер — не вина клиента
+        return JSONResponse(status_code=503, content={"error": str(e), "health": e.report})
+    except DrawStateError as e:
+        return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+
+# проброс с воркеров-последователей: пакет должен попасть в реестр лидера
+@route("entropy.user")
+async def _entropy_user_rpc(args: dict):
+    return await entropy_user(args["draw_id"], UserEntropyIn(payload_hex=args["payload_hex"]))
+
+@route("entropy.server_jitter")
+async def _entropy_server_jitter_rpc(args: dict):
+    return await entropy_server_jitter(args["draw_id"], int(args.get("samples", 20000)))
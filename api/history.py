@@ -1,17 +1,60 @@
 # api/history.py
-from fastapi import APIRouter
-from fastapi.responses import JSONResponse
-from services.store import list_draws, load_draw
+import asyncio, json
+from typing import List, Optional
+from fastapi import APIRouter, Body, Header
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from services.store import list_draws, load_draw_body, encode_cursor
+from services.verify import verify_draws
 
 router = APIRouter()
 
+# снимок может смениться (тот же draw_id запущен заново — save_draw перезапишет):
+# кэшировать можно, но каждый раз сверяться по ETag (дёшево — 304 без тела)
+_REVALIDATE = "public, no-cache"
+
 @router.get("/history")
-async def history_list(limit: int = 50, offset: int = 0):
-    return {"items": list_draws(limit, offset)}
+async def history_list(limit: int = 50, offset: int = 0, cursor: Optional[str] = None):
+    try:
+        # индекс под threading-блокировкой хранилища (её держит и фоновая компакция) — вне event loop
+        items = await asyncio.to_thread(list_draws, limit, offset, cursor=cursor)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "bad cursor"})
+    # nextCursor — для постраничного обхода без offset (не съезжает, когда приходят новые тиражи)
+    return {"items": items, "nextCursor": encode_cursor(items[-1]) if len(items) == limit and items else None}
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match сравнивается слабо: W/"x" совпадает с "x"
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
 
 @router.get("/history/{draw_id}")
-async def history_item(draw_id: str):
-    rec = load_draw(draw_id)
-    if not rec:
+async def history_item(draw_id: str, if_none_match: Optional[str] = Header(None)):
+    hit = await asyncio.to_thread(load_draw_body, draw_id)
+    if not hit:
         return JSONResponse(status_code=404, content={"error": "not found"})
-    return rec
+    body, etag = hit
+    headers = {"ETag": etag, "Cache-Control": _REVALIDATE}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    # тело отдаём как сохранено — без json.load и повторного кодирования
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+class VerifyIn(BaseModel):
+    # либо явный список, либо интервал createdAt [since, until) в мс
+    draw_ids: Optional[List[str]] = None
+    since: Optional[int] = None
+    until: Optional[int] = None
+    limit: Optional[int] = Field(None, ge=1)
+    force: bool = False  # пересчитать и то, что уже проверено
+
+@router.post("/history/verify")
+async def history_verify(body: VerifyIn = Body(...)):
+    """Перепроверка сохранённых тиражей: NDJSON по строке на тираж по мере готовности, в конце сводка."""
+    async def gen():
+        async for row in verify_draws(body.draw_ids, body.since, body.until, body.limit, body.force):
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+    return StreamingResponse(gen(), media_type="application/x-ndjson")
@@ -0,0 +1,25 @@
+# api/metrics.py
+from fastapi import APIRouter
+from fastapi.responses import Response
+from streams import hub
+from services.registry import registry
+from services.scheduler import scheduler
+from services.metrics import Counter, Gauge, render, CONTENT_TYPE
+
+router = APIRouter()
+
+# состояние, которое и так хранится в объектах, снимаем в момент скрейпа — на горячем пути ничего
+Gauge("sse_channels", "StreamHub channels with subscribers", fn=lambda: hub.stats()["channels"])
+Gauge("sse_subscribers", "Connected SSE subscribers", fn=lambda: hub.stats()["subscribers"])
+Gauge("sse_queued_frames", "Frames waiting in subscriber queues", fn=lambda: hub.stats()["queued"])
+Gauge("sse_replay_channels", "Channels held in replay buffers", fn=lambda: hub.stats()["replayChannels"])
+Counter("sse_dropped_events_total", "Frames dropped for slow subscribers", fn=lambda: hub.stats()["dropped"])
+Gauge("draws_active", "Draw states held in the registry", fn=lambda: len(registry))
+Gauge("draws_pool_bytes", "Local entropy bytes held by open draws", fn=lambda: registry.total_bytes)
+Counter("scheduler_skipped_ticks_total", "Auto-draw ticks skipped", fn=lambda: scheduler.stats["skipped"])
+Gauge("scheduler_last_lateness_seconds", "Start delay of the last auto-draw",
+      fn=lambda: (scheduler.stats["lastLatenessMs"] or 0) / 1000.0)
+
+@router.get("/metrics")
+def metrics():
+    return Response(content=render(), media_type=CONTENT_TYPE)
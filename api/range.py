@@ -1,9 +1,12 @@
 # api/range.py
+import asyncio, json
+from typing import List, Optional
 from fastapi import APIRouter, Body
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
+from settings import settings
 from streams import hub
-from services.sample import sample_range_by_seed
+from services.sample import sample_range_by_seed, sample_range_batch, validate_range_specs
 
 router = APIRouter()
 
@@ -40,3 +43,66 @@ async def range_by_seed(body: RangeBySeedIn = Body(...)):
         })
 
     return {"value": value, **meta}
+
+
+class RangeSpecIn(BaseModel):
+    n1: int
+    n2: int
+    label: str
+
+class RangeBatchIn(BaseModel):
+    seed_hex: str = Field(..., description="32-byte HKDF seed (hex)")
+    # либо явный список (n1, n2, label) ...
+    items: Optional[List[RangeSpecIn]] = None
+    # ... либо один диапазон и count значений с метками f"{label}#{i}"
+    n1: Optional[int] = None
+    n2: Optional[int] = None
+    count: int = Field(0, ge=0)
+    label: str = "RANGE/v1"
+    stream: bool = False          # NDJSON по мере готовности вместо одного JSON
+    draw_id: str | None = None
+
+@router.post("/range/by-seed/batch")
+async def range_by_seed_batch(body: RangeBatchIn = Body(...)):
+    """Элемент — как ответ /range/by-seed для той же (n1, n2, label), плюс index."""
+    try:
+        seed = bytes.fromhex(body.seed_hex)
+    except Exception:
+        return JSONResponse(status_code=400, content={"error":"seed_hex must be hex"})
+    if len(seed) != 32:
+        return JSONResponse(status_code=400, content={"error":"seed must be 32 bytes (64 hex)"})
+
+    if body.items is not None:
+        raw = [(it.n1, it.n2, it.label) for it in body.items]
+    elif body.n1 is not None and body.n2 is not None and body.count > 0:
+        raw = [(body.n1, body.n2, f"{body.label}#{i}") for i in range(min(body.count, settings.RANGE_BATCH_MAX + 1))]
+    else:
+        return JSONResponse(status_code=400, content={"error":"pass items, or n1/n2 with count > 0"})
+    if len(raw) > settings.RANGE_BATCH_MAX:
+        return JSONResponse(status_code=400, content={"error": f"too many values (max {settings.RANGE_BATCH_MAX})"})
+
+    # проверяем всё заранее: посреди стрима 400 уже не вернуть
+    try:
+        specs = validate_range_specs(raw)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    if body.draw_id:
+        await hub.emit(body.draw_id, {
+            "type":"range.batch", "drawId": body.draw_id,
+            "count": len(specs), "label": body.label if body.items is None else None,
+        })
+
+    if body.stream:
+        def gen():
+            for item in sample_range_batch(seed, specs):
+                yield (json.dumps(item) + "\n").encode()
+        return StreamingResponse(gen(), media_type="application/x-ndjson")
+
+    # до RANGE_BATCH_MAX значений — считаем в потоке, event loop не держим
+    items = await asyncio.to_thread(lambda: list(sample_range_batch(seed, specs)))
+    return {
+        "count": len(items),
+        "attemptsTotal": sum(it["attempts"] for it in items),
+        "items": items,
+    }
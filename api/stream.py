@@ -1,51 +1,52 @@
 # api/stream.py
-from fastapi import APIRouter
+from typing import Optional
+from fastapi import APIRouter, Header
 from fastapi.responses import StreamingResponse
 from streams import hub
 from services.store import get_current_draw
 
 router = APIRouter()
 
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+def _event_id(last_event_id: Optional[str]) -> Optional[int]:
+    try:
+        return int(last_event_id) if last_event_id else None
+    except ValueError:
+        return None
+
+
 @router.get("/draws/{draw_id}/stream")
-async def stream(draw_id: str):
+async def stream(draw_id: str, last_event_id: Optional[str] = Header(None)):
+    # опоздавший подписчик получает события тиража из буфера, переподключившийся — только пропущенные
+    after = _event_id(last_event_id)
     async def gen():
-        async for chunk in hub.subscribe(draw_id):
+        async for chunk in hub.subscribe(draw_id, last_event_id=after):
             yield chunk
-    headers = {
-        "Cache-Control": "no-cache",
-        "Connection": "keep-alive",
-        "X-Accel-Buffering": "no",
-    }
-    return StreamingResponse(gen(), media_type="text/event-stream", headers=headers)
+    return StreamingResponse(gen(), media_type="text/event-stream", headers=_SSE_HEADERS)
 
 
-@router.get("/stream/current")
-async def stream_current():
+def _current_gen(last_event_id: Optional[str]):
+    # глобальный канал: историю повторяем только при переподключении (Last-Event-ID)
+    after = _event_id(last_event_id)
     async def gen():
         cur = get_current_draw()
         if cur:
             yield f"data: {{\"type\":\"current\",\"drawId\":\"{cur}\"}}\n\n"
-        async for chunk in hub.subscribe("__current__"):
+        async for chunk in hub.subscribe("__current__", last_event_id=after, replay=False):
             yield chunk
-    headers = {
-        "Cache-Control": "no-cache",
-        "Connection": "keep-alive",
-        "X-Accel-Buffering": "no",
-    }
-    return StreamingResponse(gen(), media_type="text/event-stream", headers=headers)
+    return gen()
+
+
+@router.get("/stream/current")
+async def stream_current(last_event_id: Optional[str] = Header(None)):
+    return StreamingResponse(_current_gen(last_event_id), media_type="text/event-stream", headers=_SSE_HEADERS)
 
 
 @router.get("/draws/current/stream")
-async def stream_current_compat():
-    async def gen():
-        cur = get_current_draw()
-        if cur:
-            yield f"data: {{\"type\":\"current\",\"drawId\":\"{cur}\"}}\n\n"
-        async for chunk in hub.subscribe("__current__"):
-            yield chunk
-    headers = {
-        "Cache-Control": "no-cache",
-        "Connection": "keep-alive",
-        "X-Accel-Buffering": "no",
-    }
-    return StreamingResponse(gen(), media_type="text/event-stream", headers=headers)
+async def stream_current_compat(last_event_id: Optional[str] = Header(None)):
+    return StreamingResponse(_current_gen(last_event_id), media_type="text/event-stream", headers=_SSE_HEADERS)
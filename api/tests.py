@@ -1,28 +1,127 @@
 # api/tests.py
-from fastapi import APIRouter, Body
-from fastapi.responses import JSONResponse, StreamingResponse
-from models import BitsBySeedIn
-from services.bitstream import ascii_bits_stream, binary_stream
+import json, re, weakref
+from typing import Annotated, Optional, Tuple
+from fastapi import APIRouter, Body, Header, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from models import BatteryIn, BitsBySeedIn
+from services import battery
+from services.bitstream import ascii_bits_stream, binary_stream, body_length, body_range_stream
+from services.metrics import bitstream_bytes
+from settings import settings
 
 router = APIRouter()
 
-@router.post("/tests/bitstream/by-seed")
-async def bitstream_by_seed(body: BitsBySeedIn = Body(...)):
+_RANGE_RE = re.compile(r"^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$")
+
+def _byte_range(header: Optional[str], length: int) -> Optional[Tuple[int, int]]:
+    """
+    (first, last) из заголовка Range. None — отдать тело целиком
+    (заголовка нет, он непонятен или это multi-range). ValueError — диапазон вне тела (416).
+    """
+    m = _RANGE_RE.match(header or "")
+    if not m or not (m.group(1) or m.group(2)):
+        return None
+    if not m.group(1):
+        # суффикс: последние N байт
+        n = int(m.group(2))
+        if n == 0:
+            raise ValueError("empty suffix range")
+        return max(0, length - n), length - 1
+    first = int(m.group(1))
+    last = int(m.group(2)) if m.group(2) else length - 1
+    if first >= length or last < first:
+        raise ValueError("range not satisfiable")
+    return first, min(last, length - 1)
+
+def _counted(gen, fmt: str):
+    # счётчик отданных байт: одно сложение на чанк
+    served = bitstream_bytes.labels(fmt)
+    for chunk in gen:
+        served.value += len(chunk)
+        yield chunk
+
+def _parse_seed(seed_hex: str):
+    """seed или JSONResponse 400."""
     try:
-        seed = bytes.fromhex(body.seed_hex)
+        seed = bytes.fromhex(seed_hex)
     except Exception:
         return JSONResponse(status_code=400, content={"error": "seed_hex must be hex"})
     if len(seed) != 32:
         return JSONResponse(status_code=400, content={"error": "seed must be 32 bytes (64 hex chars)"})
+    return seed
+
+def _bitstream_response(body: BitsBySeedIn, range_header: Optional[str]):
+    seed = _parse_seed(body.seed_hex)
+    if isinstance(seed, JSONResponse):
+        return seed
 
     filename = f"bits_{body.bits}_{body.fmt}.{'txt' if body.fmt=='txt' else 'bin'}"
+    media = "text/plain; charset=utf-8" if body.fmt == "txt" else "application/octet-stream"
+    length = body_length(body.bits, body.fmt, body.sep)
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Accept-Ranges": "bytes",
+    }
+
+    try:
+        rng = _byte_range(range_header, length)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{length}"})
+
+    if rng is not None:
+        # частичный ответ: поток стартует сразу с нужного блока, предыдущее не генерируется
+        first, last = rng
+        gen = body_range_stream(seed, body.bits, body.fmt, body.sep, body.gen, body.offset, first, last)
+        headers["Content-Range"] = f"bytes {first}-{last}/{length}"
+        headers["Content-Length"] = str(last - first + 1)
+        return StreamingResponse(_counted(gen, body.fmt), status_code=206, media_type=media, headers=headers)
 
     if body.fmt == "txt":
-        gen = ascii_bits_stream(seed, body.bits, body.sep)
-        media = "text/plain; charset=utf-8"
+        gen = ascii_bits_stream(seed, body.bits, body.sep, gen=body.gen, offset_bits=body.offset)
     else:
-        gen = binary_stream(seed, body.bits)
-        media = "application/octet-stream"
+        gen = binary_stream(seed, body.bits, gen=body.gen, offset_bits=body.offset)
+
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(_counted(gen, body.fmt), media_type=media, headers=headers)
+
+@router.post("/tests/bitstream/by-seed")
+async def bitstream_by_seed(body: BitsBySeedIn = Body(...), range_: Optional[str] = Header(None, alias="Range")):
+    return _bitstream_response(body, range_)
+
+@router.get("/tests/bitstream/by-seed")
+async def bitstream_by_seed_get(body: Annotated[BitsBySeedIn, Query()],
+                                range_: Optional[str] = Header(None, alias="Range")):
+    # GET-вариант: обычные загрузчики умеют докачку/параллельные Range только для GET
+    return _bitstream_response(body, range_)
+
+@router.post("/tests/battery/by-seed")
+async def battery_by_seed(body: BatteryIn = Body(...)):
+    """
+    Батарея SP 800-22 (frequency, block frequency, runs, longest run, cusum, spectral, ApEn)
+    по потоку seed — без выгрузки бит клиенту. NDJSON: progress по префиксу, затем done.
+    """
+    seed = _parse_seed(body.seed_hex)
+    if isinstance(seed, JSONResponse):
+        return seed
+    if body.bits > settings.BATTERY_MAX_BITS:
+        return JSONResponse(status_code=400, content={"error": f"too many bits (max {settings.BATTERY_MAX_BITS})"})
+    unknown = [t for t in body.tests or () if t not in battery.TESTS]
+    if unknown:
+        return JSONResponse(status_code=400, content={"error": f"unknown test(s): {', '.join(unknown)}",
+                                                      "tests": list(battery.TESTS)})
+    release = battery.slot()
+    if release is None:
+        return JSONResponse(status_code=503, content={"error": "battery busy, retry later"})
+    report = settings.BATTERY_REPORT_BITS if body.report_bits is None else body.report_bits
 
-    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
-    return StreamingResponse(gen, media_type=media, headers=headers)
+    def gen():
+        # синхронный генератор: Starlette крутит его в пуле потоков, event loop не блокируется
+        try:
+            for row in battery.run_battery(seed, body.bits, body.gen, body.offset, body.tests, body.alpha, report):
+                yield json.dumps(row, ensure_ascii=False) + "\n"
+        finally:
+            release()
+    rows = gen()
+    # клиент мог отвалиться до первого чанка — тогда finally не выполнится, слот вернёт финализатор
+    weakref.finalize(rows, release)
+    return StreamingResponse(rows, media_type="application/x-ndjson")
@@ -0,0 +1,111 @@
+# bench/__main__.py
+"""
+Офлайн-бенчмарки горячих путей RNG.
+
+    python -m bench [--quick] [--only bitstream,range] [--out results.json] [--compare baseline.json]
+
+store пишет с настроенным STORE_FSYNC_EVERY; --store-nofsync добавляет замер
+store.save_draw.nofsync (сегменты без fsync) — отдельным именем, не вместо основного.
+
+Результат — JSON (meta + results) в stdout или --out. С --compare сравниваем с прошлым
+прогоном по (name, params): сводка в stderr, код выхода 1 при регрессии больше --threshold.
+"""
+import argparse, json, os, platform, subprocess, sys, tempfile, time
+
+def _meta(quick: bool) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except OSError:
+        commit = ""
+    import numpy
+    from settings import settings
+    return {
+        "commit": commit or None,
+        "createdAt": int(time.time() * 1000),
+        "quick": quick,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "storeBackend": os.environ.get("STORE_BACKEND"),
+        "storeFsyncEvery": settings.STORE_FSYNC_EVERY,
+    }
+
+def _key(r: dict) -> str:
+    return r["name"] + " " + json.dumps(r["params"], sort_keys=True)
+
+def compare(current: list, baseline: list, threshold: float) -> int:
+    """Печатает изменения по совпавшим замерам; вернёт число регрессий."""
+    base = {_key(r): r for r in baseline}
+    regressions = 0
+    for r in current:
+        b = base.get(_key(r))
+        if b is None or not b["value"]:
+            continue
+        ratio = r["value"] / b["value"]
+        # >1 — лучше, <1 — хуже, независимо от направления метрики
+        gain = ratio if r["better"] == "higher" else 1.0 / ratio if ratio else float("inf")
+        flag = ""
+        if gain < 1.0 - threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{_key(r):<70} {b['value']:>12g} -> {r['value']:>12g} {r['unit']:<9} x{gain:.2f}{flag}", file=sys.stderr)
+    return regressions
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Offline RNG hot-path benchmarks (JSON output)")
+    ap.add_argument("--quick", action="store_true", help="smaller inputs, for a fast sanity run")
+    ap.add_argument("--only", help="comma-separated cases: bitstream,range,local_pool,hub,store,mix,battery")
+    ap.add_argument("--out", help="write JSON here instead of stdout")
+    ap.add_argument("--compare", help="baseline JSON from a previous run")
+    ap.add_argument("--threshold", type=float, default=0.15, help="regression tolerance (default 0.15)")
+    ap.add_argument("--store-backend", default="segments", choices=["files", "segments"])
+    ap.add_argument("--store-nofsync", action="store_true",
+                    help="also time save_draw without fsync (segments), reported as store.save_draw.nofsync")
+    args = ap.parse_args()
+
+    # хранилище — во временном каталоге; настройки читаются при импорте модулей, поэтому до них
+    tmp = tempfile.TemporaryDirectory(prefix="bench-store-")
+    os.environ["STORE_DIR"] = tmp.name
+    os.environ["STORE_BACKEND"] = args.store_backend
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from bench import cases
+    from bench.cases import CASES
+    cases.STORE_NOFSYNC = args.store_nofsync
+
+    names = args.only.split(",") if args.only else list(CASES)
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        ap.error(f"unknown case(s): {', '.join(unknown)}")
+
+    results = []
+    for name in names:
+        t0 = time.perf_counter()
+        for r in CASES[name](args.quick):
+            results.append(r)
+            print(f"{_key(r):<70} {r['value']:>12g} {r['unit']}", file=sys.stderr)
+        print(f"-- {name}: {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+    doc = {"meta": _meta(args.quick), "results": results}
+    text = json.dumps(doc, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    try:
+        from services.store import close_store
+        close_store()
+    finally:
+        tmp.cleanup()
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        return 1 if compare(results, baseline, args.threshold) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+# bench/cases.py
+"""
+Замеры горячих путей. Каждый кейс — генератор результатов:
+{"name", "params", "value", "unit", "better": "higher"|"lower", ...доп. поля}.
+Сеть не нужна; хранилище — во временном каталоге (см. bench/__main__.py).
+"""
+import asyncio, json, os, statistics, time
+from typing import Callable, Dict, Iterator, List
+
+SEED = bytes(range(32))
+
+# store: дополнительно замерить save_draw без fsync (--store-nofsync); по умолчанию — как настроено
+STORE_NOFSYNC = False
+
+def _best(fn: Callable[[], object], repeat: int) -> float:
+    """Лучшее время из repeat прогонов, секунды (минимум устойчивее к шуму планировщика)."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def _latencies(fn: Callable[[], object], n: int) -> Dict[str, float]:
+    """Распределение латентности одного вызова, микросекунды."""
+    xs = []
+    for _ in range(n):
+        t0 = time.perf_counter_ns()
+        fn()
+        xs.append((time.perf_counter_ns() - t0) / 1000.0)
+    xs.sort()
+    return {"p50": xs[len(xs) // 2], "p99": xs[min(len(xs) - 1, int(len(xs) * 0.99))],
+            "mean": statistics.fmean(xs)}
+
+def _result(name: str, params: dict, value: float, unit: str, better: str, **extra) -> dict:
+    return {"name": name, "params": params, "value": round(value, 4), "unit": unit, "better": better, **extra}
+
+def _drain(it) -> int:
+    n = 0
+    for chunk in it:
+        n += len(chunk)
+    return n
+
+# ——— services.bitstream
+
+def bench_bitstream(quick: bool) -> Iterator[dict]:
+    from services.bitstream import GENERATORS, ascii_bits_stream, binary_stream
+    bits = (8 if quick else 64) * 8 * (1 << 20)     # 8 / 64 MiB на выходе bin
+    repeat = 2 if quick else 3
+    for gen in GENERATORS:
+        sec = _best(lambda: _drain(binary_stream(SEED, bits, gen=gen)), repeat)
+        yield _result("bitstream.binary", {"gen": gen, "bits": bits}, bits / 8 / sec / 1e6, "MB/s", "higher")
+    abits = bits // 8
+    for sep in ("none", "newline"):
+        out = abits * (2 if sep == "newline" else 1)
+        sec = _best(lambda: _drain(ascii_bits_stream(SEED, abits, sep)), repeat)
+        yield _result("bitstream.ascii", {"sep": sep, "bits": abits}, out / sec / 1e6, "MB/s", "higher")
+    # смещение не кратно 8: путь со сдвигом битов
+    sec = _best(lambda: _drain(binary_stream(SEED, bits, offset_bits=3)), repeat)
+    yield _result("bitstream.binary", {"gen": "ctr/v1", "bits": bits, "offset": 3}, bits / 8 / sec / 1e6, "MB/s", "higher")
+
+# ——— services.sample
+
+# диапазоны: маленький, 2^32, худший случай отбраковки (R = 2^63+1, принимается ~половина), весь u64
+RANGES = {
+    "1..6": (1, 6),
+    "2^32": (0, (1 << 32) - 1),
+    "2^63+1": (0, 1 << 63),
+    "2^64": (0, (1 << 64) - 1),
+}
+
+def bench_range(quick: bool) -> Iterator[dict]:
+    from services.sample import sample_range_by_seed, sample_range_batch, validate_range_specs
+    n = 2000 if quick else 20000
+    for label, (lo, hi) in RANGES.items():
+        i = 0
+        attempts = []
+        def one():
+            nonlocal i
+            i += 1
+            _v, meta = sample_range_by_seed(SEED, lo, hi, label=f"B#{i}")
+            attempts.append(meta["attempts"])
+        lat = _latencies(one, n)
+        yield _result("range.single", {"range": label}, lat["p50"], "us", "lower",
+                      p99=round(lat["p99"], 2), meanAttempts=round(statistics.fmean(attempts), 3))
+        count = 20000 if quick else 200000
+        specs = validate_range_specs((lo, hi, f"B#{k}") for k in range(count))
+        sec = _best(lambda: sum(1 for _ in sample_range_batch(SEED, specs)), 2)
+        yield _result("range.batch", {"range": label, "count": count}, count / sec, "values/s", "higher")
+
+# ——— rng.local_pool / registry
+
+def bench_local_pool(quick: bool) -> Iterator[dict]:
+    from rng import local_pool
+    from services.registry import registry
+    packet = os.urandom(1024)
+    marks = (10, 100, 1000, 10000) if quick else (10, 100, 1000, 10000, 50000)
+    draw_id = "bench-pool"
+    # лимиты реестра рассчитаны на живые тиражи; на время замера снимаем
+    limits = registry.max_draw_bytes, registry.max_total_bytes
+    registry.max_draw_bytes = registry.max_total_bytes = 1 << 40
+    local_pool.clear_draw(draw_id)
+    added = 0
+    try:
+        for mark in marks:
+            while added < mark:
+                local_pool.add_packet(draw_id, packet)
+                added += 1
+            # пакет + корень: бегущий хеш, время не должно расти с числом пакетов
+            lat = _latencies(lambda: (local_pool.add_packet(draw_id, packet), local_pool.root_hex(draw_id)), 200)
+            added += 200
+            yield _result("local_pool.add_root", {"packets": mark, "packetBytes": len(packet)},
+                          lat["p50"], "us", "lower", p99=round(lat["p99"], 2))
+    finally:
+        registry.discard(draw_id)
+        registry.max_draw_bytes, registry.max_total_bytes = limits
+
+# ——— StreamHub
+
+def bench_hub(quick: bool) -> Iterator[dict]:
+    from streams import StreamHub
+
+    async def run(nsubs: int, events: int) -> Dict[str, float]:
+        hub = StreamHub(queue_max=max(256, events + 8), heartbeat_s=3600, replay_max=128)
+        subs = []
+        for _ in range(nsubs):
+            agen = hub.subscribe("bench", replay=False)
+            await agen.__anext__()          # connected: подписчик зарегистрирован
+            subs.append(agen)
+        ev = {"type": "loc.progress", "drawId": "bench", "bytesTotal": 123456, "packets": 42, "rootHex": "ab" * 32}
+        t0 = time.perf_counter()
+        for _ in range(events):
+            await hub.emit("bench", ev)
+        emit_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for agen in subs:
+            for _ in range(events):
+                await agen.__anext__()
+        drain_s = time.perf_counter() - t0
+        for agen in subs:
+            await agen.aclose()
+        if hub._hb_task is not None:
+            hub._hb_task.cancel()
+        return {"emit": emit_s, "drain": drain_s}
+
+    for nsubs in (1, 100, 10000):
+        events = 1000 if nsubs < 10000 else (10 if quick else 50)
+        # лучший из трёх прогонов: одиночный заметно шумит на GC/планировщике
+        r = min((asyncio.run(run(nsubs, events)) for _ in range(3)), key=lambda x: x["emit"])
+        yield _result("hub.fanout", {"subscribers": nsubs, "events": events},
+                      r["emit"] / events * 1e6, "us/emit", "lower",
+                      deliveriesPerSec=round(nsubs * events / max(1e-9, r["emit"] + r["drain"]), 1))
+
+# ——— services.store
+
+def _record(i: int, base_ms: int, prefix: str = "bench") -> dict:
+    return {
+        "drawId": f"{prefix}-{i:06d}", "createdAt": base_ms + i,
+        "sources": {"SOL": {"blocks": [{"slot": 1000 + i, "blockhash": "1" * 44}], "beaconHex": "ab" * 32}},
+        "inputs": ["PUB", "LOC"], "entropy": {"locRoot": "cd" * 32},
+        "result": {"seedHex": "ef" * 32, "u64": str(i * 7919)},
+    }
+
+def bench_store(quick: bool) -> Iterator[dict]:
+    from services import store
+    n = 2000 if quick else 10000
+    base = int(time.time() * 1000) - n
+    t0 = time.perf_counter()
+    for i in range(n):
+        store.save_draw(_record(i, base))
+    save_s = time.perf_counter() - t0
+    yield _result("store.save_draw", {"records": n, "backend": store.settings.STORE_BACKEND,
+                                      "fsyncEvery": store.settings.STORE_FSYNC_EVERY},
+                  save_s / n * 1e6, "us", "lower")
+
+    lat = _latencies(lambda: store.list_draws(50, 0), 300)
+    yield _result("store.list_draws", {"records": n, "page": "first"}, lat["p50"], "us", "lower", p99=round(lat["p99"], 2))
+    lat = _latencies(lambda: store.list_draws(50, n - 100), 300)
+    yield _result("store.list_draws", {"records": n, "page": "deep-offset"}, lat["p50"], "us", "lower", p99=round(lat["p99"], 2))
+    cursor = store.encode_cursor(store.list_draws(1, n - 101)[0])
+    lat = _latencies(lambda: store.list_draws(50, 0, cursor=cursor), 300)
+    yield _result("store.list_draws", {"records": n, "page": "deep-cursor"}, lat["p50"], "us", "lower", p99=round(lat["p99"], 2))
+
+    ids = [f"bench-{i:06d}" for i in range(0, n, max(1, n // 500))]
+    store._clear_bodies()
+    k = iter(range(len(ids) * 10))
+    lat = _latencies(lambda: store.load_draw_body(ids[next(k) % len(ids)]), len(ids))
+    yield _result("store.load_draw_body", {"records": n, "cache": "cold"}, lat["p50"], "us", "lower")
+    lat = _latencies(lambda: store.load_draw_body(ids[next(k) % len(ids)]), len(ids))
+    yield _result("store.load_draw_body", {"records": n, "cache": "hot"}, lat["p50"], "us", "lower")
+
+    if STORE_NOFSYNC and store.settings.STORE_BACKEND == "segments":
+        # потолок без fsync — отдельным замером, чтобы не путать с настроенным режимом
+        log = store._log()
+        fsync_every, log.fsync_every = log.fsync_every, 0
+        try:
+            t0 = time.perf_counter()
+            for i in range(n):
+                store.save_draw(_record(i, base, prefix="nofsync"))
+            save_s = time.perf_counter() - t0
+        finally:
+            log.fsync_every = fsync_every
+        yield _result("store.save_draw.nofsync", {"records": n, "backend": "segments"},
+                      save_s / n * 1e6, "us", "lower")
+
+# ——— rng.mix
+
+def bench_mix(quick: bool) -> Iterator[dict]:
+    from rng.mix import domain_hash, hkdf_seed, prng_chacha20, u64_be
+    n = 2000 if quick else 20000
+    pub = domain_hash(b"SOL", os.urandom(96))
+    loc = domain_hash(b"LOC", os.urandom(32))
+    i = 0
+    def one():
+        nonlocal i
+        i += 1
+        seed = hkdf_seed(f"bench-{i}", {"PUB": pub, "LOC": loc})
+        return u64_be(prng_chacha20(seed, 64))
+    lat = _latencies(one, n)
+    yield _result("mix.seed_to_u64", {"sources": 2}, lat["p50"], "us", "lower", p99=round(lat["p99"], 2))
+
+    from services.verify import verify_record
+    rec = json.loads(json.dumps(_verifiable_record()))
+    lat = _latencies(lambda: verify_record(rec), n)
+    yield _result("verify.record", {}, lat["p50"], "us", "lower", p99=round(lat["p99"], 2))
+
+def _verifiable_record() -> dict:
+    import base58
+    from rng.mix import domain_hash, hkdf_seed, prng_chacha20, u64_be
+    raws = [os.urandom(32) for _ in range(3)]
+    beacon = b"".join(raws)
+    loc = os.urandom(32)
+    seed = hkdf_seed("bench", {"PUB": domain_hash(b"SOL", beacon), "LOC": domain_hash(b"LOC", loc)})
+    return {
+        "drawId": "bench",
+        "sources": {"SOL": {"blocks": [{"slot": i, "blockhash": base58.b58encode(r).decode()} for i, r in enumerate(raws)],
+                            "beaconHex": beacon.hex()}},
+        "inputs": ["PUB", "LOC"], "entropy": {"locRoot": loc.hex()},
+        "result": {"seedHex": seed.hex(), "u64": str(u64_be(prng_chacha20(seed, 64)))},
+    }
+
+# ——— services.battery
+
+def bench_battery(quick: bool) -> Iterator[dict]:
+    from services.battery import TESTS, run_battery, spectral_reference
+    # быстрый, но неверный spectral мерить незачем
+    spectral_reference()
+    bits = (1 if quick else 8) << 23
+    for name in TESTS:
+        sec = _best(lambda: _drain_rows(run_battery(SEED, bits, names=[name])), 2)
+        yield _result("battery.test", {"test": name, "bits": bits}, bits / sec / 1e6, "Mbit/s", "higher")
+    sec = _best(lambda: _drain_rows(run_battery(SEED, bits)), 1)
+    yield _result("battery.all", {"bits": bits}, bits / sec / 1e6, "Mbit/s", "higher")
+
+def _drain_rows(rows) -> int:
+    return sum(1 for _ in rows)
+
+CASES: Dict[str, Callable[[bool], Iterator[dict]]] = {
+    "bitstream": bench_bitstream,
+    "range": bench_range,
+    "local_pool": bench_local_pool,
+    "hub": bench_hub,
+    "store": bench_store,
+    "mix": bench_mix,
+    "battery": bench_battery,
+}
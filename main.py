@@ -1,7 +1,5 @@
 # main.py
 from fastapi import FastAPI
-from asyncio import create_task, sleep
-from time import time
 from settings import settings
 
 from api.stream import router as stream_router
@@ -10,10 +8,16 @@ from api.entropy import router as entropy_router
 from api.tests import router as tests_router
 from api.range import router as range_router
 from api.history import router as history_router
+from api.metrics import router as metrics_router
 from api.draws import draw_solana
-from services.store import set_current_draw
+from services.store import close_store
 from models import SolDrawIn
-from streams import hub
+from sources.solana import close_client
+from sources.solana_tracker import tracker
+from sources.loc_entropy import shutdown_jitter_pool
+from services.cluster import cluster
+from services.scheduler import scheduler
+from services.verify import shutdown_verify_pool
 
 app = FastAPI(title="ChainMix RNG (Solana-only v1)")
 
@@ -26,34 +30,50 @@ def health():
 app.include_router(stream_router)   # /draws/{draw_id}/stream
 app.include_router(draws_router)    # /draws/solana
 app.include_router(entropy_router)  # /entropy/...
-app.include_router(tests_router)    # /tests/bitstream/by-seed
+app.include_router(tests_router)    # /tests/bitstream/by-seed, /tests/battery/by-seed
 app.include_router(range_router)
 app.include_router(history_router)
+app.include_router(metrics_router)   # /metrics (Prometheus)
+
+
+def _start_block_tracker():
+    # фоновый опрос финализированной вершины — тиражи читают блоки из памяти
+    if settings.SOL_TRACKER:
+        tracker.start()
+
+
+async def _auto_draw(draw_id: str):
+    body = SolDrawIn(
+        draw_id=draw_id,
+        blocks=settings.SOL_BLOCKS,
+        collect_ms=settings.AUTO_COLLECT_MS,
+        require_loc=False,
+        min_loc_bytes=0,
+    )
+    # Используем тот же путь, что и HTTP-эндпоинт, чтобы отправить SSE и сохранить историю
+    return await draw_solana(body)
+
+
+def _start_auto_generator():
+    # тиражи по сетке AUTO_INTERVAL_S (без дрейфа), анонс следующего — в __current__
+    if settings.AUTO_DRAW:
+        scheduler.start(_auto_draw)
 
 
 @app.on_event("startup")
-async def _start_auto_generator():
-    async def _loop():
-        while True:
-            try:
-                draw_id = f"auto-{int(time()*1000)}"
-                body = SolDrawIn(
-                    draw_id=draw_id,
-                    blocks=settings.SOL_BLOCKS,
-                    collect_ms=1200,
-                    require_loc=False,
-                    min_loc_bytes=0,
-                )
-                # Сначала объявим текущий ID, чтобы клиенты успели подписаться на SSE до первых событий
-                set_current_draw(draw_id)
-                # оповестим глобальный канал о новом текущем ID
-                await hub.emit("__current__", {"type": "current", "drawId": draw_id})
-                # Используем тот же путь, что и HTTP-эндпоинт, чтобы отправить SSE и сохранить историю
-                await draw_solana(body)
-                print(f'[{draw_id}] generate finished.')
-            except Exception as e:
-                # Логируем и продолжаем цикл, чтобы не останавливать генератор
-                print("auto-draw error:", e)
-            await sleep(10)
-
-    create_task(_loop())
\ No newline at end of file
+async def _join_cluster():
+    # трекер и авто-генератор работают только у лидера (с --workers N — ровно в одном воркере)
+    cluster.on_leader(_start_block_tracker)
+    cluster.on_leader(_start_auto_generator)
+    await cluster.start(settings.CLUSTER)
+
+
+@app.on_event("shutdown")
+async def _close_rpc_client():
+    await scheduler.stop()
+    await cluster.stop()
+    await tracker.stop()
+    await close_client()
+    shutdown_jitter_pool()
+    shutdown_verify_pool()
+    close_store()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Literal
+from typing import List, Literal, Optional
 
 class SolDrawIn(BaseModel):
     draw_id: str
@@ -32,3 +32,18 @@ class BitsBySeedIn(BaseModel):
     bits: int = Field(1_000_000, ge=1, description="Сколько бит сгенерировать")
     fmt: Literal["txt","bin"] = "txt"            # txt = ASCII '0'/'1', bin = сырые байты
     sep: Literal["none","newline"] = "none"      # для txt: без разделителей или по строкам
+    # генератор потока: ctr/v1 = BLAKE3(key=seed, counter) по 32B (исходный, воспроизводимый),
+    # xof/v1 = один keyed BLAKE3 XOF, chacha20/v1 = keystream ChaCha20 (как rng.mix.prng_chacha20)
+    gen: Literal["ctr/v1","xof/v1","chacha20/v1"] = "ctr/v1"
+    # смещение начала потока в битах (для байтового смещения — умножить на 8)
+    offset: int = Field(0, ge=0, description="С какого бита потока начинать")
+
+class BatteryIn(BaseModel):
+    seed_hex: str = Field(..., description="HKDF seed в hex (32 байта)")
+    bits: int = Field(1_000_000, ge=1000, description="Сколько бит потока проверить")
+    gen: Literal["ctr/v1","xof/v1","chacha20/v1"] = "ctr/v1"
+    offset: int = Field(0, ge=0, description="С какого бита потока начинать")
+    # подмножество тестов (по умолчанию все), уровень значимости, шаг промежуточных результатов
+    tests: Optional[List[str]] = None
+    alpha: float = Field(0.01, gt=0, lt=1)
+    report_bits: Optional[int] = Field(None, ge=0, description="0 — только итог")
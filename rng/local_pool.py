@@ -1,25 +1,28 @@
-from collections import defaultdict
-from blake3 import blake3
+# Локальный пул энтропии тиража: тонкий фасад над services.registry
+# (бегущий BLAKE3-корень и счётчики живут в DrawState).
+from typing import Optional
+from services.registry import registry
 
-PACKETS: dict[str, list[bytes]] = defaultdict(list)
-
-def add_packet(draw_id: str, data: bytes):
-    PACKETS[draw_id].append(data)
+def add_packet(draw_id: str, data: bytes, source: Optional[str] = None):
+    # source ("jitter" | "urandom" | "user") включает health-тесты этого источника
+    registry.add(draw_id, data, source)
 
 def clear_draw(draw_id: str):
-    PACKETS.pop(draw_id, None)
+    # явный сброс: прежнее состояние выбрасываем, даже если тираж ещё активен
+    registry.discard(draw_id)
+    registry.open(draw_id)
 
 def bytes_total(draw_id: str) -> int:
-    return sum(len(p) for p in PACKETS.get(draw_id, []))
+    return registry.bytes_total(draw_id)
 
 def packet_count(draw_id: str) -> int:
-    return len(PACKETS.get(draw_id, []))
+    return registry.packet_count(draw_id)
 
 def root_hex(draw_id: str) -> str:
-    h = blake3()
-    for p in PACKETS.get(draw_id, []):
-        h.update(p)
-    return h.hexdigest()
+    return registry.root(draw_id).hex()
 
 def root_bytes(draw_id: str) -> bytes:
-    return bytes.fromhex(root_hex(draw_id)) if bytes_total(draw_id) > 0 else b""
+    return registry.root(draw_id) if registry.bytes_total(draw_id) > 0 else b""
+
+def health(draw_id: str, source: Optional[str] = None) -> Optional[dict]:
+    return registry.health(draw_id, source)
@@ -0,0 +1,398 @@
+# services/battery.py
+"""
+Статистическая батарея в духе NIST SP 800-22 поверх потока из seed — прямо на сервере.
+
+Каждый тест — аккумулятор с update(bits) по чанку (uint8 0/1, numpy) и result() по
+префиксу, обработанному к этому моменту. Один проход, память постоянная: между чанками
+тесты держат только счётчики и «хвост» незаконченного блока.
+
+Отличия от эталонной реализации:
+  • spectral — поблочно (DFT по блокам SPECTRAL_BLOCK бит), N0/N1 и дисперсия суммируются
+    по блокам; полная DFT по n бит требует O(n) памяти;
+  • параметры (M для longest run, m для approximate entropy, размер блока DFT)
+    выбираются по полному числу бит заранее — промежуточные результаты считаются с ними же.
+
+Сверка с примерами SP 800-22: frequency, block frequency, runs, longest run, cumulative sums
+и approximate entropy дают опубликованные p (с точностью до их округления). spectral — нет:
+на 100-битном примере у нас p = 0.646355 (N1 = 48) против 0.168669 (N1 = 46), на 10-битном
+N1 = 5 против 4. Прямая DFT даёт те же N1, что и мы, а сам пример расходится с собой
+(см. SPECTRAL_REFERENCE), поэтому spectral проверяется по вектору, посчитанному прямой DFT.
+"""
+import math, threading, time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from services.bitstream import binary_stream
+from services.metrics import battery_bits
+from settings import settings
+
+ALPHA = 0.01
+BLOCK_FREQUENCY_M = 128
+SPECTRAL_BLOCK = 1 << 16
+APEN_M = 10
+
+# одновременно идущих прогонов: каждый занимает поток пула и ядро
+_active = threading.BoundedSemaphore(max(1, settings.BATTERY_MAX_ACTIVE))
+
+# ——— специальные функции (scipy не тянем)
+
+_EPS = 1e-15
+_FPMIN = 1e-300
+
+def igamc(a: float, x: float) -> float:
+    """Регуляризованная верхняя неполная гамма Q(a, x) (ряд / цепная дробь, как в Numerical Recipes)."""
+    if x <= 0 or a <= 0:
+        return 1.0
+    lg = -x + a * math.log(x) - math.lgamma(a)
+    if x < a + 1.0:
+        ap, term = a, 1.0 / a
+        total = term
+        for _ in range(100000):
+            ap += 1.0
+            term *= x / ap
+            total += term
+            if abs(term) < abs(total) * _EPS:
+                break
+        return max(0.0, 1.0 - total * math.exp(lg))
+    b = x + 1.0 - a
+    c = 1.0 / _FPMIN
+    d = 1.0 / b
+    h = d
+    for i in range(1, 100000):
+        an = -i * (i - a)
+        b += 2.0
+        d = an * d + b
+        d = _FPMIN if abs(d) < _FPMIN else d
+        c = b + an / c
+        c = _FPMIN if abs(c) < _FPMIN else c
+        d = 1.0 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.0) < _EPS:
+            break
+    return min(1.0, math.exp(lg) * h)
+
+def _phi(x: float) -> float:
+    return 0.5 * math.erfc(-x / math.sqrt(2.0))
+
+# ——— тесты
+
+class _Test:
+    name = ""
+    min_bits = 100
+
+    def update(self, b: np.ndarray):
+        raise NotImplementedError
+
+    def result(self, n: int) -> dict:
+        raise NotImplementedError
+
+
+class _Frequency(_Test):
+    name = "frequency"
+
+    def __init__(self, _bits: int):
+        self.ones = 0
+
+    def update(self, b):
+        self.ones += int(np.count_nonzero(b))
+
+    def result(self, n):
+        s = 2 * self.ones - n
+        return {"pValue": math.erfc(abs(s) / math.sqrt(2.0 * n)), "sum": s}
+
+
+class _Blocked(_Test):
+    """Общая часть тестов по неперекрывающимся блокам M бит: хвост неполного блока переносим."""
+    M = 0
+
+    def __init__(self):
+        self.carry = np.empty(0, dtype=np.uint8)
+
+    def _blocks(self, b: np.ndarray) -> Optional[np.ndarray]:
+        if len(self.carry):
+            b = np.concatenate((self.carry, b))
+        k = len(b) // self.M
+        self.carry = b[k * self.M:].copy()
+        return b[:k * self.M].reshape(k, self.M) if k else None
+
+
+class _BlockFrequency(_Blocked):
+    name = "block_frequency"
+
+    def __init__(self, _bits: int):
+        super().__init__()
+        self.M = BLOCK_FREQUENCY_M
+        self.blocks = 0
+        self.acc = 0.0                      # Σ (π_i − 1/2)²
+
+    def update(self, b):
+        rows = self._blocks(b)
+        if rows is not None:
+            pi = rows.sum(axis=1, dtype=np.int64) / self.M
+            self.acc += float(np.square(pi - 0.5).sum())
+            self.blocks += len(rows)
+
+    def result(self, n):
+        if not self.blocks:
+            return {"pValue": None, "blocks": 0}
+        chi2 = 4.0 * self.M * self.acc
+        return {"pValue": igamc(self.blocks / 2.0, chi2 / 2.0), "chi2": chi2, "blocks": self.blocks, "M": self.M}
+
+
+class _Runs(_Test):
+    name = "runs"
+
+    def __init__(self, _bits: int):
+        self.ones = 0
+        self.changes = 0
+        self.last: Optional[int] = None
+
+    def update(self, b):
+        self.ones += int(np.count_nonzero(b))
+        if self.last is not None:
+            self.changes += int(b[0] != self.last)
+        self.changes += int(np.count_nonzero(b[1:] != b[:-1]))
+        self.last = int(b[-1])
+
+    def result(self, n):
+        pi = self.ones / n
+        v = self.changes + 1
+        if abs(pi - 0.5) >= 2.0 / math.sqrt(n):
+            # предусловие (frequency) не выполнено — тест не применим, по NIST p = 0
+            return {"pValue": 0.0, "runs": v, "prerequisite": False}
+        p = math.erfc(abs(v - 2.0 * n * pi * (1 - pi)) / (2.0 * math.sqrt(2.0 * n) * pi * (1 - pi)))
+        return {"pValue": p, "runs": v}
+
+
+# (M, минимальная длина серии, максимальная, вероятности классов) — SP 800-22, 2.4.2
+_LONGEST_RUN_TABLES = (
+    (750_000, 10000, 10, 16, (0.0882, 0.2092, 0.2483, 0.1933, 0.1208, 0.0675, 0.0727)),
+    (6272, 128, 4, 9, (0.1174, 0.2430, 0.2493, 0.1752, 0.1027, 0.1124)),
+    (128, 8, 1, 4, (0.2148, 0.3672, 0.2305, 0.1875)),
+)
+
+def _longest_ones(rows: np.ndarray) -> np.ndarray:
+    """Длина самой длинной серии единиц в каждой строке: cumsum минус его значение у последнего нуля."""
+    c = np.cumsum(rows, axis=1, dtype=np.int16)      # M <= 10000
+    z = np.where(rows == 0, c, 0)
+    np.maximum.accumulate(z, axis=1, out=z)
+    c -= z
+    return c.max(axis=1)
+
+
+class _LongestRun(_Blocked):
+    name = "longest_run"
+    min_bits = 128
+
+    def __init__(self, bits: int):
+        super().__init__()
+        _, self.M, self.lo, self.hi, self.pi = next(t for t in _LONGEST_RUN_TABLES if bits >= t[0])
+        self.counts = np.zeros(len(self.pi), dtype=np.int64)
+
+    def update(self, b):
+        rows = self._blocks(b)
+        if rows is not None:
+            v = np.clip(_longest_ones(rows), self.lo, self.hi) - self.lo
+            self.counts += np.bincount(v, minlength=len(self.pi))
+
+    def result(self, n):
+        blocks = int(self.counts.sum())
+        if not blocks:
+            return {"pValue": None, "blocks": 0}
+        expected = blocks * np.asarray(self.pi)
+        chi2 = float((np.square(self.counts - expected) / expected).sum())
+        return {"pValue": igamc((len(self.pi) - 1) / 2.0, chi2 / 2.0), "chi2": chi2,
+                "blocks": blocks, "M": self.M, "counts": self.counts.tolist()}
+
+
+def _cusum_p(n: int, z: int) -> float:
+    if z == 0:
+        return 1.0
+    sn = math.sqrt(n)
+    # слагаемые с |(4k±1)z/√n| > ~10 нулевые: ограничиваем диапазон k, иначе при малом z их ~n/z
+    kmax = int(min(n / z, 10.0 * sn / z + 4) // 4) + 1
+    s1 = sum(_phi((4 * k + 1) * z / sn) - _phi((4 * k - 1) * z / sn)
+             for k in range(max(-kmax, int(math.floor((-n / z + 1) / 4))), min(kmax, int((n / z - 1) // 4)) + 1))
+    s2 = sum(_phi((4 * k + 3) * z / sn) - _phi((4 * k + 1) * z / sn)
+             for k in range(max(-kmax, int(math.floor((-n / z - 3) / 4))), min(kmax, int((n / z - 1) // 4)) + 1))
+    return min(1.0, max(0.0, 1.0 - s1 + s2))
+
+
+class _CumulativeSums(_Test):
+    name = "cumulative_sums"
+
+    def __init__(self, _bits: int):
+        self.s = 0
+        self.smax = 0
+        self.smin = 0
+        self._k = np.empty(0, dtype=np.int32)
+
+    def update(self, b):
+        # в пределах чанка хватает int32; смещение прошлых чанков — питоновским int
+        if len(self._k) < len(b):
+            self._k = np.arange(1, len(b) + 1, dtype=np.int32)
+        c = np.cumsum(b, dtype=np.int32)
+        c *= 2
+        c -= self._k[:len(b)]
+        self.smax = max(self.smax, self.s + int(c.max()))
+        self.smin = min(self.smin, self.s + int(c.min()))
+        self.s += int(c[-1])
+
+    def result(self, n):
+        # обратный проход: частичные суммы с конца = S_n − S_j, их максимум — из min/max префиксов
+        fwd = max(self.smax, -self.smin)
+        bwd = max(self.s - self.smin, self.smax - self.s)
+        pf, pb = _cusum_p(n, fwd), _cusum_p(n, bwd)
+        return {"pValue": min(pf, pb), "forward": {"pValue": pf, "z": fwd}, "backward": {"pValue": pb, "z": bwd}}
+
+
+class _Spectral(_Blocked):
+    name = "spectral"
+    min_bits = 1000
+
+    def __init__(self, bits: int):
+        super().__init__()
+        self.M = min(SPECTRAL_BLOCK, bits - bits % 2)
+        self.threshold = math.sqrt(math.log(1 / 0.05) * self.M)
+        self.blocks = 0
+        self.n1 = 0
+
+    def update(self, b):
+        rows = self._blocks(b)
+        if rows is None:
+            return
+        x = rows.astype(np.float64)
+        x *= 2.0
+        x -= 1.0
+        mags = np.abs(np.fft.rfft(x, axis=1)[:, :self.M // 2])
+        self.n1 += int(np.count_nonzero(mags < self.threshold))
+        self.blocks += len(rows)
+
+    def result(self, n):
+        if not self.blocks:
+            return {"pValue": None, "blocks": 0}
+        n0 = 0.95 * self.blocks * self.M / 2.0
+        d = (self.n1 - n0) / math.sqrt(self.blocks * self.M * 0.95 * 0.05 / 4.0)
+        return {"pValue": math.erfc(abs(d) / math.sqrt(2.0)), "d": d, "blocks": self.blocks, "blockBits": self.M}
+
+
+class _ApproximateEntropy(_Test):
+    name = "approximate_entropy"
+
+    def __init__(self, bits: int):
+        # NIST: m < ⌊log2 n⌋ − 5
+        self.m = max(2, min(APEN_M, int(math.log2(bits)) - 6))
+        self.head = np.empty(0, dtype=np.uint8)
+        self.tail = np.empty(0, dtype=np.uint8)
+        self.counts = np.zeros(1 << (self.m + 1), dtype=np.int64)
+
+    def _patterns(self, x: np.ndarray, windows: int) -> np.ndarray:
+        v = np.zeros(windows, dtype=np.uint16)      # m + 1 <= 11 бит
+        for i in range(self.m + 1):
+            v <<= 1
+            v |= x[i:i + windows]
+        return np.bincount(v, minlength=len(self.counts))
+
+    def update(self, b):
+        m = self.m
+        if len(self.head) < m:
+            self.head = np.concatenate((self.head, b[:m - len(self.head)]))
+        x = np.concatenate((self.tail, b)) if len(self.tail) else b
+        if len(x) > m:
+            # считаем (m+1)-окна, целиком лежащие в x; окна, начатые в хвосте, — только теперь
+            self.counts += self._patterns(x, len(x) - m)
+        self.tail = x[-m:].copy()
+
+    def result(self, n):
+        m = self.m
+        # циклическое замыкание: недостающие m окон — через начало последовательности
+        counts = self.counts + self._patterns(np.concatenate((self.tail, self.head)), m)
+        def phi(c):
+            c = c[c > 0] / n
+            return float((c * np.log(c)).sum())
+        ap_en = phi(counts.reshape(-1, 2).sum(axis=1)) - phi(counts)
+        chi2 = 2.0 * n * (math.log(2) - ap_en)
+        return {"pValue": igamc(2.0 ** (m - 1), chi2 / 2.0), "apEn": ap_en, "chi2": chi2, "m": m}
+
+
+TESTS = {t.name: t for t in (_Frequency, _BlockFrequency, _Runs, _LongestRun,
+                             _CumulativeSums, _Spectral, _ApproximateEntropy)}
+
+# контрольный вектор spectral: (биты, N1, p). Биты — ε из примера SP 800-22 (2.6.8), N1 и p —
+# прямой DFT Σ x_k·exp(−2πijk/n) с порогом T = √(ln 20 · n). Опубликованные там N1 = 46 и
+# p = 0.168669 прямой DFT не получаются, а d = −0.973329 в том же примере посчитан с дисперсией
+# n·0.95·0.05/2, тогда как p = 0.168669 соответствует n·0.95·0.05/4 (d = −1.376494).
+SPECTRAL_REFERENCE = (
+    "1100100100001111110110101010001000100001011010001100001000110100110001001100011001100010100010111000",
+    48, 0.646355,
+)
+
+def spectral_reference() -> dict:
+    """Прогнать spectral на SPECTRAL_REFERENCE (чанками — с переносом хвоста); AssertionError — расхождение."""
+    bits, n1, p = SPECTRAL_REFERENCE
+    b = np.frombuffer(bits.encode(), dtype=np.uint8) - ord("0")
+    t = _Spectral(len(b))
+    for i in range(0, len(b), 7):
+        t.update(b[i:i + 7])
+    res = t.result(len(b))
+    assert t.n1 == n1 and abs(res["pValue"] - p) < 1e-6, f"spectral reference mismatch: N1={t.n1}, p={res['pValue']}"
+    return res
+
+# ——— прогон
+
+def _report(kind: str, tests: Dict[str, _Test], n: int, total: int, alpha: float, t0: float) -> dict:
+    out = {}
+    for name, t in tests.items():
+        r = t.result(n)
+        p = r["pValue"]
+        if p is not None:
+            r["pValue"] = round(p, 6)
+            r["pass"] = p >= alpha
+        out[name] = r
+    elapsed = time.perf_counter() - t0
+    doc = {"type": kind, "bits": n, "totalBits": total, "elapsedMs": round(elapsed * 1000, 1),
+           "mbitPerS": round(n / elapsed / 1e6, 2) if elapsed else None, "tests": out}
+    if kind == "done":
+        doc["alpha"] = alpha
+        doc["passed"] = all(r.get("pass", True) for r in out.values())
+    return doc
+
+def run_battery(seed: bytes, bits: int, gen: str = "ctr/v1", offset: int = 0,
+                names: Optional[Iterable[str]] = None, alpha: float = ALPHA,
+                report_bits: int = 0) -> Iterator[dict]:
+    """
+    Один проход по bits битам потока (как /tests/bitstream/by-seed с fmt=bin).
+    Каждые report_bits бит — {"type": "progress", ...} по префиксу, в конце {"type": "done", ...}.
+    """
+    selected: List[str] = list(names) if names else list(TESTS)
+    unknown = [n for n in selected if n not in TESTS]
+    if unknown:
+        raise ValueError(f"unknown test(s): {', '.join(unknown)}")
+    tests = {n: TESTS[n](bits) for n in selected if bits >= TESTS[n].min_bits}
+    t0 = time.perf_counter()
+    done, next_report = 0, report_bits
+    for chunk in binary_stream(seed, bits, gen=gen, offset_bits=offset):
+        b = np.unpackbits(np.frombuffer(chunk, dtype=np.uint8), count=min(8 * len(chunk), bits - done))
+        for t in tests.values():
+            t.update(b)
+        done += len(b)
+        battery_bits.inc(len(b))
+        if report_bits and next_report <= done < bits:
+            yield _report("progress", tests, done, bits, alpha, t0)
+            next_report = (done // report_bits + 1) * report_bits
+    yield _report("done", tests, done, bits, alpha, t0)
+
+def slot() -> Optional[Callable[[], None]]:
+    """
+    Слот под прогон без ожидания; None — все заняты. Возвращает release, который можно
+    звать сколько угодно раз (из finally генератора и из финализатора — что случится раньше).
+    """
+    if not _active.acquire(blocking=False):
+        return None
+    once = threading.Lock()
+    def release():
+        if once.acquire(blocking=False):
+            _active.release()
+    return release
@@ -1,57 +1,124 @@
 # services/bitstream.py
 import itertools
 from typing import Iterator
+import numpy as np
 from blake3 import blake3
+from Crypto.Cipher import ChaCha20
 
-# Таблица «байт -> 8 символов '0'/'1'» (MSB→LSB)
-_BITSTR = [format(b, "08b") for b in range(256)]
+# txt: сколько входных байт рендерим за раз (64 KiB ASCII, 128 KiB с newline)
+_ASCII_BLOCK = 8192
 
-def stream_bytes_from_seed(seed: bytes, total_bytes: int, chunk: int = 65536) -> Iterator[bytes]:
+GENERATORS = ("ctr/v1", "xof/v1", "chacha20/v1")
+_XOF_V1_CONTEXT = b"CM|bits|xof/v1"
+
+def stream_bytes_from_seed(seed: bytes, total_bytes: int, chunk: int = 65536,
+                           gen: str = "ctr/v1", start: int = 0) -> Iterator[bytes]:
     """
-    Криптографический поток байтов из seed:
-    keyed BLAKE3(seed) поверх счётчика (LE64). 32B на шаг.
+    Криптографический поток байтов из seed, начиная с байта start (random access).
+    ctr/v1:      keyed BLAKE3(seed) поверх счётчика (LE64). 32B на шаг.
+    xof/v1:      keyed BLAKE3(seed, "CM|bits|xof/v1") — один XOF, читаем большими кусками.
+    chacha20/v1: keystream ChaCha20(key=seed, nonce=0) — тот же, что prng_chacha20.
     """
     assert len(seed) == 32, "seed must be 32 bytes"
+    if gen == "xof/v1":
+        yield from _xof_stream(seed, total_bytes, chunk, start)
+        return
+    if gen == "chacha20/v1":
+        yield from _chacha20_stream(seed, total_bytes, chunk, start)
+        return
+    if gen != "ctr/v1":
+        raise ValueError(f"unknown generator: {gen}")
+    # байт start живёт в блоке счётчика start // 32 — прыгаем сразу туда
+    counter, skip = divmod(start, 32)
     produced = 0
-    counter = 0
+    buf = bytearray()
     while produced < total_bytes:
         need = min(chunk, total_bytes - produced)
-        buf = bytearray()
-        while len(buf) < need:
+        while len(buf) < skip + need:
             h = blake3(key=seed)
             h.update(counter.to_bytes(8, "little"))
             buf.extend(h.digest())
             counter += 1
-        out = bytes(buf[:need])
+        out = bytes(buf[skip:skip + need])
+        del buf[:skip + need]
+        skip = 0
         produced += len(out)
         yield out
 
-def ascii_bits_stream(seed: bytes, total_bits: int, sep: str) -> Iterator[bytes]:
+def _xof_stream(seed: bytes, total_bytes: int, chunk: int, start: int) -> Iterator[bytes]:
+    h = blake3(_XOF_V1_CONTEXT, key=seed)
+    produced = 0
+    while produced < total_bytes:
+        need = min(chunk, total_bytes - produced)
+        yield h.digest(length=need, seek=start + produced)
+        produced += need
+
+def _chacha20_stream(seed: bytes, total_bytes: int, chunk: int, start: int) -> Iterator[bytes]:
+    cipher = ChaCha20.new(key=seed, nonce=b"\x00" * 8)
+    if start:
+        cipher.seek(start)
+    zeros = bytes(chunk)
+    produced = 0
+    while produced < total_bytes:
+        need = min(chunk, total_bytes - produced)
+        yield cipher.encrypt(zeros if need == chunk else zeros[:need])
+        produced += need
+
+def _shift_left_bits(src: Iterator[bytes], shift: int) -> Iterator[bytes]:
+    """Сдвиг потока на shift (1..7) бит влево: из n+1 входных байт получаем n выходных."""
+    carry = None
+    for chunk in src:
+        a = np.frombuffer(chunk, dtype=np.uint8)
+        if carry is not None:
+            a = np.concatenate((carry, a))
+        if len(a) >= 2:
+            yield ((a[:-1] << shift) | (a[1:] >> (8 - shift))).tobytes()
+        carry = a[-1:]
+
+def ascii_bits_stream(seed: bytes, total_bits: int, sep: str, gen: str = "ctr/v1",
+                      offset_bits: int = 0) -> Iterator[bytes]:
     """
-    ASCII '0'/'1'. MSB-ориентация.
+    ASCII '0'/'1'. MSB-ориентация. Поток начинается с бита offset_bits.
     sep: "none" | "newline"
+    Векторно: unpackbits + сдвиг к ASCII в переиспользуемый буфер, без промежуточных str.
+    Для newline каждый бит — пара байт ('0'|'1', '\\n'), пишем её как little-endian uint16.
     """
-    total_bytes = (total_bits + 7) // 8
-    produced_bits = 0
-    for chunk in stream_bytes_from_seed(seed, total_bytes):
-        bit_str = "".join(_BITSTR[b] for b in chunk)
-        take = min(len(bit_str), total_bits - produced_bits)
-        s = bit_str[:take]
-        if sep == "newline":
-            s = "\n".join(s) + "\n"
-        produced_bits += take
-        if not s:
-            break
-        yield s.encode("ascii")
+    skip = offset_bits % 8
+    total_bytes = (skip + total_bits + 7) // 8
+    if sep == "newline":
+        out = np.empty(8 * _ASCII_BLOCK, dtype="<u2")
+        ascii0 = np.uint16(0x0A30)       # b"0\n" в LE
+    else:
+        out = np.empty(8 * _ASCII_BLOCK, dtype=np.uint8)
+        ascii0 = np.uint8(0x30)          # b"0"
+    left = total_bits
+    for chunk in stream_bytes_from_seed(seed, total_bytes, gen=gen, start=offset_bits // 8):
+        for i in range(0, len(chunk), _ASCII_BLOCK):
+            if left <= 0:
+                return
+            a = np.frombuffer(chunk, dtype=np.uint8, count=min(_ASCII_BLOCK, len(chunk) - i), offset=i)
+            bits = np.unpackbits(a, count=min(8 * len(a), skip + left))[skip:]
+            skip = 0
+            n = len(bits)
+            np.add(bits, ascii0, out=out[:n], dtype=out.dtype)
+            left -= n
+            # копия наружу: буфер переиспользуется, а транспорт может держать ссылку на чанк
+            yield out[:n].tobytes()
 
-def binary_stream(seed: bytes, total_bits: int) -> Iterator[bytes]:
+def binary_stream(seed: bytes, total_bits: int, gen: str = "ctr/v1",
+                  offset_bits: int = 0) -> Iterator[bytes]:
     """
     Сырые байты; последний неполный байт затираем снизу (LSB), чтобы получить ровно total_bits.
+    Поток начинается с бита offset_bits (невыровненное смещение — сдвигом).
     """
     total_bytes = (total_bits + 7) // 8
     rem = total_bits % 8
+    shift = offset_bits % 8
+    src = stream_bytes_from_seed(seed, total_bytes + (1 if shift else 0), gen=gen, start=offset_bits // 8)
+    if shift:
+        src = _shift_left_bits(src, shift)
     produced = 0
-    for chunk in stream_bytes_from_seed(seed, total_bytes):
+    for chunk in src:
         produced_next = produced + len(chunk)
         if produced_next < total_bytes:
             yield chunk
@@ -64,3 +131,34 @@ def binary_stream(seed: bytes, total_bits: int) -> Iterator[bytes]:
                 last[-1] &= (0xFF << (8 - rem)) & 0xFF
                 yield bytes(last)
         produced = produced_next
+
+def body_length(total_bits: int, fmt: str, sep: str) -> int:
+    """Длина HTTP-тела для заданного числа бит/формата."""
+    if fmt == "bin":
+        return (total_bits + 7) // 8
+    return total_bits * (2 if sep == "newline" else 1)
+
+def body_range_stream(seed: bytes, total_bits: int, fmt: str, sep: str, gen: str,
+                      offset_bits: int, first: int, last: int) -> Iterator[bytes]:
+    """
+    Байты [first, last] тела ответа (HTTP Range) без генерации предшествующих:
+    переводим границы в биты и стартуем поток прямо с нужного блока.
+    """
+    if fmt == "bin":
+        # байт тела i = биты [8i, 8i+8); последний неполный байт маскируется как и в полном ответе
+        bit0 = 8 * first
+        nbits = min(total_bits - bit0, 8 * (last - first + 1))
+        yield from binary_stream(seed, nbits, gen=gen, offset_bits=offset_bits + bit0)
+        return
+    width = 2 if sep == "newline" else 1
+    bit0, bit1 = first // width, last // width
+    head, length = first % width, last - first + 1
+    src = ascii_bits_stream(seed, bit1 - bit0 + 1, sep, gen=gen, offset_bits=offset_bits + bit0)
+    for chunk in src:
+        if head:
+            chunk, head = chunk[head:], 0
+        if len(chunk) >= length:
+            yield chunk[:length]
+            return
+        length -= len(chunk)
+        yield chunk
@@ -0,0 +1,314 @@
+# services/cluster.py
+"""
+Несколько воркеров uvicorn на одной машине без внешних сервисов.
+
+Лидер — воркер, удерживающий flock на CLUSTER_DIR/leader.lock: он ведёт авто-генератор,
+трекер блоков и все тиражи (состояние реестра живёт только у него) и поднимает шину
+на Unix-сокете CLUSTER_DIR/bus.sock. Остальные воркеры — последователи:
+  • события hub.emit пересылают лидеру, тот назначает общий id и рассылает готовый кадр
+    всем (SSE-клиент любого воркера видит один и тот же поток, Last-Event-ID сквозной);
+  • запросы, меняющие состояние тиража (/draws/solana, /entropy/...), пробрасывают лидеру;
+  • текущий draw_id получают рассылкой.
+Последователи раз в секунду пробуют взять блокировку: после гибели лидера её
+снимает ОС, и один из них становится новым лидером.
+
+Протокол шины — JSON по строке в обе стороны:
+  лидер → воркер: hello{current}, frame{ch,k,id,d}, close{ch}, current{drawId}, reply{req,status,content}
+  воркер → лидер: emit{ch,ev}, call{req,name,args}
+"""
+import asyncio, json, os
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+from settings import settings
+from streams import hub
+from services.registry import registry
+
+try:
+    import fcntl
+except ImportError:  # Windows: кластер недоступен, работаем одним процессом
+    fcntl = None
+
+LEADER, FOLLOWER = "leader", "follower"
+
+Handler = Callable[[dict], Awaitable[object]]
+_HANDLERS: Dict[str, Handler] = {}
+
+def route(name: str):
+    """Регистрирует обработчик проброшенного запроса (исполняется у лидера)."""
+    def deco(fn: Handler) -> Handler:
+        _HANDLERS[name] = fn
+        return fn
+    return deco
+
+def _to_wire(res) -> tuple:
+    # ответ эндпоинта → (status, content) для передачи по шине
+    if isinstance(res, Response):
+        return res.status_code, json.loads(res.body or b"null")
+    if isinstance(res, BaseModel):
+        return 200, res.model_dump()
+    return 200, res
+
+def _line(msg: dict) -> bytes:
+    return json.dumps(msg, separators=(",", ":"), ensure_ascii=False).encode() + b"\n"
+
+
+class Cluster:
+    def __init__(self, root: str, call_timeout_s: float = 120.0, peer_buffer: int = 4 << 20):
+        self.root = root
+        self.call_timeout_s = call_timeout_s
+        self.peer_buffer = peer_buffer
+        self.role: Optional[str] = None
+        self._lock_fd: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Set[asyncio.StreamWriter] = set()
+        self._writer: Optional[asyncio.StreamWriter] = None   # соединение последователя с лидером
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._req = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._on_leader: list = []
+
+    @property
+    def lock_path(self) -> str:
+        return os.path.join(self.root, "leader.lock")
+
+    @property
+    def sock_path(self) -> str:
+        return os.path.join(self.root, "bus.sock")
+
+    @property
+    def is_leader(self) -> bool:
+        # без кластера процесс сам себе лидер
+        return self.role != FOLLOWER
+
+    def on_leader(self, fn: Callable[[], None]):
+        """Колбэк при получении лидерства (в т.ч. при старте без кластера)."""
+        self._on_leader.append(fn)
+
+    def _spawn(self, coro) -> asyncio.Task:
+        t = asyncio.create_task(coro)
+        self._tasks.add(t)
+        t.add_done_callback(self._tasks.discard)
+        return t
+
+    # ——— жизненный цикл
+
+    async def start(self, enabled: bool = True):
+        if not enabled or fcntl is None or not hasattr(asyncio, "start_unix_server"):
+            if enabled:
+                print("cluster: fcntl/AF_UNIX unavailable, running standalone")
+            await self._become_leader(bus=False)
+            return
+        os.makedirs(self.root, exist_ok=True)
+        self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        if self._try_lock():
+            await self._become_leader()
+        else:
+            self.role = FOLLOWER
+            hub.bus = self
+            self._spawn(self._follow())
+            self._spawn(self._elect())
+
+    async def stop(self):
+        for t in list(self._tasks):
+            t.cancel()
+        self._fail_pending("worker shutting down")
+        for w in list(self._peers):
+            w.close()
+        self._peers.clear()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            try:
+                os.unlink(self.sock_path)
+            except OSError:
+                pass
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)   # снимает flock
+            self._lock_fd = None
+        hub.bus = None
+        registry.on_current = None
+
+    # ——— выборы
+
+    def _try_lock(self) -> bool:
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    async def _elect(self):
+        while self.role == FOLLOWER:
+            await asyncio.sleep(1.0)
+            if self._try_lock():
+                if self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+                self._fail_pending("leader changed, retry")
+                await self._become_leader()
+
+    async def _become_leader(self, bus: bool = True):
+        self.role = LEADER if bus else None
+        if bus:
+            try:
+                os.unlink(self.sock_path)   # сокет прежнего лидера
+            except OSError:
+                pass
+            self._server = await asyncio.start_unix_server(self._serve_peer, path=self.sock_path)
+            hub.bus = self
+            registry.on_current = self._publish_current
+            print(f"cluster: pid {os.getpid()} is the leader")
+        for fn in self._on_leader:
+            fn()
+
+    # ——— лидер: шина
+
+    def _send(self, w: asyncio.StreamWriter, msg: dict):
+        if w.is_closing():
+            self._peers.discard(w)
+            return
+        if w.transport.get_write_buffer_size() > self.peer_buffer:
+            # воркер не вычитывает шину — отключаем, он переподключится и догонит по replay
+            self._peers.discard(w)
+            w.close()
+            return
+        w.write(_line(msg))
+
+    def _broadcast(self, msg: dict):
+        if self.role != LEADER or not self._peers:
+            return
+        data = _line(msg)
+        for w in list(self._peers):
+            if w.is_closing() or w.transport.get_write_buffer_size() > self.peer_buffer:
+                self._peers.discard(w)
+                w.close()
+                continue
+            w.write(data)
+
+    def publish(self, draw_id: str, frame):
+        kind, data, event_id = frame
+        self._broadcast({"op": "frame", "ch": draw_id, "k": kind, "id": event_id, "d": data.decode()})
+
+    def publish_close(self, draw_id: str):
+        self._broadcast({"op": "close", "ch": draw_id})
+
+    def _publish_current(self, draw_id: Optional[str]):
+        self._broadcast({"op": "current", "drawId": draw_id})
+
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._peers.add(writer)
+        self._send(writer, {"op": "hello", "current": registry.current})
+        try:
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    break
+                msg = json.loads(raw)
+                op = msg.get("op")
+                if op == "emit":
+                    await hub.emit(msg["ch"], msg["ev"])
+                elif op == "call":
+                    self._spawn(self._answer(writer, msg))
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+    async def _answer(self, writer: asyncio.StreamWriter, msg: dict):
+        fn = _HANDLERS.get(msg.get("name"))
+        try:
+            if fn is None:
+                status, content = 404, {"error": f"unknown cluster call: {msg.get('name')}"}
+            else:
+                status, content = _to_wire(await fn(msg.get("args") or {}))
+        except Exception as e:
+            status, content = 500, {"error": str(e)}
+        self._send(writer, {"op": "reply", "req": msg["req"], "status": status, "content": content})
+
+    # ——— последователь
+
+    async def _follow(self):
+        while self.role == FOLLOWER:
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.sock_path)
+            except OSError:
+                await asyncio.sleep(0.2)   # лидер ещё не поднял сокет
+                continue
+            try:
+                while True:
+                    raw = await reader.readline()
+                    if not raw:
+                        break
+                    self._on_message(json.loads(raw))
+            except (ConnectionError, ValueError):
+                pass
+            finally:
+                if self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+                self._fail_pending("leader connection lost, retry")
+            await asyncio.sleep(0.2)
+
+    def _on_message(self, msg: dict):
+        op = msg.get("op")
+        if op == "frame":
+            event_id = msg["id"]
+            # после смены лидера продолжим нумерацию не ниже уже виденной
+            hub._seq = max(hub._seq, event_id)
+            hub.deliver(msg["ch"], (msg["k"], msg["d"].encode(), event_id))
+        elif op == "reply":
+            fut = self._pending.pop(msg["req"], None)
+            if fut is not None and not fut.done():
+                fut.set_result((msg["status"], msg["content"]))
+        elif op in ("current", "hello"):
+            registry.current = msg.get("drawId", msg.get("current"))
+        elif op == "close":
+            hub.close_draw(msg["ch"])
+
+    def _fail_pending(self, reason: str):
+        for fut in self._pending.values():
+            if not fut.done():
+                fut.set_result((503, {"error": reason}))
+        self._pending.clear()
+
+    def relay(self, draw_id: str, event: dict) -> bool:
+        """Переслать событие лидеру. False — шины нет, hub выпускает событие сам."""
+        if self.role != FOLLOWER or self._writer is None or self._writer.is_closing():
+            return False
+        self._writer.write(_line({"op": "emit", "ch": draw_id, "ev": event}))
+        return True
+
+    async def forward(self, name: str, args: dict) -> Optional[JSONResponse]:
+        """
+        У последователя — выполнить обработчик name у лидера и вернуть его ответ;
+        у лидера (и без кластера) — None: запрос обрабатывается на месте.
+        """
+        if self.role != FOLLOWER:
+            return None
+        if self._writer is None or self._writer.is_closing():
+            return JSONResponse(status_code=503, content={"error": "cluster leader unavailable, retry"})
+        self._req += 1
+        req = self._req
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[req] = fut
+        self._writer.write(_line({"op": "call", "req": req, "name": name, "args": args}))
+        try:
+            status, content = await asyncio.wait_for(fut, self.call_timeout_s)
+        except asyncio.TimeoutError:
+            self._pending.pop(req, None)
+            return JSONResponse(status_code=504, content={"error": "cluster leader timeout"})
+        return JSONResponse(status_code=status, content=content)
+
+
+cluster = Cluster(
+    root=settings.CLUSTER_DIR,
+    call_timeout_s=settings.CLUSTER_CALL_TIMEOUT_S,
+    peer_buffer=settings.CLUSTER_PEER_BUFFER,
+)
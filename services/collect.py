@@ -1,15 +1,20 @@
 # services/collect.py
-import asyncio, os
+import asyncio, os, time
 from streams import hub
-from rng.local_pool import add_packet, bytes_total, packet_count, root_hex
-from sources.loc_entropy import cpu_jitter_bytes
+from rng.local_pool import add_packet, bytes_total, health, root_hex
+from settings import settings
+from sources.loc_entropy import cpu_jitter_batches, clamp_samples, jitter_workers
+from services.registry import registry, COLLECTING
+from services.health import EntropyHealthError
+from services.progress import progress
+from services.metrics import collect_seconds, collect_bytes, collect_draw_bytes
 
 class CollectParams:
     def __init__(self, collect_ms=8000, srv_jitter=True, srv_jitter_samples=12000, srv_urandom_bytes=1024,
                  require_loc=False, min_loc_bytes=0):
         self.collect_ms = max(0, int(collect_ms or 0))
         self.srv_jitter = bool(srv_jitter)
-        self.srv_jitter_samples = max(1, int(srv_jitter_samples or 1))
+        self.srv_jitter_samples = clamp_samples(srv_jitter_samples or 1)
         self.srv_urandom_bytes = max(0, int(srv_urandom_bytes or 0))
         self.require_loc = bool(require_loc)
         self.min_loc_bytes = max(0, int(min_loc_bytes or 0))
@@ -21,21 +26,29 @@ class CollectResult:
         self.jitter_bytes_total = 0
         self.jitter_samples_total = 0
 
+async def _add_checked(draw_id: str, data: bytes, source: str):
+    """Пакет через health-тесты; отказ источника — сразу ошибка тиража, не ждём конца окна сбора."""
+    try:
+        add_packet(draw_id, data, source)
+    except EntropyHealthError as e:
+        await hub.emit(draw_id, {"type":"error","drawId":draw_id,"stage":"collect","message":str(e),
+                                 "health": {source: e.report}})
+        raise
+
 async def collect_server_entropy(draw_id: str, p: CollectParams) -> CollectResult:
     res = CollectResult()
     if p.collect_ms <= 0:
         return res
+    registry.set_status(draw_id, COLLECTING)
+    t0 = time.perf_counter()
 
     # Одноразовый OS RNG
     if p.srv_urandom_bytes > 0:
         data = os.urandom(p.srv_urandom_bytes)
         res.urandom_bytes_used = len(data)
-        add_packet(draw_id, data)
-        await hub.emit(draw_id, {
-            "type":"loc.progress","drawId":draw_id,"source":"SRV",
-            "bytesTotal": bytes_total(draw_id),"packets": packet_count(draw_id),
-            "rootHex": root_hex(draw_id)
-        })
+        collect_bytes.labels("urandom").inc(len(data))
+        await _add_checked(draw_id, data, "urandom")
+        await progress.notify(draw_id, "SRV")
 
     await hub.emit(draw_id, {
         "type":"collect.open","drawId":draw_id,
@@ -52,25 +65,27 @@ async def collect_server_entropy(draw_id: str, p: CollectParams) -> CollectResul
         if remain <= 0: break
 
         if p.srv_jitter:
-            data = cpu_jitter_bytes(samples=p.srv_jitter_samples)
-            add_packet(draw_id, data)
-            res.jitter_batches += 1
-            res.jitter_bytes_total += len(data)
-            res.jitter_samples_total += p.srv_jitter_samples
-
-            await hub.emit(draw_id, {
-                "type":"loc.progress","drawId":draw_id,"source":"SRV",
-                "bytesTotal": bytes_total(draw_id),"packets": packet_count(draw_id),
-                "rootHex": root_hex(draw_id)
-            })
+            # батчи снимаются параллельно в пуле воркеров; каждый — отдельный пакет, как раньше
+            batches = await cpu_jitter_batches(p.srv_jitter_samples, settings.JITTER_PARALLEL or jitter_workers())
+            for data in batches:
+                await _add_checked(draw_id, data, "jitter")
+                res.jitter_batches += 1
+                res.jitter_bytes_total += len(data)
+                res.jitter_samples_total += len(data)
+                collect_bytes.labels("jitter").inc(len(data))
+
+            await progress.notify(draw_id, "SRV")
 
         await hub.emit(draw_id, {
             "type":"collect.tick","drawId":draw_id,
             "remainingMs": int(max(0,remain)*1000),
             "bytes": bytes_total(draw_id)
         })
-        await asyncio.sleep(1)
+        # не спим дальше дедлайна сбора
+        await asyncio.sleep(min(1.0, max(0.0, end - loop.time())))
 
+    # отложенный loc.progress — до collect.close, чтобы зрители видели итоговый корень
+    await progress.flush(draw_id)
     await hub.emit(draw_id, {
         "type":"collect.close","drawId":draw_id,
         "bytes": bytes_total(draw_id),
@@ -85,8 +100,12 @@ async def collect_server_entropy(draw_id: str, p: CollectParams) -> CollectResul
         "jitterBatches": res.jitter_batches,
         "jitterBytes": res.jitter_bytes_total,
         "jitterSamplesTotal": res.jitter_samples_total,
+        "health": health(draw_id),
     })
 
+    collect_seconds.observe(time.perf_counter() - t0)
+    collect_draw_bytes.observe(bytes_total(draw_id))
+
     # строгая проверка
     if p.require_loc and bytes_total(draw_id) < max(1, p.min_loc_bytes):
         msg = f"Not enough local entropy: {bytes_total(draw_id)} < {p.min_loc_bytes}"
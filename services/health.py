@@ -0,0 +1,163 @@
+# services/health.py
+"""
+Непрерывные health-тесты локальной энтропии в духе SP 800-90B (4.4) — на каждый пакет,
+до того как он попадёт в LOC-корень.
+
+Отдельное состояние на (тираж, источник): выборка — байт, тесты идут по непрерывному
+потоку байтов источника, стык пакетов учитывается (хвост серии / неполное окно переносятся).
+  • RCT (repetition count): серия одинаковых байт длиной ≥ C = 1 + ⌈a / H⌉, где α = 2^-a;
+  • APT (adaptive proportion): в окне W = 512 первый байт окна встречается ≥ C раз,
+    C = 1 + CRITBINOM(W, 2^-H, 1 − α);
+  • оценка min-entropy по самому частому значению (6.3.1) по накопленной гистограмме.
+H — заявленная min-entropy источника на байт (settings.HEALTH_H_*). Всё векторно по пакету,
+на байт — O(1). Отказ серверного источника защёлкивается: дальнейшие его пакеты в этом
+тираже отвергаются, сбор падает сразу.
+"""
+import math
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+from services.metrics import health_failures
+from settings import settings
+
+APT_WINDOW = 512
+
+class EntropyHealthError(ValueError):
+    status_code = 422
+
+    def __init__(self, source: str, test: str, detail: str, report: dict):
+        super().__init__(f"entropy source '{source}' failed {test} health test: {detail}")
+        self.source = source
+        self.test = test
+        self.report = report
+
+def claimed_entropy(source: str) -> float:
+    """Заявленная min-entropy источника, бит на байт."""
+    return {"jitter": settings.HEALTH_H_JITTER, "urandom": settings.HEALTH_H_URANDOM}.get(
+        source, settings.HEALTH_H_USER)
+
+def rct_cutoff(h: float, alpha_log2: int) -> int:
+    return 1 + math.ceil(alpha_log2 / h)
+
+@lru_cache(maxsize=32)
+def apt_cutoff(h: float, alpha_log2: int, window: int = APT_WINDOW) -> int:
+    """1 + наименьшее k с P(Bin(W, 2^-H) > k) ≤ α; хвост суммируем в лог-шкале."""
+    p = 2.0 ** -h
+    alpha = 2.0 ** -alpha_log2
+    if p >= 1.0:
+        return window + 1
+    lp, lq = math.log(p), math.log1p(-p)
+    def logpmf(k):
+        return math.lgamma(window + 1) - math.lgamma(k + 1) - math.lgamma(window - k + 1) + k * lp + (window - k) * lq
+    tail = 0.0                       # P(X > k), копим сверху вниз
+    for k in range(window, -1, -1):
+        tail_next = tail + math.exp(logpmf(k))   # P(X >= k) = P(X > k-1)
+        if tail_next > alpha:
+            return 1 + k
+        tail = tail_next
+    return 1
+
+def min_entropy_mcv(counts: np.ndarray, n: int) -> Optional[float]:
+    """Most common value estimate (SP 800-90B 6.3.1), бит на байт."""
+    if n < 2:
+        return None
+    p = int(counts.max()) / n
+    pu = min(1.0, p + 2.576 * math.sqrt(p * (1.0 - p) / (n - 1)))
+    return -math.log2(pu) if pu > 0 else 8.0
+
+
+class SourceHealth:
+    """
+    Состояние тестов одного источника в одном тираже.
+    continuous=False — пакеты независимы (пользовательские: приходят от разных клиентов):
+    каждый проверяется сам по себе, отвергнутый не трогает состояние и не защёлкивает отказ —
+    иначе один клиент мог бы закрыть приём для всех.
+    """
+    __slots__ = ("source", "h", "rct_c", "apt_c", "continuous", "samples", "counts",
+                 "run_value", "run_len", "max_run", "window", "apt_windows", "apt_max",
+                 "rejected", "failure")
+
+    def __init__(self, source: str, h: Optional[float] = None, alpha_log2: Optional[int] = None,
+                 continuous: Optional[bool] = None):
+        a = alpha_log2 or settings.HEALTH_ALPHA_LOG2
+        self.source = source
+        self.h = h or claimed_entropy(source)
+        self.rct_c = rct_cutoff(self.h, a)
+        self.apt_c = apt_cutoff(self.h, a)
+        self.continuous = source != "user" if continuous is None else continuous
+        self.samples = 0
+        self.counts = np.zeros(256, dtype=np.int64)
+        self.run_value = -1          # байт текущей (незавершённой) серии и её длина
+        self.run_len = 0
+        self.max_run = 0
+        self.window = np.empty(0, dtype=np.uint8)    # неполное окно APT с прошлых пакетов
+        self.apt_windows = 0
+        self.apt_max = 0
+        self.rejected = 0
+        self.failure: Optional[str] = None
+
+    def check(self, data: bytes):
+        """Прогнать пакет; EntropyHealthError — пакет брать нельзя (непрерывный источник — и дальше тоже)."""
+        if self.failure:
+            raise EntropyHealthError(self.source, self.failure, "source already failed in this draw", self.report())
+        if not data:
+            return
+        a = np.frombuffer(data, dtype=np.uint8)
+
+        # RCT: длины серий пакета; первая продолжает серию с прошлого пакета
+        edges = np.flatnonzero(a[1:] != a[:-1]) + 1
+        runs = np.diff(np.concatenate(([0], edges, [len(a)])))
+        if self.continuous and a[0] == self.run_value:
+            runs[0] += self.run_len
+        max_run = int(runs.max())
+        if max_run >= self.rct_c:
+            self._fail("rct", f"{max_run} identical samples in a row (cutoff {self.rct_c})", max_run=max_run)
+
+        # APT: непересекающиеся окна по W байт (у непрерывного источника — сквозь границы пакетов)
+        w = np.concatenate((self.window, a)) if self.continuous and len(self.window) else a
+        k = len(w) // APT_WINDOW
+        hits = 0
+        if k:
+            rows = w[:k * APT_WINDOW].reshape(k, APT_WINDOW)
+            hits = int(np.count_nonzero(rows == rows[:, :1], axis=1).max())
+            if hits >= self.apt_c:
+                self._fail("apt", f"{hits} of {APT_WINDOW} samples equal the first one (cutoff {self.apt_c})",
+                           apt_max=hits)
+
+        # пакет принят — фиксируем состояние
+        self.samples += len(a)
+        self.counts += np.bincount(a, minlength=256)
+        self.max_run = max(self.max_run, max_run)
+        self.run_value, self.run_len = int(a[-1]), int(runs[-1])
+        self.apt_windows += k
+        self.apt_max = max(self.apt_max, hits)
+        if self.continuous:
+            self.window = w[k * APT_WINDOW:].copy()
+
+    def _fail(self, test: str, detail: str, max_run: int = 0, apt_max: int = 0):
+        health_failures.labels(self.source, test).inc()
+        self.rejected += 1
+        report = self.report()
+        report.update(ok=False, failure=test)
+        report["rct"]["maxRun"] = max(report["rct"]["maxRun"], max_run)
+        report["apt"]["maxCount"] = max(report["apt"]["maxCount"], apt_max)
+        if self.continuous:
+            self.failure = test
+            self.max_run = max(self.max_run, max_run)
+            self.apt_max = max(self.apt_max, apt_max)
+        raise EntropyHealthError(self.source, test, detail, report)
+
+    def report(self) -> dict:
+        h = min_entropy_mcv(self.counts, self.samples)
+        return {
+            "ok": self.failure is None,
+            "failure": self.failure,
+            "samples": self.samples,
+            "rejectedPackets": self.rejected,
+            "claimedH": self.h,
+            "minEntropy": round(h, 3) if h is not None else None,
+            "rct": {"maxRun": self.max_run, "cutoff": self.rct_c},
+            "apt": {"maxCount": self.apt_max, "cutoff": self.apt_c, "windows": self.apt_windows},
+        }
@@ -0,0 +1,197 @@
+# services/metrics.py
+"""
+Метрики процесса в текстовом формате Prometheus (GET /metrics) без внешних зависимостей.
+Всё обновляется из одного event loop (или под GIL из пулов-потоков): счётчики —
+обычные int/float без блокировок, observe гистограммы — bisect + два сложения.
+В кластере у каждого воркера свои метрики; метка pid в process_info различает их.
+"""
+import os, time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# секунды: от быстрых RPC/fsync до долгого сбора
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1 << 20, 4 << 20, 16 << 20)
+
+_METRICS: List["_Metric"] = []
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        _METRICS.append(self)
+
+    def labels(self, *values: str):
+        """Дочерняя серия по значениям меток (кешируется: на горячем пути — один dict lookup)."""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _series(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        head = f"# HELP {self.name} {self.doc}\n# TYPE {self.name} {self.kind}\n"
+        return head + "".join(line + "\n" for line in self._series())
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n: float = 1):
+        self.value += n
+
+    def set(self, v: float):
+        self.value = v
+
+
+class Counter(_Metric):
+    """Счётчик; fn — значение, снимаемое в момент скрейпа (состояние, которое и так где-то хранится)."""
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = (), fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, doc, labels)
+        self._root = self.labels() if not self.label_names else None
+        self.fn = fn
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, n: float = 1):
+        self._root.value += n
+
+    def _series(self):
+        if self.fn is not None:
+            self._root.value = self.fn()
+        for values, v in self._children.items():
+            yield f"{self.name}{_fmt_labels(self.label_names, values)} {_num(v.value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, v: float):
+        self._root.value = v
+
+
+class _Hist:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float):
+        # le-границы включительно: bisect_left кладёт v == bound в его корзину
+        self.counts[bisect_left(self.bounds, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("h", "t0")
+
+    def __init__(self, h: _Hist):
+        self.h = h
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.h.observe(time.perf_counter() - self.t0)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, doc, labels)
+        self._root = self.labels() if not self.label_names else None
+
+    def _new_child(self):
+        return _Hist(self.buckets)
+
+    def observe(self, v: float):
+        self._root.observe(v)
+
+    def time(self) -> _Timer:
+        return _Timer(self._root)
+
+    def _series(self):
+        for values, h in self._children.items():
+            acc = 0
+            for bound, n in zip(self.buckets + (float("inf"),), h.counts):
+                acc += n
+                le = 'le="' + _num(bound) + '"'
+                yield f"{self.name}_bucket{_fmt_labels(self.label_names, values, le)} {acc}"
+            yield f"{self.name}_sum{_fmt_labels(self.label_names, values)} {_num(h.sum)}"
+            yield f"{self.name}_count{_fmt_labels(self.label_names, values)} {h.count}"
+
+
+def render() -> str:
+    return "".join(m.render() for m in _METRICS)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ——— метрики приложения (инструментированные модули импортируют отсюда)
+
+process_info = Gauge("process_info", "Worker process (value is always 1)", ["pid"])
+process_info.labels(str(os.getpid())).set(1)
+
+solana_beacon_seconds = Histogram("solana_beacon_seconds", "solana_beacon total time")
+solana_rpc_seconds = Histogram("solana_rpc_seconds", "Solana JSON-RPC call time", ["method", "batch"])
+solana_rpc_errors = Counter("solana_rpc_errors_total", "Failed Solana JSON-RPC calls", ["method"])
+solana_skipped_slots = Counter("solana_skipped_slots_total", "Slots without a usable block", ["reason"])
+solana_block_cache_hits = Counter("solana_block_cache_hits_total", "Blocks served from the slot LRU")
+
+collect_seconds = Histogram("collect_seconds", "collect_server_entropy duration")
+collect_bytes = Counter("collect_bytes_total", "Server entropy bytes collected", ["source"])
+collect_draw_bytes = Histogram("collect_draw_bytes", "Local entropy bytes per draw after collection",
+                               buckets=BYTES_BUCKETS)
+
+health_failures = Counter("entropy_health_failures_total", "Local entropy packets rejected by health tests",
+                          ["source", "test"])
+
+mix_seconds = Histogram("mix_seconds", "emit_mix_and_result time")
+draw_seconds = Histogram("draw_seconds", "Whole draw time", ["outcome"])
+
+store_fsync_seconds = Histogram("store_fsync_seconds", "fsync time when saving draws", ["backend"])
+store_save_seconds = Histogram("store_save_seconds", "save_draw time", ["backend"])
+
+sse_events = Counter("sse_events_total", "Events emitted into StreamHub")
+bitstream_bytes = Counter("bitstream_bytes_served_total", "Bitstream bytes sent to clients", ["format"])
+battery_bits = Counter("battery_bits_total", "Bits run through the statistical battery")
@@ -1,14 +1,16 @@
 # services/mix.py
-import binascii
+import binascii, time
 from decimal import Decimal, getcontext
 from blake3 import blake3
 from streams import hub
 from rng.mix import hkdf_seed, prng_chacha20, u64_be, domain_hash
 from rng.local_pool import bytes_total, root_bytes
+from services.metrics import mix_seconds
 getcontext().prec = 50
 TWO64 = 1 << 64
 
 async def emit_mix_and_result(draw_id: str, beacon_bytes: bytes, beacon_hex: str):
+    t0 = time.perf_counter()
     # источники
     inputs = []
     sources = {}
@@ -65,6 +67,7 @@ async def emit_mix_and_result(draw_id: str, beacon_bytes: bytes, beacon_hex: str
     await hub.emit(draw_id, {"type":"mix.trace","drawId":draw_id, **trace})
 
     await hub.emit(draw_id, {"type":"result","drawId":draw_id,"seedHex":seed.hex(),"number":str(num)})
+    mix_seconds.observe(time.perf_counter() - t0)
 
     # вернём всё нужное для истории
     return {
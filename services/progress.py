@@ -0,0 +1,82 @@
+# services/progress.py
+"""
+loc.progress с ограничением частоты на тираж.
+
+Каждый принятый пакет вызывает notify(); событие уходит сразу, если с прошлого прошло
+не меньше интервала, иначе ставится один отложенный «хвост» на конец интервала. Событие
+снимает состояние пула в момент отправки (bytesTotal/packets/rootHex/health), coalesced —
+сколько пакетов в него слилось. Всплеск из 10k пакетов — это ≤ LOC_PROGRESS_MAX_HZ кадров
+в секунду на зрителя, а не 10k.
+"""
+import asyncio
+from typing import Dict, Optional
+
+from rng.local_pool import bytes_total, health, packet_count, root_hex
+from settings import settings
+from streams import hub
+
+class _Pending:
+    __slots__ = ("last", "source", "merged", "timer", "task")
+
+    def __init__(self):
+        self.last = float("-inf")
+        self.source = ""
+        self.merged = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class ProgressCoalescer:
+    def __init__(self, max_hz: float):
+        self.interval = 1.0 / max_hz if max_hz > 0 else 0.0
+        self._draws: Dict[str, _Pending] = {}
+
+    async def notify(self, draw_id: str, source: str):
+        """Пакет source принят в пул draw_id."""
+        st = self._draws.get(draw_id)
+        if st is None:
+            st = self._draws[draw_id] = _Pending()
+        st.source = source
+        st.merged += 1
+        if st.timer is not None:
+            return                          # хвост уже запланирован — он и отправит
+        loop = asyncio.get_running_loop()
+        wait = st.last + self.interval - loop.time()
+        if wait <= 0:
+            await self._emit(draw_id, st)
+        else:
+            st.timer = loop.call_later(wait, self._fire, draw_id, st)
+
+    def _fire(self, draw_id: str, st: _Pending):
+        st.timer = None
+        if self._draws.get(draw_id) is st and st.merged:
+            st.task = asyncio.create_task(self._emit(draw_id, st))
+
+    async def _emit(self, draw_id: str, st: _Pending):
+        st.last = asyncio.get_running_loop().time()
+        merged, st.merged = st.merged, 0
+        await hub.emit(draw_id, {
+            "type": "loc.progress", "drawId": draw_id, "source": st.source,
+            "bytesTotal": bytes_total(draw_id), "packets": packet_count(draw_id),
+            "rootHex": root_hex(draw_id), "health": health(draw_id), "coalesced": merged,
+        })
+
+    async def flush(self, draw_id: str):
+        """Отправить отложенный хвост сейчас (перед collect.close / смешиванием — финальный корень)."""
+        st = self._draws.get(draw_id)
+        if st is None or not st.merged:
+            return
+        if st.timer is not None:
+            st.timer.cancel()
+            st.timer = None
+        await self._emit(draw_id, st)
+
+    def discard(self, draw_id: str):
+        st = self._draws.pop(draw_id, None)
+        if st is not None and st.timer is not None:
+            st.timer.cancel()
+
+    def __len__(self) -> int:
+        return len(self._draws)
+
+progress = ProgressCoalescer(settings.LOC_PROGRESS_MAX_HZ)
@@ -0,0 +1,228 @@
+# services/registry.py
+import asyncio, time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+from blake3 import blake3
+from services.health import SourceHealth
+from settings import settings
+
+# жизненный цикл тиража
+OPEN, COLLECTING, MIXED, CLOSED = "open", "collecting", "mixed", "closed"
+_ACCEPTING = (OPEN, COLLECTING)
+
+_EMPTY_ROOT = blake3().digest()
+
+class DrawStateError(ValueError):
+    status_code = 409
+
+class UnknownDrawError(DrawStateError):
+    status_code = 404
+
+class DrawLimitError(DrawStateError):
+    status_code = 413
+
+class DrawCapacityError(DrawStateError):
+    """Все слоты реестра заняты идущими тиражами."""
+    status_code = 503
+
+class DrawState:
+    """
+    Компактное состояние одного тиража: бегущий BLAKE3 поверх конкатенации
+    пакетов локальной энтропии, счётчики, статус и блокировка.
+    """
+    __slots__ = ("draw_id", "status", "hasher", "bytes_total", "packet_count",
+                 "_root", "created", "touched", "_lock", "health")
+
+    def __init__(self, draw_id: str):
+        self.draw_id = draw_id
+        self.status = OPEN
+        self.hasher = blake3()
+        self.bytes_total = 0
+        self.packet_count = 0
+        self._root: Optional[bytes] = None
+        self.created = self.touched = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+        self.health: Optional[Dict[str, SourceHealth]] = None   # источник → health-тесты
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # создаём лениво: большинству тиражей (авто) конкурентный доступ не нужен
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def add(self, data: bytes):
+        self.hasher.update(data)
+        self.bytes_total += len(data)
+        self.packet_count += 1
+        self._root = None
+
+    def source_health(self, source: str) -> SourceHealth:
+        if self.health is None:
+            self.health = {}
+        h = self.health.get(source)
+        if h is None:
+            h = self.health[source] = SourceHealth(source)
+        return h
+
+    def root(self) -> bytes:
+        # digest() не финализирует состояние — снимок без копирования; кешируем до следующего пакета
+        if self._root is None:
+            self._root = self.hasher.digest()
+        return self._root
+
+class DrawRegistry:
+    """
+    Единый реестр состояний тиражей: open → collecting → mixed → closed.
+    Лимиты по байтам (на тираж и суммарно), число активных тиражей,
+    выселение простаивающих и закрытых по TTL.
+    """
+
+    def __init__(self, idle_ttl_s: float, closed_ttl_s: float,
+                 max_draw_bytes: int, max_total_bytes: int, max_active: int):
+        self.idle_ttl_s = idle_ttl_s
+        self.closed_ttl_s = closed_ttl_s
+        self.max_draw_bytes = max_draw_bytes
+        self.max_total_bytes = max_total_bytes
+        self.max_active = max(1, max_active)
+        self._current: Optional[str] = None
+        # слушатель смены текущего тиража (кластер рассылает его остальным воркерам)
+        self.on_current: Optional[Callable[[Optional[str]], None]] = None
+        self.total_bytes = 0
+        self._draws: "OrderedDict[str, DrawState]" = OrderedDict()   # порядок = давность активности
+        self._next_sweep = 0.0
+
+    @property
+    def current(self) -> Optional[str]:
+        return self._current
+
+    @current.setter
+    def current(self, draw_id: Optional[str]):
+        changed = draw_id != self._current
+        self._current = draw_id
+        if changed and self.on_current is not None:
+            self.on_current(draw_id)
+
+    def __len__(self) -> int:
+        return len(self._draws)
+
+    def _touch(self, st: DrawState):
+        st.touched = time.monotonic()
+        self._draws.move_to_end(st.draw_id)
+
+    def _drop(self, draw_id: str) -> Optional[DrawState]:
+        st = self._draws.pop(draw_id, None)
+        if st is not None and st.status != CLOSED:
+            self.total_bytes -= st.bytes_total
+        return st
+
+    def sweep(self, force: bool = False):
+        """Выселить закрытые/простаивающие тиражи (не чаще раза в секунду без force)."""
+        now = time.monotonic()
+        if not force and now < self._next_sweep:
+            return
+        self._next_sweep = now + 1.0
+        for draw_id, st in list(self._draws.items()):
+            ttl = self.closed_ttl_s if st.status == CLOSED else self.idle_ttl_s
+            if now - st.touched >= ttl and not (st._lock and st._lock.locked()):
+                self._drop(draw_id)
+
+    def open(self, draw_id: str) -> DrawState:
+        """
+        Новый тираж. Закрытое состояние с тем же id заменяется; активное (идёт тираж) —
+        DrawStateError (409): иначе второй запуск обнулил бы пул первого.
+        """
+        self.sweep()
+        old = self._draws.get(draw_id)
+        if old is not None and old.status != CLOSED:
+            raise DrawStateError(f"draw {draw_id} is already {old.status}")
+        self._drop(draw_id)
+        if len(self._draws) >= self.max_active:
+            # вытесняем только закрытые и простаивающие (давно неактивные первыми): идущий
+            # тираж, потеряв состояние, упал бы посреди работы
+            self.sweep(force=True)
+            for old_id in [d for d, o in self._draws.items() if o.status == CLOSED]:
+                if len(self._draws) < self.max_active:
+                    break
+                self._drop(old_id)
+            if len(self._draws) >= self.max_active:
+                raise DrawCapacityError(f"too many active draws (max {self.max_active})")
+        st = self._draws[draw_id] = DrawState(draw_id)
+        return st
+
+    def get(self, draw_id: str) -> Optional[DrawState]:
+        self.sweep()
+        return self._draws.get(draw_id)
+
+    def require(self, draw_id: str) -> DrawState:
+        st = self.get(draw_id)
+        if st is None:
+            raise UnknownDrawError(f"unknown draw: {draw_id}")
+        return st
+
+    def add(self, draw_id: str, data: bytes, source: Optional[str] = None) -> DrawState:
+        """
+        Пакет в пул тиража. С source пакет сначала проходит health-тесты источника
+        (EntropyHealthError — не принят).
+        """
+        st = self.require(draw_id)
+        if st.status not in _ACCEPTING:
+            raise DrawStateError(f"draw {draw_id} is {st.status}, entropy is no longer accepted")
+        n = len(data)
+        if st.bytes_total + n > self.max_draw_bytes:
+            raise DrawLimitError(f"draw entropy limit exceeded ({self.max_draw_bytes} bytes)")
+        if self.total_bytes + n > self.max_total_bytes:
+            raise DrawLimitError("server entropy pool is full, try later")
+        if source is not None and settings.HEALTH_TESTS:
+            st.source_health(source).check(data)
+        st.add(data)
+        self.total_bytes += n
+        self._touch(st)
+        return st
+
+    def set_status(self, draw_id: str, status: str, owner: Optional[DrawState] = None):
+        st = self._draws.get(draw_id)
+        if st is None or st.status == CLOSED or (owner is not None and st is not owner):
+            return
+        if status == CLOSED:
+            # закрытый тираж больше не занимает бюджет байтов
+            self.total_bytes -= st.bytes_total
+        st.status = status
+        self._touch(st)
+
+    def close(self, draw_id: str, owner: Optional[DrawState] = None):
+        """owner — закрыть, только если под этим id всё ещё именно это состояние."""
+        self.set_status(draw_id, CLOSED, owner)
+
+    def discard(self, draw_id: str):
+        self._drop(draw_id)
+
+    def bytes_total(self, draw_id: str) -> int:
+        st = self._draws.get(draw_id)
+        return st.bytes_total if st else 0
+
+    def packet_count(self, draw_id: str) -> int:
+        st = self._draws.get(draw_id)
+        return st.packet_count if st else 0
+
+    def root(self, draw_id: str) -> bytes:
+        st = self._draws.get(draw_id)
+        return st.root() if st else _EMPTY_ROOT
+
+    def health(self, draw_id: str, source: Optional[str] = None) -> Optional[dict]:
+        """Отчёт health-тестов тиража: по всем источникам или по одному."""
+        st = self._draws.get(draw_id)
+        if st is None or not st.health:
+            return None
+        if source is not None:
+            h = st.health.get(source)
+            return h.report() if h else None
+        return {name: h.report() for name, h in st.health.items()}
+
+registry = DrawRegistry(
+    idle_ttl_s=settings.DRAW_IDLE_TTL_S,
+    closed_ttl_s=settings.DRAW_CLOSED_TTL_S,
+    max_draw_bytes=settings.DRAW_MAX_BYTES,
+    max_total_bytes=settings.DRAWS_MAX_BYTES,
+    max_active=settings.DRAWS_MAX_ACTIVE,
+)
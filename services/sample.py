@@ -1,6 +1,7 @@
 # services/sample.py
 from __future__ import annotations
-from typing import Tuple
+from typing import Iterable, Iterator, List, Tuple
+import numpy as np
 from blake3 import blake3
 
 TWO64 = 1 << 64
@@ -11,18 +12,29 @@ def derive_subseed(seed: bytes, label: str) -> bytes:
     h.update(b"SUB|" + label.encode("utf-8"))
     return h.digest()  # 32 байта
 
+def _u64_at(subseed: bytes, counter: int) -> int:
+    """u64 №counter потока: первые 8 байт BLAKE3(key=subseed, counter_le) как big-endian."""
+    h = blake3(key=subseed)
+    h.update(counter.to_bytes(8, "little"))
+    return int.from_bytes(h.digest()[:8], "big")
+
 def _u64_stream_from_subseed(subseed: bytes):
     """Поток u64: BLAKE3-CTR (key=subseed, data=counter_le)."""
     counter = 0
     while True:
-        h = blake3(key=subseed)
-        h.update(counter.to_bytes(8, "little"))
-        block = h.digest()  # 32B
-        # возьмём первые 8 байт как big-endian u64
-        x = int.from_bytes(block[:8], "big")
-        yield x
+        yield _u64_at(subseed, counter)
         counter += 1
 
+def _range_params(n1: int, n2: int) -> Tuple[int, int, int, int]:
+    """(lo, hi, R, t): границы, размер диапазона и порог честного модульного маппинга."""
+    lo, hi = sorted((int(n1), int(n2)))
+    R = hi - lo + 1
+    if R <= 0:
+        raise ValueError("empty range")
+    if R > TWO64:
+        raise ValueError("range size too large (>2^64)")
+    return lo, hi, R, (TWO64 // R) * R
+
 def sample_range_by_seed(seed: bytes, n1: int, n2: int, label: str = "RANGE/v1") -> Tuple[int, dict]:
     """
     Честная выборка в [lo, hi] с rejection sampling.
@@ -30,17 +42,10 @@ def sample_range_by_seed(seed: bytes, n1: int, n2: int, label: str = "RANGE/v1")
     """
     if len(seed) != 32:
         raise ValueError("seed must be 32 bytes")
-    lo, hi = sorted((int(n1), int(n2)))
-    R = hi - lo + 1
-    if R <= 0:
-        raise ValueError("empty range")
-    if R > TWO64:
-        raise ValueError("range size too large (>2^64)")
+    lo, hi, R, t = _range_params(n1, n2)
 
     subseed = derive_subseed(seed, label)
     gen = _u64_stream_from_subseed(subseed)
-    # порог для честного модульного маппинга
-    t = (TWO64 // R) * R
 
     attempts = 0
     rejected = 0
@@ -57,3 +62,55 @@ def sample_range_by_seed(seed: bytes, n1: int, n2: int, label: str = "RANGE/v1")
             }
             return value, meta
         rejected += 1
+
+def validate_range_specs(specs: Iterable[Tuple[int, int, str]]) -> List[Tuple[int, int, int, int, str]]:
+    """Проверка всех спецификаций заранее (до начала стриминга): [(lo, hi, R, t, label)]."""
+    return [(*_range_params(n1, n2), label) for n1, n2, label in specs]
+
+def sample_range_batch(seed: bytes, specs: List[Tuple[int, int, int, int, str]],
+                       block: int = 4096) -> Iterator[dict]:
+    """
+    Пакетная выборка: то же, что sample_range_by_seed для каждой (n1, n2, label),
+    но блоками — под-сиды через копию keyed-хешера, первая попытка для всего блока
+    проверяется/маппится векторно (uint64), повторные попытки — только для отвергнутых.
+    Значения и поля элемента совпадают с одиночным вызовом (meta + index, value) —
+    каждый элемент проверяется независимо.
+    """
+    if len(seed) != 32:
+        raise ValueError("seed must be 32 bytes")
+    base = blake3(key=seed)
+    for b0 in range(0, len(specs), block):
+        part = specs[b0:b0 + block]
+        subseeds = []
+        for *_x, label in part:
+            h = base.copy()
+            h.update(b"SUB|" + label.encode("utf-8"))
+            subseeds.append(h.digest())
+
+        xs = np.fromiter((_u64_at(s, 0) for s in subseeds), dtype=np.uint64, count=len(part))
+        # 2^64 в uint64 не влезает: при t = 2^64 (R — степень двойки) берём всё,
+        # при R = 2^64 ещё и x % R = x
+        take_all = np.fromiter((t == TWO64 for *_x, t, _l in part), dtype=bool, count=len(part))
+        full = np.fromiter((R == TWO64 for _lo, _hi, R, _t, _l in part), dtype=bool, count=len(part))
+        rs = np.fromiter((1 if R == TWO64 else R for _lo, _hi, R, _t, _l in part), dtype=np.uint64, count=len(part))
+        ts = np.fromiter((0 if t == TWO64 else t for *_x, t, _l in part), dtype=np.uint64, count=len(part))
+        ok = take_all | (xs < ts)
+        offs = np.where(full, xs, xs % rs)
+
+        for i, (lo, hi, R, t, label) in enumerate(part):
+            attempts, x, off = 1, int(xs[i]), int(offs[i])
+            if not ok[i]:
+                # редкий путь: досэмплируем как в одиночном вызове
+                while True:
+                    x = _u64_at(subseeds[i], attempts)
+                    attempts += 1
+                    if x < t:
+                        off = x % R
+                        break
+            yield {
+                "index": b0 + i, "value": lo + off,
+                "lo": lo, "hi": hi, "rangeSize": R,
+                "attempts": attempts, "rejected": attempts - 1,
+                "label": label, "subseedHex": subseeds[i].hex(),
+                "threshold": str(t), "xUsed": str(x),
+            }
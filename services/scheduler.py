@@ -0,0 +1,146 @@
+# services/scheduler.py
+"""
+Авто-тиражи по сетке настенного времени: старты в моменты k * interval от эпохи,
+draw_id = auto-<мс старта>. Период не зависит от длительности тиража (нет дрейфа),
+а после перезапуска или смены лидера ритм и id продолжаются с той же сетки.
+"""
+import asyncio, math, time
+from typing import Awaitable, Callable, Optional
+
+from fastapi.responses import Response
+
+from settings import settings
+from streams import hub
+from services.store import set_current_draw
+
+RunDraw = Callable[[str], Awaitable[object]]
+
+class DrawScheduler:
+    def __init__(self, interval_s: float = 10.0, announce_s: float = 2.0, missed: str = "skip",
+                 catchup_max: int = 3, draw_timeout_s: float = 0.0):
+        self.interval_s = max(0.5, interval_s)
+        self.announce_s = min(max(0.0, announce_s), self.interval_s)
+        self.missed = missed
+        self.catchup_max = max(0, catchup_max)
+        # общий дедлайн: тираж не должен наезжать на следующий тик
+        self.draw_timeout_s = draw_timeout_s if draw_timeout_s > 0 else self.interval_s * 0.9
+        self._task: Optional[asyncio.Task] = None
+        self.next_at: Optional[float] = None
+        self._behind = 0   # подряд догнанных тиков
+        self.stats = {
+            "runs": 0, "ok": 0, "failed": 0, "timeouts": 0,
+            "skipped": 0, "caughtUp": 0,
+            "lastLatenessMs": None, "maxLatenessMs": 0.0,
+            "lastDurationMs": None, "avgDurationMs": None, "maxDurationMs": 0.0,
+            "lastDrawId": None, "lastOutcome": None,
+        }
+
+    def _tick_after(self, t: float) -> float:
+        return math.ceil(t / self.interval_s) * self.interval_s
+
+    @staticmethod
+    def draw_id_for(t: float) -> str:
+        return f"auto-{int(round(t * 1000))}"
+
+    def start(self, run: RunDraw):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop(run))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    @staticmethod
+    async def _sleep_until(t: float):
+        delay = t - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _loop(self, run: RunDraw):
+        t = self._tick_after(time.time() + self.announce_s)
+        while True:
+            self.next_at = t
+            draw_id = self.draw_id_for(t)
+            # анонс заранее: клиенты подписываются на поток тиража до commit
+            await self._sleep_until(t - self.announce_s)
+            await hub.emit("__current__", {
+                "type": "next", "drawId": draw_id,
+                "startsAt": int(round(t * 1000)), "intervalMs": int(self.interval_s * 1000),
+            })
+            await self._sleep_until(t)
+            await self._run_one(run, draw_id, t)
+            t = self._advance(t)
+
+    async def _run_one(self, run: RunDraw, draw_id: str, t: float):
+        started = time.time()
+        lateness_ms = (started - t) * 1000.0
+        st = self.stats
+        st["runs"] += 1
+        st["lastDrawId"] = draw_id
+        st["lastLatenessMs"] = round(lateness_ms, 1)
+        st["maxLatenessMs"] = max(st["maxLatenessMs"], st["lastLatenessMs"])
+        try:
+            # Сначала объявим текущий ID, чтобы клиенты успели подписаться на SSE до первых событий
+            set_current_draw(draw_id)
+            await hub.emit("__current__", {"type": "current", "drawId": draw_id})
+            async with asyncio.timeout(self.draw_timeout_s):
+                res = await run(draw_id)
+            if isinstance(res, Response) and res.status_code >= 400:
+                outcome = "timeout" if res.status_code == 504 else "failed"
+            else:
+                outcome = "ok"
+                print(f'[{draw_id}] generate finished.')
+        except TimeoutError:
+            outcome = "timeout"
+            print(f"auto-draw {draw_id}: exceeded {self.draw_timeout_s:g}s deadline")
+        except Exception as e:
+            # Логируем и продолжаем цикл, чтобы не останавливать генератор
+            outcome = "failed"
+            print("auto-draw error:", e)
+        dur_ms = (time.time() - started) * 1000.0
+        st[{"ok": "ok", "failed": "failed", "timeout": "timeouts"}[outcome]] += 1
+        st["lastOutcome"] = outcome
+        st["lastDurationMs"] = round(dur_ms, 1)
+        st["maxDurationMs"] = max(st["maxDurationMs"], st["lastDurationMs"])
+        avg = st["avgDurationMs"]
+        st["avgDurationMs"] = round(dur_ms if avg is None else avg * 0.9 + dur_ms * 0.1, 1)
+
+    def _advance(self, t: float) -> float:
+        """Следующий тик после t с учётом пропусков (тираж/процесс мог не уложиться в интервал)."""
+        nxt = t + self.interval_s
+        now = time.time()
+        if now <= nxt:
+            self._behind = 0
+            return nxt
+        if self.missed == "catchup" and self._behind < self.catchup_max:
+            # просроченный тик запускаем сразу со своим id; подряд — не больше catchup_max
+            self._behind += 1
+            self.stats["caughtUp"] += 1
+            return nxt
+        self._behind = 0
+        self.stats["skipped"] += int((now - nxt) // self.interval_s) + 1
+        return self._tick_after(now)
+
+    def snapshot(self) -> dict:
+        nxt = self.next_at
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "intervalMs": int(self.interval_s * 1000),
+            "policy": self.missed,
+            "drawTimeoutMs": int(self.draw_timeout_s * 1000),
+            "next": None if nxt is None else {"drawId": self.draw_id_for(nxt), "startsAt": int(round(nxt * 1000))},
+            **self.stats,
+        }
+
+scheduler = DrawScheduler(
+    interval_s=settings.AUTO_INTERVAL_S,
+    announce_s=settings.AUTO_ANNOUNCE_S,
+    missed=settings.AUTO_MISSED,
+    catchup_max=settings.AUTO_CATCHUP_MAX,
+    draw_timeout_s=settings.AUTO_DRAW_TIMEOUT_S,
+)
@@ -0,0 +1,197 @@
+# services/segments.py
+import gzip, os, re, time
+from collections import OrderedDict
+from typing import IO, Callable, Iterator, List, Optional, Tuple
+
+_SEG_RE = re.compile(r"^(\d{8})\.seg(\.gz)?$")
+
+class SegmentLog:
+    """
+    Append-only журнал записей в катящихся сегментах: одна компактная JSON-строка на запись.
+    Активный сегмент — NNNNNNNN.seg (дописываем), запечатанные — .seg или .seg.gz (сжатые).
+    Адрес записи — (номер сегмента, смещение в несжатом потоке, длина).
+    """
+
+    def __init__(self, root: str, segment_bytes: int = 4 << 20, compress: bool = True,
+                 fsync_every: int = 1, cache_segments: int = 2,
+                 on_fsync: Optional[Callable[[float], None]] = None):
+        self.root = root
+        self.segment_bytes = max(1024, segment_bytes)
+        self.compress = compress
+        self.fsync_every = max(0, fsync_every)
+        self.cache_segments = max(1, cache_segments)
+        self.on_fsync = on_fsync   # длительность fsync записи/запечатывания (метрики)
+        self._active: Optional[IO[bytes]] = None
+        self._active_no = 0
+        self._unsynced = 0
+        # распакованные запечатанные сегменты (чтение сжатых идёт целиком)
+        self._cache: "OrderedDict[int, bytes]" = OrderedDict()
+
+    # ——— каталог сегментов
+
+    def _file(self, no: int, sealed_gz: bool = False) -> str:
+        return os.path.join(self.root, f"{no:08d}.seg" + (".gz" if sealed_gz else ""))
+
+    def segments(self) -> List[Tuple[int, str, bool]]:
+        """[(номер, путь, сжат)] по возрастанию номера."""
+        if not os.path.isdir(self.root):
+            return []
+        out = []
+        for name in os.listdir(self.root):
+            m = _SEG_RE.match(name)
+            if m:
+                out.append((int(m.group(1)), os.path.join(self.root, name), bool(m.group(2))))
+        return sorted(out)
+
+    @property
+    def active_no(self) -> int:
+        """Номер активного сегмента (открывает/восстанавливает его при необходимости)."""
+        self._open_active()
+        return self._active_no
+
+    def sealed(self) -> List[Tuple[int, str, bool]]:
+        """Запечатанные сегменты — все, кроме активного."""
+        active = self.active_no
+        return [s for s in self.segments() if s[0] != active]
+
+    def _open_active(self) -> IO[bytes]:
+        if self._active is not None:
+            return self._active
+        os.makedirs(self.root, exist_ok=True)
+        segs = self.segments()
+        last = segs[-1] if segs else None
+        if last and not last[2] and os.path.getsize(last[1]) < self.segment_bytes:
+            # продолжаем последний несжатый; хвост после сбоя (без '\n') отрезаем
+            self._active_no = last[0]
+            self._truncate_torn_tail(last[1])
+        else:
+            self._active_no = (last[0] + 1) if last else 1
+        self._active = open(self._file(self._active_no), "ab")
+        return self._active
+
+    @staticmethod
+    def _truncate_torn_tail(path: str):
+        with open(path, "rb+") as f:
+            data = f.read()
+            keep = data.rfind(b"\n") + 1
+            if keep != len(data):
+                f.truncate(keep)
+                f.flush()
+                os.fsync(f.fileno())
+
+    # ——— запись
+
+    def _fsync(self, f: IO[bytes]):
+        t0 = time.perf_counter()
+        os.fsync(f.fileno())
+        if self.on_fsync is not None:
+            self.on_fsync(time.perf_counter() - t0)
+
+    def append(self, line: bytes) -> Tuple[int, int, int]:
+        """Дописать запись (без '\\n'); вернёт (сегмент, смещение, длина)."""
+        f = self._open_active()
+        off = f.tell()
+        f.write(line + b"\n")
+        f.flush()
+        self._unsynced += 1
+        if self.fsync_every and self._unsynced >= self.fsync_every:
+            self._fsync(f)
+            self._unsynced = 0
+        loc = (self._active_no, off, len(line))
+        if off + len(line) + 1 >= self.segment_bytes:
+            self.seal_active()
+        return loc
+
+    def seal_active(self) -> Optional[int]:
+        """Закрыть активный сегмент (и сжать, если включено). Вернёт его номер."""
+        if self._active is None:
+            return None
+        no, f = self._active_no, self._active
+        self._active = None
+        self._fsync(f)
+        f.close()
+        self._unsynced = 0
+        if self.compress:
+            src = self._file(no)
+            dst = self._file(no, sealed_gz=True)
+            tmp = dst + ".tmp"
+            with open(src, "rb") as fi, open(tmp, "wb") as fo:
+                with gzip.GzipFile(fileobj=fo, mode="wb", mtime=0) as gz:
+                    gz.write(fi.read())
+                fo.flush()
+                os.fsync(fo.fileno())
+            os.replace(tmp, dst)
+            os.remove(src)
+        # сразу открываем следующий активный сегмент
+        self._active_no = no + 1
+        self._active = open(self._file(self._active_no), "ab")
+        return no
+
+    def close(self):
+        if self._active is not None:
+            self._active.flush()
+            os.fsync(self._active.fileno())
+            self._active.close()
+            self._active = None
+
+    # ——— чтение
+
+    def _sealed_bytes(self, no: int, path: str, cache: bool = True) -> bytes:
+        data = self._cache.get(no)
+        if data is None:
+            with gzip.open(path, "rb") as f:
+                data = f.read()
+            if not cache:
+                return data
+            self._cache[no] = data
+            while len(self._cache) > self.cache_segments:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(no)
+        return data
+
+    def read(self, no: int, off: int, length: int) -> Optional[bytes]:
+        gz = self._file(no, sealed_gz=True)
+        if os.path.exists(gz):
+            return self._sealed_bytes(no, gz)[off:off + length]
+        path = self._file(no)
+        if not os.path.exists(path):
+            return None
+        if self._active is not None and no == self._active_no:
+            self._active.flush()
+        with open(path, "rb") as f:
+            f.seek(off)
+            return f.read(length)
+
+    def scan(self, no: int, path: str, gz: bool, cache: bool = True) -> Iterator[Tuple[int, bytes]]:
+        """
+        Все записи сегмента: (смещение, строка без '\\n'). Недописанный хвост пропускаем.
+        cache=False — разовый проход (компакция): горячие сегменты из кэша не вытесняем.
+        """
+        if gz:
+            data = self._sealed_bytes(no, path, cache)
+        else:
+            if self._active is not None and no == self._active_no:
+                self._active.flush()
+            with open(path, "rb") as f:
+                data = f.read()
+        off = 0
+        while True:
+            end = data.find(b"\n", off)
+            if end < 0:
+                return
+            yield off, data[off:end]
+            off = end + 1
+
+    def size(self, no: int, path: str, gz: bool) -> int:
+        """Несжатый размер сегмента (сжатый распаковывается — для горячего пути есть индекс)."""
+        return len(self._sealed_bytes(no, path, cache=False)) if gz else os.path.getsize(path)
+
+    def drop(self, no: int):
+        """Удалить запечатанный сегмент целиком (ретенция/компакция)."""
+        if self._active is not None and no == self._active_no:
+            raise ValueError("cannot drop the active segment")
+        self._cache.pop(no, None)
+        for p in (self._file(no), self._file(no, sealed_gz=True)):
+            if os.path.exists(p):
+                os.remove(p)
@@ -1,9 +1,29 @@
 # services/store.py
-import os, json, tempfile, time
-from typing import Any, Dict, List, Optional
+import os, json, sqlite3, tempfile, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from blake3 import blake3
+from settings import settings
+from services.registry import registry
+from services.segments import SegmentLog
+from services.metrics import store_fsync_seconds, store_save_seconds
 
 STORE_DIR = os.environ.get("STORE_DIR", "./storage/draws")
-CURRENT_DRAW_ID: Optional[str] = None
+INDEX_NAME = "index.sqlite3"
+SEGMENTS_NAME = "segments"
+_INDEX_VERSION = 3
+
+_DB: Optional[sqlite3.Connection] = None
+_LOG: Optional[SegmentLog] = None
+_LOCK = threading.Lock()
+# сопровождение сегментов (ретенция/компакция) идёт в фоне; не больше одного прохода за раз
+_MAINT = threading.Lock()
+
+# LRU готовых тел снимков: drawId -> (байты как на диске, strong ETag, версия на диске — см. _stamp)
+_BODIES: "OrderedDict[str, Tuple[bytes, str, tuple]]" = OrderedDict()
+_BODIES_BYTES = 0
+# тела читаются из пула потоков (api.history, verify) — LRU под своей блокировкой, не _LOCK
+_BODIES_LOCK = threading.Lock()
 
 def _ensure_dir():
     os.makedirs(STORE_DIR, exist_ok=True)
@@ -11,51 +31,450 @@ def _ensure_dir():
 def _path(draw_id: str) -> str:
     return os.path.join(STORE_DIR, f"{draw_id}.json")
 
+def _segmented() -> bool:
+    return settings.STORE_BACKEND == "segments"
+
+def _log() -> SegmentLog:
+    global _LOG
+    if _LOG is None:
+        _LOG = SegmentLog(
+            os.path.join(STORE_DIR, SEGMENTS_NAME),
+            segment_bytes=settings.STORE_SEGMENT_BYTES,
+            compress=settings.STORE_SEGMENT_COMPRESS,
+            fsync_every=settings.STORE_FSYNC_EVERY,
+            on_fsync=store_fsync_seconds.labels("segments").observe,
+        )
+    return _LOG
+
+def _summary(j: Dict[str, Any]) -> Dict[str, Any]:
+    """Строка листинга истории из полного снимка."""
+    return {
+        "drawId": j["drawId"],
+        "createdAt": j.get("createdAt"),
+        "sources": list((j.get("sources") or {}).keys()),
+        "numberU64": (j.get("result") or {}).get("u64"),
+    }
+
+# ——— индекс истории (SQLite рядом со снимками); для сегментов хранит ещё и адрес записи
+
+def _db() -> sqlite3.Connection:
+    """Соединение с индексом; при первом открытии (или после смены схемы) строим его по каталогу."""
+    global _DB
+    if _DB is None:
+        _ensure_dir()
+        db = sqlite3.connect(os.path.join(STORE_DIR, INDEX_NAME), check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        if db.execute("PRAGMA user_version").fetchone()[0] != _INDEX_VERSION:
+            db.execute("DROP TABLE IF EXISTS draws")
+            db.execute("DROP TABLE IF EXISTS segments")
+        db.execute("""CREATE TABLE IF NOT EXISTS draws (
+            draw_id TEXT PRIMARY KEY,
+            created_at INTEGER NOT NULL,
+            sources TEXT NOT NULL,
+            u64 TEXT,
+            seg INTEGER,
+            off INTEGER,
+            len INTEGER
+        )""")
+        db.execute("CREATE INDEX IF NOT EXISTS draws_created ON draws (created_at DESC, draw_id DESC)")
+        db.execute("CREATE INDEX IF NOT EXISTS draws_seg ON draws (seg)")
+        # учёт сегментов: несжатый объём и сколько из него — живые записи (решения компакции
+        # без распаковки .gz); ведётся вместе с draws в одной транзакции
+        db.execute("""CREATE TABLE IF NOT EXISTS segments (
+            seg INTEGER PRIMARY KEY,
+            bytes INTEGER NOT NULL,
+            live INTEGER NOT NULL
+        )""")
+        # статус перепроверки (services.verify); etag — снимок, который проверяли
+        db.execute("""CREATE TABLE IF NOT EXISTS verify (
+            draw_id TEXT PRIMARY KEY,
+            etag TEXT NOT NULL,
+            ok INTEGER NOT NULL,
+            checked_at INTEGER NOT NULL,
+            errors TEXT
+        )""")
+        _DB = db
+        if db.execute("PRAGMA user_version").fetchone()[0] != _INDEX_VERSION:
+            _rebuild(db)
+    return _DB
+
+def _seg_grow(db: sqlite3.Connection, seg: int, nbytes: int, live: int):
+    db.execute(
+        "INSERT INTO segments (seg, bytes, live) VALUES (?, ?, ?)"
+        " ON CONFLICT (seg) DO UPDATE SET bytes = bytes + excluded.bytes, live = live + excluded.live",
+        (seg, nbytes, live),
+    )
+
+def _unlink(db: sqlite3.Connection, draw_id: str):
+    """Прежняя запись draw_id в сегменте больше не живая (перезапись или перенос)."""
+    row = db.execute("SELECT seg, len FROM draws WHERE draw_id = ?", (draw_id,)).fetchone()
+    if row and row[0] is not None:
+        db.execute("UPDATE segments SET live = live - ? WHERE seg = ?", (row[1] + 1, row[0]))
+
+def _upsert(db: sqlite3.Connection, item: Dict[str, Any], loc: Optional[Tuple[int, int, int]] = None):
+    seg, off, length = loc or (None, None, None)
+    _unlink(db, item["drawId"])
+    if seg is not None:
+        _seg_grow(db, seg, length + 1, length + 1)
+    db.execute(
+        "INSERT OR REPLACE INTO draws (draw_id, created_at, sources, u64, seg, off, len)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (item["drawId"], item["createdAt"] or 0, json.dumps(item["sources"]), item["numberU64"],
+         seg, off, length),
+    )
+
+def _rebuild(db: sqlite3.Connection) -> int:
+    n = 0
+    with db:
+        db.execute("DELETE FROM draws")
+        db.execute("DELETE FROM segments")
+        for name in os.listdir(STORE_DIR):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(STORE_DIR, name), "r", encoding="utf-8") as f:
+                    _upsert(db, _summary(json.load(f)))
+                n += 1
+            except Exception:
+                continue
+        # сегменты поверх файлов: более поздняя запись того же drawId побеждает
+        log = _log()
+        for no, path, gz in log.segments():
+            for off, line in log.scan(no, path, gz):
+                try:
+                    _upsert(db, _summary(json.loads(line)), (no, off, len(line)))
+                    n += 1
+                except Exception:
+                    _seg_grow(db, no, len(line) + 1, 0)   # битая строка — мёртвый объём
+        db.execute(f"PRAGMA user_version={_INDEX_VERSION}")
+    return n
+
+def rebuild_index() -> int:
+    """Пересобрать индекс по существующим *.json и сегментам. Вернёт число записей."""
+    with _LOCK:
+        return _rebuild(_db())
+
+def encode_cursor(item: Dict[str, Any]) -> str:
+    return f"{item.get('createdAt') or 0}:{item['drawId']}"
+
+def _decode_cursor(cursor: str) -> Tuple[int, str]:
+    ts, _, draw_id = cursor.partition(":")
+    return int(ts), draw_id
+
+# ——— сопровождение сегментов: ретенция, компакция, миграция
+
+def _apply_retention(db: sqlite3.Connection, days: int) -> int:
+    """Удалить запечатанные сегменты, все записи которых старше days. Вернёт число сегментов."""
+    if days <= 0:
+        return 0
+    cutoff = int(time.time() * 1000) - days * 86_400_000
+    log, dropped = _log(), 0
+    for no, _path_, _gz in log.sealed():
+        newest = db.execute("SELECT MAX(created_at) FROM draws WHERE seg = ?", (no,)).fetchone()[0]
+        if newest is None or newest < cutoff:
+            with db:
+                # статусы перепроверки удалённых тиражей — туда же
+                db.execute("DELETE FROM verify WHERE draw_id IN (SELECT draw_id FROM draws WHERE seg = ?)", (no,))
+                db.execute("DELETE FROM draws WHERE seg = ?", (no,))
+                db.execute("DELETE FROM segments WHERE seg = ?", (no,))
+            log.drop(no)
+            dropped += 1
+    if dropped:
+        _clear_bodies()
+    return dropped
+
+def _sparse_segments(db: sqlite3.Connection, min_live_ratio: float) -> List[int]:
+    """Запечатанные сегменты, где доля живых записей ниже порога, — только по индексу."""
+    rows = db.execute("SELECT seg FROM segments WHERE seg != ? AND live < ? * bytes ORDER BY seg",
+                      (_log().active_no, min_live_ratio)).fetchall()
+    return [r[0] for r in rows]
+
+def _compact_segment(db: sqlite3.Connection, no: int):
+    """Переписать живые записи сегмента no в активный и удалить его."""
+    log = _log()
+    seg = next((s for s in log.sealed() if s[0] == no), None)
+    if seg is None:
+        return
+    rows = db.execute("SELECT off, draw_id FROM draws WHERE seg = ?", (no,)).fetchall()
+    live = dict(rows)
+    with db:
+        if live:
+            for off, line in log.scan(*seg, cache=False):
+                draw_id = live.get(off)
+                if draw_id is None:
+                    continue
+                loc = log.append(line)
+                _seg_grow(db, loc[0], loc[2] + 1, loc[2] + 1)
+                db.execute("UPDATE draws SET seg = ?, off = ?, len = ? WHERE draw_id = ?", (*loc, draw_id))
+        db.execute("DELETE FROM segments WHERE seg = ?", (no,))
+    log.drop(no)
+
+def _compact(db: sqlite3.Connection, min_live_ratio: float) -> int:
+    """Переписать живые записи из «разреженных» сегментов в активный и удалить их. Вернёт число сегментов."""
+    sparse = _sparse_segments(db, min_live_ratio)
+    for no in sparse:
+        _compact_segment(db, no)
+    return len(sparse)
+
+def apply_retention() -> int:
+    with _LOCK:
+        return _apply_retention(_db(), settings.STORE_RETENTION_DAYS)
+
+def compact() -> int:
+    with _LOCK:
+        return _compact(_db(), settings.STORE_COMPACT_RATIO)
+
+def _maintain():
+    """
+    Фоновый проход после запечатывания сегмента. _LOCK берётся на шаг (ретенция, один
+    сегмент компакции), а не на весь проход — запись и чтение тиражей идут между шагами.
+    """
+    try:
+        apply_retention()
+        with _LOCK:
+            sparse = _sparse_segments(_db(), settings.STORE_COMPACT_RATIO)
+        for no in sparse:
+            with _LOCK:
+                _compact_segment(_db(), no)
+    finally:
+        _MAINT.release()
+
+def _schedule_maintenance():
+    # проход уже идёт — он же подберёт и этот сегмент
+    if _MAINT.acquire(blocking=False):
+        threading.Thread(target=_maintain, name="store-maintenance", daemon=True).start()
+
+def migrate_files_to_segments(remove_json: bool = False) -> int:
+    """Перенести storage/draws/*.json в сегменты (старые первыми). Вернёт число перенесённых."""
+    with _LOCK:
+        db, log = _db(), _log()
+        records = []
+        for name in os.listdir(STORE_DIR):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(STORE_DIR, name), "r", encoding="utf-8") as f:
+                    records.append((name, json.load(f)))
+            except Exception:
+                continue
+        records.sort(key=lambda r: r[1].get("createdAt") or 0)
+        moved = 0
+        for name, rec in records:
+            row = db.execute("SELECT seg FROM draws WHERE draw_id = ?", (rec["drawId"],)).fetchone()
+            if row is None or row[0] is None:
+                line = json.dumps(rec, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                with db:
+                    _upsert(db, _summary(rec), log.append(line))
+                moved += 1
+            if remove_json:
+                os.remove(os.path.join(STORE_DIR, name))
+        log.close()
+        return moved
+
+# ——— API хранилища
+
 def save_draw(record: Dict[str, Any]) -> None:
-    """Атомарная запись JSON-снимка тиража."""
+    """Запись снимка тиража (+ инкрементально обновляем индекс)."""
     _ensure_dir()
+    t0 = time.perf_counter()
     draw_id = record["drawId"]
     record.setdefault("createdAt", int(time.time() * 1000))
-    tmp_fd, tmp_path = tempfile.mkstemp(dir=STORE_DIR, prefix=f".{draw_id}.", suffix=".tmp")
-    with os.fdopen(tmp_fd, "w", encoding="utf-8") as f:
-        json.dump(record, f, ensure_ascii=False, indent=2)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp_path, _path(draw_id))
+    if _segmented():
+        # одна компактная строка в конец сегмента: без temp-файла, rename и лишних inode
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        with _LOCK:
+            db, log = _db(), _log()
+            seg_before = log.active_no
+            loc = log.append(line)
+            with db:
+                _upsert(db, _summary(record), loc)
+            sealed = log.active_no != seg_before
+        if sealed:
+            # сегмент запечатан — самое время для ретенции/компакции, но не в этом запросе
+            _schedule_maintenance()
+    else:
+        # атомарная запись JSON-файла
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=STORE_DIR, prefix=f".{draw_id}.", suffix=".tmp")
+        with os.fdopen(tmp_fd, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+            f.flush()
+            with store_fsync_seconds.labels("files").time():
+                os.fsync(f.fileno())
+        os.replace(tmp_path, _path(draw_id))
+        with _LOCK:
+            db = _db()
+            with db:
+                _upsert(db, _summary(record))
+    _forget_body(draw_id)
+    store_save_seconds.labels(settings.STORE_BACKEND).observe(time.perf_counter() - t0)
     # обновим текущий draw id
-    global CURRENT_DRAW_ID
-    CURRENT_DRAW_ID = draw_id
+    registry.current = draw_id
 
-def load_draw(draw_id: str) -> Optional[Dict[str, Any]]:
-    p = _path(draw_id)
-    if not os.path.exists(p):
+def _forget_body(draw_id: str):
+    global _BODIES_BYTES
+    with _BODIES_LOCK:
+        hit = _BODIES.pop(draw_id, None)
+        if hit is not None:
+            _BODIES_BYTES -= len(hit[0])
+
+def _clear_bodies():
+    global _BODIES_BYTES
+    with _BODIES_LOCK:
+        _BODIES.clear()
+        _BODIES_BYTES = 0
+
+def _stamp(draw_id: str) -> Optional[tuple]:
+    """
+    Версия снимка на диске: (сегмент, смещение, длина) из индекса либо (mtime_ns, размер)
+    JSON-файла; None — снимка нет. Индекс и каталог общие для всех воркеров, поэтому
+    перезапись в другом процессе меняет версию и здесь.
+    """
+    if _segmented():
+        with _LOCK:
+            row = _db().execute("SELECT seg, off, len FROM draws WHERE draw_id = ?", (draw_id,)).fetchone()
+        if row and row[0] is not None:
+            return tuple(row)
+        # ещё не мигрированные JSON-файлы читаются как раньше
+    try:
+        st = os.stat(_path(draw_id))
+    except FileNotFoundError:
         return None
-    with open(p, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return st.st_mtime_ns, st.st_size
 
-def list_draws(limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
-    _ensure_dir()
-    items: List[Dict[str, Any]] = []
-    for name in os.listdir(STORE_DIR):
-        if not name.endswith(".json"):
-            continue
-        try:
-            with open(os.path.join(STORE_DIR, name), "r", encoding="utf-8") as f:
-                j = json.load(f)
-            items.append({
-                "drawId": j["drawId"],
-                "createdAt": j.get("createdAt"),
-                "sources": list((j.get("sources") or {}).keys()),
-                "numberU64": (j.get("result") or {}).get("u64"),
-            })
-        except Exception:
-            continue
-    items.sort(key=lambda x: x.get("createdAt") or 0, reverse=True)
-    return items[offset:offset+limit]
+def _read_at(draw_id: str, stamp: tuple) -> Optional[bytes]:
+    if len(stamp) == 3:
+        with _LOCK:
+            return _log().read(*stamp)
+    try:
+        with open(_path(draw_id), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def _read_draw_bytes(draw_id: str) -> Optional[bytes]:
+    stamp = _stamp(draw_id)
+    return _read_at(draw_id, stamp) if stamp is not None else None
+
+def load_draw_body(draw_id: str, cache: bool = True) -> Optional[Tuple[bytes, str]]:
+    """
+    Снимок тиража как есть (готовый JSON, без parse/encode) и его strong ETag.
+    Тела держим в LRU (лимит HISTORY_CACHE_BYTES); попадание сверяется с версией на диске
+    (_stamp), так что перезапись снимка в любом воркере его вытесняет;
+    cache=False — массовое чтение (аудит), которое не должно вытеснять горячие тела.
+    """
+    global _BODIES_BYTES
+    stamp = _stamp(draw_id)
+    with _BODIES_LOCK:
+        hit = _BODIES.get(draw_id)
+        if hit is not None and hit[2] == stamp:
+            _BODIES.move_to_end(draw_id)
+            return hit[0], hit[1]
+    if hit is not None:
+        # снимок перезаписан (возможно, другим воркером) — тело и ETag устарели
+        _forget_body(draw_id)
+    data = _read_at(draw_id, stamp) if stamp is not None else None
+    if data is None:
+        return None
+    etag = '"' + blake3(data).hexdigest()[:32] + '"'
+    if cache and len(data) <= settings.HISTORY_CACHE_BYTES:
+        with _BODIES_LOCK:
+            old = _BODIES.pop(draw_id, None)
+            if old is not None:
+                _BODIES_BYTES -= len(old[0])
+            _BODIES[draw_id] = (data, etag, stamp)
+            _BODIES_BYTES += len(data)
+            while _BODIES_BYTES > settings.HISTORY_CACHE_BYTES:
+                _BODIES_BYTES -= len(_BODIES.popitem(last=False)[1][0])
+    return data, etag
+
+def load_draw(draw_id: str) -> Optional[Dict[str, Any]]:
+    data = _read_draw_bytes(draw_id)
+    return json.loads(data) if data is not None else None
+
+def list_draws(limit: int = 50, offset: int = 0, cursor: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Страница истории из индекса (новые первыми).
+    cursor — encode_cursor() последнего элемента предыдущей страницы (стабилен при дописывании).
+    """
+    sql = "SELECT draw_id, created_at, sources, u64 FROM draws"
+    args: list = []
+    if cursor:
+        ts, draw_id = _decode_cursor(cursor)
+        sql += " WHERE (created_at, draw_id) < (?, ?)"
+        args += [ts, draw_id]
+    sql += " ORDER BY created_at DESC, draw_id DESC LIMIT ? OFFSET ?"
+    args += [max(0, limit), max(0, offset)]
+    with _LOCK:
+        rows = _db().execute(sql, args).fetchall()
+    return [
+        {"drawId": d, "createdAt": ts or None, "sources": json.loads(src), "numberU64": u64}
+        for d, ts, src, u64 in rows
+    ]
+
+def draw_ids_between(since: Optional[int] = None, until: Optional[int] = None,
+                     limit: Optional[int] = None) -> List[str]:
+    """drawId за интервал createdAt [since, until) в мс, старые первыми."""
+    sql, args, where = "SELECT draw_id FROM draws", [], []
+    if since is not None:
+        where.append("created_at >= ?"); args.append(since)
+    if until is not None:
+        where.append("created_at < ?"); args.append(until)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at, draw_id"
+    if limit is not None:
+        sql += " LIMIT ?"; args.append(max(0, limit))
+    with _LOCK:
+        return [r[0] for r in _db().execute(sql, args).fetchall()]
+
+def get_verifications(draw_ids: List[str]) -> Dict[str, Tuple[str, bool, int, Optional[str]]]:
+    """drawId -> (etag, ok, checked_at, errors JSON) для уже проверенных."""
+    out: Dict[str, Tuple[str, bool, int, Optional[str]]] = {}
+    with _LOCK:
+        db = _db()
+        for i in range(0, len(draw_ids), 500):
+            chunk = draw_ids[i:i + 500]
+            rows = db.execute(
+                f"SELECT draw_id, etag, ok, checked_at, errors FROM verify"
+                f" WHERE draw_id IN ({','.join('?' * len(chunk))})", chunk,
+            ).fetchall()
+            for d, etag, ok, ts, errors in rows:
+                out[d] = (etag, bool(ok), ts, errors)
+    return out
+
+def put_verifications(rows: List[Tuple[str, str, bool, int, Optional[str]]]):
+    """rows: (drawId, etag, ok, checked_at, errors JSON)."""
+    with _LOCK:
+        db = _db()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO verify (draw_id, etag, ok, checked_at, errors) VALUES (?, ?, ?, ?, ?)",
+                [(d, e, int(ok), ts, err) for d, e, ok, ts, err in rows],
+            )
+
+def close_store():
+    with _LOCK:
+        if _LOG is not None:
+            _LOG.close()
 
 def set_current_draw(draw_id: str) -> None:
-    global CURRENT_DRAW_ID
-    CURRENT_DRAW_ID = draw_id
+    registry.current = draw_id
 
 def get_current_draw() -> Optional[str]:
-    return CURRENT_DRAW_ID
+    return registry.current
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Draw store maintenance")
+    ap.add_argument("command", choices=["rebuild-index", "migrate", "retention", "compact"])
+    ap.add_argument("--remove-json", action="store_true", help="migrate: удалить *.json после переноса")
+    args = ap.parse_args()
+    if args.command == "rebuild-index":
+        print(f"indexed {rebuild_index()} draws in {STORE_DIR}")
+    elif args.command == "migrate":
+        print(f"migrated {migrate_files_to_segments(args.remove_json)} draws to {SEGMENTS_NAME}/")
+    elif args.command == "retention":
+        print(f"dropped {apply_retention()} segments")
+    elif args.command == "compact":
+        print(f"compacted {compact()} segments")
@@ -0,0 +1,211 @@
+# services/verify.py
+"""
+Массовая перепроверка сохранённых тиражей. Из снимка заново выводим
+PUB = H("SOL", beacon), LOC = H("LOC", locRoot) → hkdf_seed → prng_chacha20 → u64_be
+и сверяем с записанными seed/числом/трассой, а маяк — с хешами блоков.
+Проверка идёт пачками в пуле процессов, результаты отдаются по мере готовности,
+статус кешируется в индексе истории (таблица verify, ключ — ETag снимка).
+
+CLI: python -m services.verify [--since MS] [--until MS] [--limit N] [--force]
+"""
+import asyncio, json, multiprocessing, os, time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import AsyncGenerator, List, Optional, Tuple
+
+import base58
+from blake3 import blake3
+
+from rng.mix import domain_hash, hkdf_seed, prng_chacha20, u64_be
+from settings import settings
+from services.store import draw_ids_between, load_draw_body, get_verifications, put_verifications
+
+# ——— проверка одного снимка (чистая функция, исполняется в воркерах)
+
+def _mix(draw_id: str, sources: dict) -> Tuple[bytes, bytes, str]:
+    seed = hkdf_seed(draw_id, sources)
+    rnd = prng_chacha20(seed, 64)
+    return seed, rnd, str(u64_be(rnd))
+
+def verify_record(rec: dict) -> List[str]:
+    """Список расхождений; пустой — снимок воспроизводится."""
+    draw_id = rec.get("drawId") or ""
+    sol = (rec.get("sources") or {}).get("SOL") or {}
+    trace = rec.get("trace") or {}
+    result = rec.get("result") or {}
+    errors: List[str] = []
+
+    try:
+        beacon = bytes.fromhex(sol.get("beaconHex") or "")
+    except ValueError:
+        return ["sources.SOL.beaconHex is not hex"]
+    if not beacon:
+        return ["sources.SOL.beaconHex is missing"]
+    blocks = sol.get("blocks")
+    if blocks:
+        try:
+            joined = b"".join(base58.b58decode(b["blockhash"]) for b in blocks)
+        except Exception:
+            joined = None
+        if joined != beacon:
+            errors.append("beacon does not match block hashes")
+
+    pub = domain_hash(b"SOL", beacon)
+    sources = {"PUB": pub}
+    loc_hex = (rec.get("entropy") or {}).get("locRoot")
+    if loc_hex:
+        try:
+            sources["LOC"] = domain_hash(b"LOC", bytes.fromhex(loc_hex))
+        except ValueError:
+            return errors + ["entropy.locRoot is not hex"]
+    inputs = rec.get("inputs")
+    if inputs is not None and sorted(inputs) != sorted(sources):
+        errors.append("inputs do not match available sources")
+
+    seed, rnd, num = _mix(draw_id, sources)
+    expected = [
+        ("result.seedHex", result.get("seedHex"), seed.hex()),
+        ("result.u64", result.get("u64"), num),
+    ]
+    # трасса и сравнение необязательны, но если записаны — должны сойтись
+    optional = [
+        ("trace.beaconHex", trace.get("beaconHex"), beacon.hex()),
+        ("trace.pubComponentHex", trace.get("pubComponentHex"), pub.hex()),
+        ("trace.hkdfSaltHex", trace.get("hkdfSaltHex"), blake3(b"CM|" + draw_id.encode()).hexdigest()),
+        ("trace.seedHex", trace.get("seedHex"), seed.hex()),
+        ("trace.chachaFirst16Hex", trace.get("chachaFirst16Hex"), rnd[:16].hex()),
+        ("trace.u64", trace.get("u64"), num),
+    ]
+    cmp_pub = (rec.get("compare") or {}).get("pub")
+    if cmp_pub:
+        p_seed, p_rnd, p_num = _mix(draw_id, {"PUB": pub})
+        optional += [
+            ("compare.pub.seedHex", cmp_pub.get("seedHex"), p_seed.hex()),
+            ("compare.pub.u64", cmp_pub.get("u64"), p_num),
+        ]
+    expected += [x for x in optional if x[1] is not None]
+    errors += [f"{name} mismatch" for name, got, want in expected if got != want]
+    return errors
+
+def verify_bodies(bodies: List[bytes]) -> List[List[str]]:
+    """Пачка сырых снимков → расхождения по каждому (в порядке входа)."""
+    out = []
+    for data in bodies:
+        try:
+            out.append(verify_record(json.loads(data)))
+        except Exception as e:
+            out.append([f"unreadable record: {e}"])
+    return out
+
+# ——— пул
+
+_EXECUTOR: Optional[Executor] = None
+
+def verify_workers() -> int:
+    return settings.VERIFY_WORKERS or (os.cpu_count() or 1)
+
+def _executor() -> Executor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ProcessPoolExecutor(max_workers=verify_workers(),
+                                        mp_context=multiprocessing.get_context("spawn"))
+    return _EXECUTOR
+
+def shutdown_verify_pool():
+    global _EXECUTOR
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown(wait=False, cancel_futures=True)
+        _EXECUTOR = None
+
+# ——— диапазон истории
+
+def _load_chunk(draw_ids: List[str]) -> List[Tuple[str, Optional[bytes], Optional[str]]]:
+    out = []
+    for d in draw_ids:
+        hit = load_draw_body(d, cache=False)
+        out.append((d, *hit) if hit else (d, None, None))
+    return out
+
+def _row(draw_id: str, errors: List[str], cached: bool, checked_at: int) -> dict:
+    return {"drawId": draw_id, "ok": not errors, "errors": errors, "cached": cached, "checkedAt": checked_at}
+
+async def verify_draws(draw_ids: Optional[List[str]] = None, since: Optional[int] = None,
+                       until: Optional[int] = None, limit: Optional[int] = None,
+                       force: bool = False) -> AsyncGenerator[dict, None]:
+    """
+    Проверить тиражи (список или интервал createdAt). Строки — по мере готовности
+    пачек (порядок не гарантирован), в конце — сводка {"done": true, ...}.
+    Неизменившиеся снимки с сохранённым статусом не пересчитываются (кроме force).
+    """
+    started = time.monotonic()
+    if draw_ids is None:
+        draw_ids = await asyncio.to_thread(draw_ids_between, since, until, limit)
+    known = {} if force else await asyncio.to_thread(get_verifications, draw_ids)
+    loop = asyncio.get_running_loop()
+    chunk = max(1, settings.VERIFY_CHUNK)
+    inflight_max = verify_workers() * 2
+    pending: set = set()
+    totals = {"total": 0, "ok": 0, "failed": 0, "cached": 0}
+
+    def _count(row: dict) -> dict:
+        totals["total"] += 1
+        totals["ok" if row["ok"] else "failed"] += 1
+        totals["cached"] += row["cached"]
+        return row
+
+    async def _check(items: List[Tuple[str, bytes, str]]) -> List[dict]:
+        results = await loop.run_in_executor(_executor(), verify_bodies, [data for _d, data, _e in items])
+        now = int(time.time() * 1000)
+        await asyncio.to_thread(put_verifications, [
+            (d, etag, not errs, now, json.dumps(errs) if errs else None)
+            for (d, _data, etag), errs in zip(items, results)
+        ])
+        return [_row(d, errs, False, now) for (d, _data, _etag), errs in zip(items, results)]
+
+    try:
+        for i in range(0, len(draw_ids), chunk):
+            todo = []
+            for d, data, etag in await asyncio.to_thread(_load_chunk, draw_ids[i:i + chunk]):
+                hit = known.get(d)
+                if data is None:
+                    yield _count(_row(d, ["not found"], False, int(time.time() * 1000)))
+                elif hit is not None and hit[0] == etag:
+                    errs = json.loads(hit[3]) if hit[3] else []
+                    yield _count(_row(d, errs, True, hit[2]))
+                else:
+                    todo.append((d, data, etag))
+            if todo:
+                pending.add(asyncio.ensure_future(_check(todo)))
+            while len(pending) >= inflight_max or (pending and i + chunk >= len(draw_ids)):
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    for row in t.result():
+                        yield _count(row)
+    finally:
+        for t in pending:
+            t.cancel()
+    yield {"done": True, **totals, "elapsedMs": int((time.monotonic() - started) * 1000)}
+
+
+if __name__ == "__main__":
+    import argparse, sys
+    ap = argparse.ArgumentParser(description="Re-verify stored draws (NDJSON to stdout)")
+    ap.add_argument("--since", type=int, help="createdAt >= (ms)")
+    ap.add_argument("--until", type=int, help="createdAt < (ms)")
+    ap.add_argument("--limit", type=int)
+    ap.add_argument("--force", action="store_true", help="ignore cached status")
+    ap.add_argument("--failed-only", action="store_true", help="print only failed draws and the summary")
+    args = ap.parse_args()
+
+    async def _main() -> int:
+        failed = 0
+        async for row in verify_draws(since=args.since, until=args.until, limit=args.limit, force=args.force):
+            failed += row.get("done") is None and not row["ok"]
+            if not args.failed_only or row.get("done") or not row["ok"]:
+                print(json.dumps(row, ensure_ascii=False))
+        return 1 if failed else 0
+
+    try:
+        code = asyncio.run(_main())
+    finally:
+        shutdown_verify_pool()
+    sys.exit(code)
@@ -5,6 +5,95 @@ class Settings(BaseSettings):
     SOLANA_RPC_URL: str = "https://api.mainnet-beta.solana.com"
     # Сколько блоков тянуть по умолчанию
     SOL_BLOCKS: int = 3
+    # Пул соединений к RPC: один клиент на процесс (keep-alive, опционально HTTP/2)
+    SOLANA_RPC_HTTP2: bool = False           # нужен пакет h2; без него молча остаёмся на HTTP/1.1
+    SOLANA_RPC_MAX_CONNECTIONS: int = 16
+    SOLANA_RPC_KEEPALIVE_S: float = 30.0
+    # JSON-RPC batch: всё окно getBlock уходит одним POST
+    SOLANA_RPC_BATCH: bool = True
+    # Сканирование назад от финализированной вершины
+    SOL_SCAN_BATCH: int = 20               # сколько слотов перечисляем (getBlocks) за итерацию
+    SOL_MAX_SCAN: int = 400                # максимум слотов, которые готовы отсканировать назад
+    SOL_BLOCK_CACHE: int = 1024            # LRU slot -> (blockhash, raw) между тиражами
+    # Фоновый трекер финализированной вершины: тиражи читают блоки из памяти
+    SOL_TRACKER: bool = True
+    SOL_TRACKER_DEPTH: int = 32            # сколько последних блоков держим в кольцевом буфере
+    SOL_TRACKER_POLL_MS: int = 1000
+    SOL_TRACKER_MAX_AGE_MS: int = 5000     # старше — буфер считается протухшим, идём в RPC
+
+    # Реестр состояний тиражей (локальный пул, статус, блокировка)
+    DRAW_IDLE_TTL_S: int = 900             # незакрытый тираж без активности — выселяем
+    DRAW_CLOSED_TTL_S: int = 120           # закрытый держим недолго (корень ещё можно спросить)
+    DRAW_MAX_BYTES: int = 8 << 20          # потолок локальной энтропии на тираж
+    DRAWS_MAX_BYTES: int = 256 << 20       # потолок на все активные тиражи
+    DRAWS_MAX_ACTIVE: int = 4096           # тиражей в реестре; все идут — новый получает 503
+
+    # приём пользовательской энтропии: /entropy/{id}/user (hex), /user/raw (octet-stream), /user/ws
+    USER_PACKET_MAX_BYTES: int = 64 << 10  # один пакет (JSON, тело raw, кадр WebSocket)
+    USER_WS_MAX_BYTES: int = 4 << 20       # всего за одно WebSocket-соединение
+    LOC_PROGRESS_MAX_HZ: float = 4.0       # loc.progress на тираж не чаще; 0 — на каждый пакет
+
+    # health-тесты локальной энтропии (SP 800-90B RCT/APT) на каждый пакет; α = 2^-HEALTH_ALPHA_LOG2
+    HEALTH_TESTS: bool = True
+    HEALTH_ALPHA_LOG2: int = 30
+    # заявленная min-entropy источников, бит на байт (от неё пороги RCT/APT)
+    HEALTH_H_JITTER: float = 1.0           # LSB дельт таймера; на живой машине оценка ~3-4
+    HEALTH_H_URANDOM: float = 8.0
+    HEALTH_H_USER: float = 0.5             # пользовательские пакеты: формат неизвестен, порог мягкий
+
+    # CPU-jitter: выборка вне event loop (пул процессов/потоков с ограниченной очередью)
+    JITTER_EXECUTOR: str = "process"       # "process" | "thread"
+    JITTER_WORKERS: int = 0                # 0 — по числу ядер (не больше 4)
+    JITTER_QUEUE: int = 16                 # задач в работе + в ожидании; дальше — backpressure/503
+    JITTER_PARALLEL: int = 0               # батчей за тик сбора; 0 — по числу воркеров
+    JITTER_MAX_SAMPLES: int = 100_000      # потолок samples на один батч (в т.ч. из запроса)
+
+    # /range/by-seed/batch: максимум значений за запрос
+    RANGE_BATCH_MAX: int = 100_000
+
+    # /tests/battery/by-seed: статистическая батарея на сервере (services.battery)
+    BATTERY_MAX_BITS: int = 1 << 33        # 1 GiB потока за запрос
+    BATTERY_REPORT_BITS: int = 1 << 24     # промежуточный результат каждые столько бит
+    BATTERY_MAX_ACTIVE: int = 2            # одновременных прогонов; дальше — 503
+
+    # SSE fan-out (StreamHub)
+    SSE_QUEUE_MAX: int = 256               # кадров в очереди одного подписчика
+    SSE_SLOW_POLICY: str = "coalesce"      # "drop_oldest" | "coalesce" | "disconnect"
+    SSE_HEARTBEAT_S: float = 2.0           # общий ping на весь hub
+    SSE_REPLAY_MAX: int = 128              # последних событий на канал для догоняющих клиентов (+ столько же ключевых стадий отдельно)
+    SSE_REPLAY_CHANNELS: int = 256         # сколько каналов держим в буфере
+    SSE_REPLAY_TTL_S: float = 60.0         # после закрытия тиража буфер живёт ещё столько
+
+    # Хранилище истории: "files" — JSON-файл на тираж, "segments" — append-only сегменты
+    STORE_BACKEND: str = "files"
+    STORE_SEGMENT_BYTES: int = 4 << 20     # размер, после которого сегмент запечатывается
+    STORE_SEGMENT_COMPRESS: bool = True    # gzip для запечатанных сегментов
+    STORE_FSYNC_EVERY: int = 1             # fsync раз в N записей (0 — оставить ОС)
+    STORE_RETENTION_DAYS: int = 0          # 0 — хранить всё; иначе удаляем старые запечатанные сегменты
+    STORE_COMPACT_RATIO: float = 0.5       # сегмент с долей живых записей ниже — переписываем
+    HISTORY_CACHE_BYTES: int = 32 << 20    # LRU готовых тел /history/{id} (снимки неизменны)
+    # Перепроверка истории (services.verify): пул процессов, снимков на задачу
+    VERIFY_WORKERS: int = 0                # 0 — по числу ядер
+    VERIFY_CHUNK: int = 64
+
+    # Авто-генератор: тиражи по сетке настенного времени (старты кратны AUTO_INTERVAL_S от эпохи)
+    AUTO_DRAW: bool = True
+    AUTO_INTERVAL_S: float = 10.0
+    AUTO_COLLECT_MS: int = 1200
+    AUTO_ANNOUNCE_S: float = 2.0           # за сколько до старта объявлять следующий draw_id в __current__
+    AUTO_MISSED: str = "skip"              # пропущенные тики: "skip" — к ближайшему, "catchup" — догнать подряд
+    AUTO_CATCHUP_MAX: int = 3              # больше пропусков догонять не будем — остаток пропускаем
+    AUTO_DRAW_TIMEOUT_S: float = 0.0       # общий дедлайн тиража; 0 — 90% интервала
+    # дедлайны стадий тиража (и для HTTP, и для авто)
+    DRAW_BEACON_TIMEOUT_S: float = 8.0
+    DRAW_COLLECT_GRACE_S: float = 5.0      # сбор: collect_ms + столько сверху
+
+    # несколько воркеров uvicorn: лидер (файловая блокировка) ведёт авто-генератор и тиражи,
+    # события расходятся по Unix-сокету. Только POSIX (fcntl, AF_UNIX)
+    CLUSTER: bool = False
+    CLUSTER_DIR: str = "./storage/run"     # leader.lock и bus.sock
+    CLUSTER_CALL_TIMEOUT_S: float = 120.0  # ожидание ответа лидера на проброшенный запрос
+    CLUSTER_PEER_BUFFER: int = 4 << 20     # байт в буфере отправки воркеру, дальше — отключаем
 
     ETH_RPC_URL: str = ""                 # напр., https://mainnet.infura.io/v3/<key>
     ETH_CONFIRMATIONS: int = 15           # "финализация по числу подтверждений"
@@ -1,5 +1,9 @@
-import time
+import asyncio, multiprocessing, os, time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
 from blake3 import blake3
+from settings import settings
 
 def cpu_jitter_bytes(samples: int = 20000) -> bytes:
     """
@@ -14,3 +18,60 @@ def cpu_jitter_bytes(samples: int = 20000) -> bytes:
         out.append(dt & 0xFF)  # LSB
         last = now
     return bytes(out)
+
+
+class JitterBusyError(RuntimeError):
+    pass
+
+_EXECUTOR: Optional[Executor] = None
+_SLOTS: Optional[asyncio.Semaphore] = None
+
+def jitter_workers() -> int:
+    return settings.JITTER_WORKERS or min(4, os.cpu_count() or 1)
+
+def _executor() -> Executor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        if settings.JITTER_EXECUTOR == "thread":
+            _EXECUTOR = ThreadPoolExecutor(max_workers=jitter_workers(), thread_name_prefix="jitter")
+        else:
+            # spawn: дочерние процессы не наследуют event loop/сокеты родителя
+            _EXECUTOR = ProcessPoolExecutor(max_workers=jitter_workers(),
+                                            mp_context=multiprocessing.get_context("spawn"))
+    return _EXECUTOR
+
+def _slots() -> asyncio.Semaphore:
+    global _SLOTS
+    if _SLOTS is None:
+        _SLOTS = asyncio.Semaphore(max(1, settings.JITTER_QUEUE))
+    return _SLOTS
+
+def clamp_samples(samples: int) -> int:
+    return max(1, min(int(samples), settings.JITTER_MAX_SAMPLES))
+
+async def cpu_jitter_bytes_async(samples: int = 20000, wait: bool = True) -> bytes:
+    """
+    cpu_jitter_bytes в пуле воркеров: event loop (SSE, HTTP) не блокируется.
+    Очередь ограничена JITTER_QUEUE; при wait=False и полной очереди — JitterBusyError.
+    """
+    slots = _slots()
+    if not wait and slots.locked():
+        raise JitterBusyError("jitter pool is busy, try later")
+    async with slots:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(_executor(), cpu_jitter_bytes, clamp_samples(samples))
+        except BrokenProcessPool:
+            # воркер упал — пересоздадим пул при следующем вызове
+            shutdown_jitter_pool()
+            raise
+
+async def cpu_jitter_batches(samples: int, batches: int) -> list[bytes]:
+    """Несколько батчей параллельно (по ядрам); порядок результатов = порядок запуска."""
+    return list(await asyncio.gather(*(cpu_jitter_bytes_async(samples) for _ in range(max(1, batches)))))
+
+def shutdown_jitter_pool():
+    global _EXECUTOR
+    if _EXECUTOR is not None:
+        ex, _EXECUTOR = _EXECUTOR, None
+        ex.shutdown(wait=False, cancel_futures=True)
@@ -1,47 +1,152 @@
 # app/sources/solana.py
-import base58, httpx, asyncio
+import base58, httpx, asyncio, time
+from collections import OrderedDict
 from typing import List, Dict, Tuple, Any, Optional
 from settings import settings
+from services.metrics import (solana_beacon_seconds, solana_rpc_seconds, solana_rpc_errors,
+                              solana_skipped_slots, solana_block_cache_hits)
 
 SOLSCAN_BLOCK = "https://solscan.io/block/{}"
 
-# параметры сканирования (можно вынести в settings)
-BATCH_SIZE = 20       # сколько слотов проверяем за итерацию
-CONCURRENCY = 6       # параллелизм запросов getBlock
-MAX_SCAN = 400        # максимум слотов, которые готовы отсканировать назад
+# параметры сканирования
+BATCH_SIZE = settings.SOL_SCAN_BATCH   # сколько слотов проверяем за итерацию
+CONCURRENCY = 6                        # параллелизм запросов getBlock (без batch)
+MAX_SCAN = settings.SOL_MAX_SCAN       # максимум слотов, которые готовы отсканировать назад
+
+# LRU: slot -> (blockhash, decoded bytes). Финализированный блок не меняется,
+# поэтому соседние авто-тиражи переиспользуют перекрывающиеся слоты без RPC.
+_BLOCK_CACHE: "OrderedDict[int, Tuple[str, bytes]]" = OrderedDict()
+
+def _cache_get(slot: int) -> Optional[Tuple[str, bytes]]:
+    hit = _BLOCK_CACHE.get(slot)
+    if hit is not None:
+        _BLOCK_CACHE.move_to_end(slot)
+    return hit
+
+def _cache_put(slot: int, blockhash: str, raw: bytes):
+    _BLOCK_CACHE[slot] = (blockhash, raw)
+    _BLOCK_CACHE.move_to_end(slot)
+    while len(_BLOCK_CACHE) > max(0, settings.SOL_BLOCK_CACHE):
+        _BLOCK_CACHE.popitem(last=False)
+
+_CLIENT: Optional[httpx.AsyncClient] = None
+
+def _client() -> httpx.AsyncClient:
+    """Один долгоживущий клиент на процесс: пул соединений + keep-alive (без TCP/TLS на каждый вызов)."""
+    global _CLIENT
+    if _CLIENT is None or _CLIENT.is_closed:
+        http2 = settings.SOLANA_RPC_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                http2 = False
+        _CLIENT = httpx.AsyncClient(
+            http2=http2,
+            timeout=20.0,
+            limits=httpx.Limits(
+                max_connections=settings.SOLANA_RPC_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.SOLANA_RPC_MAX_CONNECTIONS,
+                keepalive_expiry=settings.SOLANA_RPC_KEEPALIVE_S,
+            ),
+        )
+    return _CLIENT
+
+async def close_client():
+    """Закрыть общий клиент (вызывается на shutdown приложения)."""
+    global _CLIENT
+    if _CLIENT is not None:
+        cli, _CLIENT = _CLIENT, None
+        await cli.aclose()
 
 async def _rpc(method: str, params: list[Any], timeout: float = 20.0):
-    async with httpx.AsyncClient(timeout=timeout) as cli:
-        r = await cli.post(settings.SOLANA_RPC_URL, json={
+    t0 = time.perf_counter()
+    try:
+        r = await _client().post(settings.SOLANA_RPC_URL, json={
             "jsonrpc": "2.0", "id": 1, "method": method, "params": params
-        })
+        }, timeout=timeout)
+        r.raise_for_status()
+        j = r.json()
+    except Exception:
+        solana_rpc_errors.labels(method).inc()
+        raise
+    finally:
+        solana_rpc_seconds.labels(method, "false").observe(time.perf_counter() - t0)
+    if "error" in j:
+        # пробрасываем как исключение для верхнего уровня
+        solana_rpc_errors.labels(method).inc()
+        raise RuntimeError(str(j["error"]))
+    return j["result"]
+
+async def _rpc_batch(calls: List[Tuple[str, list[Any]]], timeout: float = 20.0) -> List[Any]:
+    """
+    JSON-RPC batch: все вызовы одним POST.
+    Возвращает список той же длины: result либо экземпляр исключения для конкретного элемента.
+    Ошибка транспорта/формата ответа пробрасывается целиком.
+    """
+    if not calls:
+        return []
+    payload = [
+        {"jsonrpc": "2.0", "id": i, "method": m, "params": p}
+        for i, (m, p) in enumerate(calls)
+    ]
+    method = calls[0][0]
+    t0 = time.perf_counter()
+    try:
+        r = await _client().post(settings.SOLANA_RPC_URL, json=payload, timeout=timeout)
         r.raise_for_status()
         j = r.json()
-        if "error" in j:
-            # пробрасываем как исключение для верхнего уровня
-            raise RuntimeError(str(j["error"]))
-        return j["result"]
+    except Exception:
+        solana_rpc_errors.labels(method).inc()
+        raise
+    finally:
+        solana_rpc_seconds.labels(method, "true").observe(time.perf_counter() - t0)
+    if not isinstance(j, list):
+        # провайдер не поддерживает batch (или вернул общую ошибку)
+        raise RuntimeError(str(j.get("error") if isinstance(j, dict) else j))
+    out: List[Any] = [RuntimeError("missing in batch response")] * len(calls)
+    for item in j:
+        i = item.get("id")
+        if not isinstance(i, int) or not 0 <= i < len(calls):
+            continue
+        out[i] = RuntimeError(str(item["error"])) if "error" in item else item.get("result")
+    return out
 
 async def get_latest_slot() -> int:
     return int(await _rpc("getSlot", [{"commitment":"finalized"}]))
 
+def _get_block_params(slot: int) -> list[Any]:
+    return [slot, {
+        "transactionDetails": "none",
+        "rewards": False,
+        "commitment": "finalized",
+        # поддерживаем v0 (legacy тоже ок)
+        "maxSupportedTransactionVersion": 0
+    }]
+
 async def _get_block_safe(slot: int) -> Optional[dict]:
     """
     Возвращает dict блока или None (если слот пропущен/не найден/ошибка).
     Агрессивно гасим “улетающие” ошибки RPC, чтобы цикл не зависал.
     """
     try:
-        params = [slot, {
-            "transactionDetails": "none",
-            "rewards": False,
-            "commitment": "finalized",
-            # поддерживаем v0 (legacy тоже ок)
-            "maxSupportedTransactionVersion": 0
-        }]
-        return await _rpc("getBlock", params, timeout=15.0)
+        return await _rpc("getBlock", _get_block_params(slot), timeout=15.0)
     except Exception:
         return None  # пропускаем слот
 
+async def _get_blocks(slots: List[int]) -> List[Optional[dict]]:
+    """
+    Блоки для окна слотов: одним batch-POST, если включено,
+    иначе (или если batch не прошёл) — параллельными одиночными запросами.
+    """
+    if settings.SOLANA_RPC_BATCH:
+        try:
+            res = await _rpc_batch([("getBlock", _get_block_params(s)) for s in slots], timeout=15.0)
+            return [None if isinstance(b, Exception) else b for b in res]
+        except Exception:
+            pass
+    return await _gather_with_limit([_get_block_safe(s) for s in slots], limit=CONCURRENCY)
+
 async def _gather_with_limit(tasks, limit: int):
     sem = asyncio.Semaphore(limit)
     async def run(coro):
@@ -49,11 +154,48 @@ async def _gather_with_limit(tasks, limit: int):
             return await coro
     return await asyncio.gather(*(run(t) for t in tasks))
 
+async def _produced_slots(lo: int, hi: int) -> List[int]:
+    """
+    Слоты с реальными блоками в [lo, hi] (по убыванию) через getBlocks.
+    Если метод недоступен — считаем кандидатами все слоты окна, как раньше.
+    """
+    try:
+        res = await _rpc("getBlocks", [lo, hi, {"commitment": "finalized"}], timeout=15.0)
+        produced = sorted((int(s) for s in res if lo <= int(s) <= hi), reverse=True)
+        solana_skipped_slots.labels("not_produced").inc(hi - lo + 1 - len(produced))
+        return produced
+    except Exception:
+        return list(range(hi, lo - 1, -1))
+
+async def _resolve_blocks(slots: List[int]) -> List[Optional[Tuple[str, bytes]]]:
+    """(blockhash, raw) для слотов: из LRU, недостающие — одним запросом окна."""
+    out: List[Optional[Tuple[str, bytes]]] = [_cache_get(s) for s in slots]
+    missing = [i for i, hit in enumerate(out) if hit is None]
+    solana_block_cache_hits.inc(len(slots) - len(missing))
+    if not missing:
+        return out
+    blocks = await _get_blocks([slots[i] for i in missing])
+    for i, blk in zip(missing, blocks):
+        if blk and blk.get("blockhash"):
+            bh = blk["blockhash"]
+            try:
+                raw = base58.b58decode(bh)
+            except Exception:
+                continue
+            _cache_put(slots[i], bh, raw)
+            out[i] = (bh, raw)
+    return out
+
 async def solana_beacon(last_n: int) -> Tuple[bytes, List[Dict[str, Any]]]:
     """
-    Ищем не менее last_n финализированных блоков, сканируя назад BATCHами,
-    с параллельными запросами и верхней границей MAX_SCAN.
+    Ищем не менее last_n финализированных блоков, сканируя назад BATCHами:
+    сначала getBlocks (какие слоты реально произведены), затем getBlock
+    только для них и только для тех, которых нет в LRU. Верхняя граница — MAX_SCAN.
     """
+    with solana_beacon_seconds.time():
+        return await _scan_beacon(last_n)
+
+async def _scan_beacon(last_n: int) -> Tuple[bytes, List[Dict[str, Any]]]:
     latest = await get_latest_slot()
     details: List[Dict[str, Any]] = []
     concat = b""
@@ -62,33 +204,27 @@ async def solana_beacon(last_n: int) -> Tuple[bytes, List[Dict[str, Any]]]:
     cursor = latest
 
     while len(details) < last_n and cursor > 0 and scanned < MAX_SCAN:
-        # берём окно слотов [cursor .. cursor-BATCH_SIZE+1]
-        window = list(range(cursor, max(0, cursor - BATCH_SIZE), -1))
-        scanned += len(window)
-
-        # параллельно тянем блоки
-        blocks = await _gather_with_limit(
-            [ _get_block_safe(s) for s in window ],
-            limit=CONCURRENCY
-        )
+        # окно слотов [cursor-BATCH_SIZE+1 .. cursor]
+        lo = max(0, cursor - BATCH_SIZE + 1)
+        scanned += cursor - lo + 1
+        pending = await _produced_slots(lo, cursor)
 
-        for slot, blk in zip(window, blocks):
-            if blk and blk.get("blockhash"):
-                bh = blk["blockhash"]
-                try:
-                    raw = base58.b58decode(bh)
-                except Exception:
+        # тянем ровно столько, сколько не хватает; неудачные добираем из того же окна
+        while pending and len(details) < last_n:
+            take, pending = pending[:last_n - len(details)], pending[last_n - len(details):]
+            for slot, hit in zip(take, await _resolve_blocks(take)):
+                if hit is None:
+                    solana_skipped_slots.labels("no_block").inc()
                     continue
+                bh, raw = hit
                 details.append({
                     "slot": slot,
                     "blockhash": bh,
                     "explorerUrl": SOLSCAN_BLOCK.format(slot),
                 })
                 concat += raw
-                if len(details) >= last_n:
-                    break
 
-        cursor = window[-1] - 1  # двигаем курсор дальше назад
+        cursor = lo - 1  # двигаем курсор дальше назад
 
     if len(details) == 0:
         raise RuntimeError("No finalized Solana blocks found (RPC/scan window exhausted)")
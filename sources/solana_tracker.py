@@ -0,0 +1,117 @@
+# sources/solana_tracker.py
+import asyncio, time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from settings import settings
+from sources.solana import (
+    SOLSCAN_BLOCK, BATCH_SIZE, MAX_SCAN,
+    get_latest_slot, _produced_slots, _resolve_blocks,
+)
+
+# слот, блок которого не удалось получить, перезапрашиваем на следующих опросах; после
+# стольких промахов подряд считаем его пустым — как и solana_beacon (no_block)
+MISS_LIMIT = 3
+
+class FinalizedTracker:
+    """
+    Фоновый опрос финализированной вершины Solana.
+    Держит кольцевой буфер последних N блоков (slot, blockhash, raw),
+    чтобы тираж брал маяк из памяти, а не ждал RPC.
+    """
+
+    def __init__(self, depth: int, poll_ms: int, max_age_ms: int):
+        self.depth = max(1, int(depth))
+        self.poll_s = max(0.05, poll_ms / 1000.0)
+        self.max_age_s = max(0.0, max_age_ms / 1000.0)
+        self._ring: Deque[Tuple[int, str, bytes]] = deque(maxlen=self.depth)
+        self._updated = 0.0            # monotonic время последнего успешного опроса
+        self._misses: Dict[int, int] = {}   # слот -> промахов подряд
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def tip(self) -> Optional[int]:
+        return self._ring[-1][0] if self._ring else None
+
+    def fresh(self) -> bool:
+        return bool(self._ring) and (time.monotonic() - self._updated) <= self.max_age_s
+
+    async def poll_once(self):
+        latest = await get_latest_slot()
+        last = self.tip or 0
+        complete = True
+        if latest > last:
+            # идём назад от вершины до уже известного слота (или пока не наберём depth)
+            fresh: List[Tuple[int, str, bytes]] = []
+            cursor, scanned = latest, 0
+            while cursor > last and len(fresh) < self.depth and scanned < MAX_SCAN:
+                lo = max(last + 1, cursor - BATCH_SIZE + 1)
+                scanned += cursor - lo + 1
+                produced = await _produced_slots(lo, cursor)
+                slots = produced[:self.depth - len(fresh)]
+                for slot, hit in zip(slots, await _resolve_blocks(slots)):
+                    if hit is not None:
+                        fresh.append((slot, hit[0], hit[1]))
+                        continue
+                    misses = self._misses.get(slot, 0) + 1
+                    if misses >= MISS_LIMIT:
+                        self._misses.pop(slot, None)
+                        continue
+                    self._misses[slot] = misses
+                    # блоки новее промаха в буфер не берём — иначе под ними дыра и маяк
+                    # разойдётся с solana_beacon; вершина останется ниже, слот перезапросим
+                    fresh.clear()
+                    complete = False
+                # окно взяли не целиком — продолжаем сразу под последним просмотренным слотом
+                cursor = slots[-1] - 1 if len(slots) < len(produced) else lo - 1
+            if fresh and last and cursor > last:
+                # разрыв с буфером (долго не опрашивали) — старые записи уже не соседние
+                self._ring.clear()
+            self._ring.extend(sorted(fresh))
+            tip = self.tip or 0
+            self._misses = {s: m for s, m in self._misses.items() if s > tip}
+        if complete:
+            # с недобранной вершиной буфер не освежаем: застрянет — маяк пойдёт в RPC
+            self._updated = time.monotonic()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("solana tracker error:", e)
+            await asyncio.sleep(self.poll_s)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def beacon(self, last_n: int) -> Optional[Tuple[bytes, List[Dict[str, Any]]]]:
+        """
+        Маяк из буфера в том же формате, что solana_beacon (новые блоки первыми).
+        None — буфер протух или в нём меньше last_n блоков: вызывающий идёт в RPC.
+        """
+        if not self.fresh() or len(self._ring) < last_n:
+            return None
+        picked = list(self._ring)[-last_n:][::-1]
+        details = [
+            {"slot": slot, "blockhash": bh, "explorerUrl": SOLSCAN_BLOCK.format(slot)}
+            for slot, bh, _raw in picked
+        ]
+        return b"".join(raw for _slot, _bh, raw in picked), details
+
+tracker = FinalizedTracker(
+    depth=settings.SOL_TRACKER_DEPTH,
+    poll_ms=settings.SOL_TRACKER_POLL_MS,
+    max_age_ms=settings.SOL_TRACKER_MAX_AGE_MS,
+)
@@ -1,46 +1,227 @@
-import asyncio, json
-from typing import AsyncGenerator, Dict, List, Tuple
+import asyncio, heapq, json, time
+from collections import OrderedDict, deque
+from typing import AsyncGenerator, Deque, Dict, List, Optional, Tuple
+from settings import settings
+from services.metrics import sse_events
+
+# (тип события, готовый SSE-кадр, id) — кодируем один раз на emit, общий для всех подписчиков
+Frame = Tuple[str, bytes, int]
+
+# события «состояния»: при переполнении достаточно последнего
+_COALESCE = frozenset({"ping", "loc.progress", "collect.tick"})
+
+# ключевые стадии тиража: в буфере повтора хранятся отдельно и не вытесняются потоком
+# loc.progress/collect.tick/range.*
+_PINNED = frozenset({"commit", "block.waiting", "block.finalized_all", "collect.open", "collect.close",
+                     "collect.summary", "mix.start", "mix.compare", "mix.trace", "result", "error"})
+
+def _frame(event: dict, event_id: int = 0) -> Frame:
+    data = f"data: {json.dumps(event)}\n\n"
+    if event_id:
+        data = f"id: {event_id}\n" + data
+    return event.get("type", ""), data.encode(), event_id
+
+class _Subscriber:
+    __slots__ = ("buf", "wake", "closed", "dropped")
 
-class StreamHub:
     def __init__(self):
-        self._subs: Dict[str, List[Tuple[asyncio.Queue, asyncio.Task]]] = {}
-
-    async def subscribe(self, draw_id: str) -> AsyncGenerator[str, None]:
-        q: asyncio.Queue = asyncio.Queue()
-        # создадим heartbeat-задачу, чтобы периодически пинговать клиента и не давать соединению засыпать/буферизоваться
-        async def _heartbeat():
-            try:
-                while True:
-                    await asyncio.sleep(2)
-                    # пинги не обязаны парситься фронтом; важен сам чанк для анти-буферизации
-                    try:
-                        q.put_nowait({"type": "ping", "t": asyncio.get_event_loop().time()})
-                    except Exception:
-                        pass
-            except asyncio.CancelledError:
-                pass
-
-        task = asyncio.create_task(_heartbeat())
-        self._subs.setdefault(draw_id, []).append((q, task))
+        self.buf: Deque[Frame] = deque()
+        self.wake = asyncio.Event()
+        self.closed = False
+        self.dropped = 0
+
+    def push(self, frame: Frame, maxlen: int, policy: str) -> int:
+        """Положить кадр в очередь; вернёт число выброшенных кадров."""
+        if self.closed:
+            return 0
+        dropped = 0
+        if len(self.buf) >= maxlen:
+            if policy == "disconnect":
+                # медленный клиент: отключаем, а не копим память
+                self.closed = True
+                dropped = len(self.buf) + 1
+                self.buf.clear()
+                self.wake.set()
+                self.dropped += dropped
+                return dropped
+            if policy == "coalesce":
+                kind = frame[0]
+                if kind in _COALESCE and self.buf[-1][0] == kind:
+                    self.buf[-1] = frame
+                    self.dropped += 1
+                    return 1
+                # выбрасываем самый старый «состояние»-кадр, а если таких нет — самый старый
+                for i, (k, _data, _id) in enumerate(self.buf):
+                    if k in _COALESCE:
+                        del self.buf[i]
+                        break
+                else:
+                    self.buf.popleft()
+            else:
+                self.buf.popleft()
+            dropped = 1
+            self.dropped += 1
+        self.buf.append(frame)
+        self.wake.set()
+        return dropped
+
+class _Replay:
+    """Буфер повтора канала: кольцо последних событий + закреплённые ключевые стадии."""
+    __slots__ = ("ring", "pinned", "evict")
+
+    def __init__(self, maxlen: int):
+        self.ring: Deque[Frame] = deque(maxlen=maxlen)
+        self.pinned: Deque[Frame] = deque(maxlen=maxlen)
+        self.evict: Optional[asyncio.TimerHandle] = None
+
+    def append(self, frame: Frame):
+        (self.pinned if frame[0] in _PINNED else self.ring).append(frame)
+
+    def frames(self, after: int):
+        # обе очереди упорядочены по id — сливаем
+        return [f for f in heapq.merge(self.pinned, self.ring, key=lambda f: f[2]) if f[2] > after]
+
+    def cancel(self):
+        if self.evict is not None:
+            self.evict.cancel()
+            self.evict = None
+
+
+class StreamHub:
+    def __init__(self, queue_max: int = 256, policy: str = "coalesce", heartbeat_s: float = 2.0,
+                 replay_max: int = 128, replay_channels: int = 256, replay_ttl_s: float = 60.0):
+        self.queue_max = max(1, queue_max)
+        self.policy = policy
+        self.heartbeat_s = heartbeat_s
+        self.replay_max = max(0, replay_max)
+        self.replay_channels = max(1, replay_channels)
+        self.replay_ttl_s = replay_ttl_s
+        self.dropped_total = 0
+        self._subs: Dict[str, List[_Subscriber]] = {}
+        self._hb_task: Optional[asyncio.Task] = None
+        # id событий монотонны и между перезапусками процесса (старт от времени в мс * 1000),
+        # чтобы Last-Event-ID от прошлой жизни сервера не «перекрывал» новые события
+        self._seq = int(time.time() * 1000) * 1000
+        self._replay: "OrderedDict[str, _Replay]" = OrderedDict()
+        # межпроцессная шина (services.cluster); None — один процесс
+        self.bus = None
+
+    def _ensure_heartbeat(self):
+        # один таймер на весь hub вместо задачи на каждого подписчика
+        if self._hb_task is None or self._hb_task.done():
+            self._hb_task = asyncio.create_task(self._heartbeat())
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while self._subs:
+            await asyncio.sleep(self.heartbeat_s)
+            # пинги не обязаны парситься фронтом; важен сам чанк для анти-буферизации
+            frame = _frame({"type": "ping", "t": loop.time()})
+            for subs in list(self._subs.values()):
+                self._fanout(subs, frame)
+
+    def _fanout(self, subs: List[_Subscriber], frame: Frame):
+        for sub in subs:
+            self.dropped_total += sub.push(frame, self.queue_max, self.policy)
+
+    def _remember(self, draw_id: str, frame: Frame):
+        buf = self._replay.get(draw_id)
+        if buf is not None and frame[0] == "commit":
+            # тот же draw_id запущен заново: кадры прошлого запуска опоздавшим не отдаём,
+            # таймер выселения прошлого буфера новый не трогает
+            buf.cancel()
+            del self._replay[draw_id]
+            buf = None
+        if buf is None:
+            buf = self._replay[draw_id] = _Replay(self.replay_max)
+            while len(self._replay) > self.replay_channels:
+                self._replay.popitem(last=False)[1].cancel()
+        else:
+            self._replay.move_to_end(draw_id)
+        buf.append(frame)
+
+    def close_draw(self, draw_id: str):
+        """Тираж закрыт: буфер повтора ещё replay_ttl_s доступен опоздавшим, затем выселяется."""
+        if self.bus is not None:
+            self.bus.publish_close(draw_id)
+        buf = self._replay.get(draw_id)
+        if buf is None:
+            return
+        def _evict():
+            buf.evict = None
+            if self._replay.get(draw_id) is buf:
+                del self._replay[draw_id]
+        buf.cancel()
+        buf.evict = asyncio.get_running_loop().call_later(self.replay_ttl_s, _evict)
+
+    async def subscribe(self, draw_id: str, last_event_id: Optional[int] = None,
+                        replay: bool = True) -> AsyncGenerator[bytes, None]:
+        """
+        Подписка на канал. Из буфера повтора сразу отдаются события с id > last_event_id
+        (переподключение с Last-Event-ID) либо, при replay и без id, все запомненные
+        (опоздавший подписчик не теряет commit/result).
+        """
+        sub = _Subscriber()
+        self._subs.setdefault(draw_id, []).append(sub)
+        self._ensure_heartbeat()
+        if last_event_id is not None or replay:
+            after = last_event_id or 0
+            # синхронно с регистрацией: между повтором и живыми событиями нет ни дыр, ни дублей
+            buf = self._replay.get(draw_id)
+            if buf is not None:
+                sub.buf.extend(buf.frames(after))
         try:
             # отправим первичное событие, чтобы клиент понял, что подключение живо
-            yield f"data: {json.dumps({'type':'connected','drawId': draw_id})}\n\n"
+            yield _frame({'type': 'connected', 'drawId': draw_id})[1]
             while True:
-                event = await q.get()
-                yield f"data: {json.dumps(event)}\n\n"
+                while sub.buf:
+                    yield sub.buf.popleft()[1]
+                if sub.closed:
+                    return
+                sub.wake.clear()
+                await sub.wake.wait()
         finally:
             subs = self._subs.get(draw_id) or []
-            for i, (qq, tt) in enumerate(list(subs)):
-                if qq is q:
-                    try:
-                        tt.cancel()
-                    except Exception:
-                        pass
-                    subs.pop(i)
-                    break
+            if sub in subs:
+                subs.remove(sub)
+            if not subs:
+                # не копим пустые списки по каждому когда-либо открытому draw_id
+                self._subs.pop(draw_id, None)
 
     async def emit(self, draw_id: str, event: dict):
-        for q, _task in self._subs.get(draw_id, []):
-            q.put_nowait(event)
+        if self.bus is not None and self.bus.relay(draw_id, event):
+            # воркер-последователь: id назначит лидер, кадр вернётся через deliver
+            return
+        sse_events.inc()
+        self._seq += 1
+        frame = _frame(event, self._seq)
+        self.deliver(draw_id, frame)
+        if self.bus is not None:
+            self.bus.publish(draw_id, frame)
+
+    def deliver(self, draw_id: str, frame: Frame):
+        """Готовый кадр (свой или пришедший от лидера) — в буфер повтора и подписчикам."""
+        if self.replay_max:
+            self._remember(draw_id, frame)
+        subs = self._subs.get(draw_id)
+        if subs:
+            self._fanout(subs, frame)
+
+    def stats(self) -> dict:
+        subs = [s for lst in self._subs.values() for s in lst]
+        return {
+            "channels": len(self._subs),
+            "subscribers": len(subs),
+            "queued": sum(len(s.buf) for s in subs),
+            "dropped": self.dropped_total,
+            "replayChannels": len(self._replay),
+        }
 
-hub = StreamHub()
+hub = StreamHub(
+    queue_max=settings.SSE_QUEUE_MAX,
+    policy=settings.SSE_SLOW_POLICY,
+    heartbeat_s=settings.SSE_HEARTBEAT_S,
+    replay_max=settings.SSE_REPLAY_MAX,
+    replay_channels=settings.SSE_REPLAY_CHANNELS,
+    replay_ttl_s=settings.SSE_REPLAY_TTL_S,
+)
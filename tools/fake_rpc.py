@@ -0,0 +1,129 @@
+# tools/fake_rpc.py
+"""
+Локальная замена Solana JSON-RPC для нагрузочных прогонов и отладки без mainnet.
+
+Методы: getSlot, getBlocks, getBlock (+ JSON-RPC batch). Слоты «производятся» со скоростью
+--slots-per-s; пропущенные слоты детерминированы (хеш номера < --skip-rate), blockhash —
+base58(sha256(seed || slot)), так что повторные прогоны видят одну и ту же цепочку.
+
+    python -m tools.fake_rpc --port 8899 --latency-ms 40 --jitter-ms 20 --skip-rate 0.05 --error-rate 0.01
+    SOLANA_RPC_URL=http://127.0.0.1:8899 uvicorn main:app
+
+GET /stats — счётчики запросов по методам и ошибок.
+"""
+import argparse, asyncio, hashlib, random, struct, time
+from dataclasses import dataclass, field
+from typing import Any, Dict
+
+import base58
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+@dataclass
+class FakeChain:
+    start_slot: int = 250_000_000
+    slots_per_s: float = 2.5
+    skip_rate: float = 0.05
+    error_rate: float = 0.0          # доля вызовов с JSON-RPC ошибкой (в т.ч. элементов batch)
+    http_error_rate: float = 0.0     # доля HTTP-запросов, отвеченных 503 целиком
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    seed: bytes = b"fake-solana"
+    t0: float = field(default_factory=time.time)
+    stats: Dict[str, int] = field(default_factory=dict)
+
+    def tip(self) -> int:
+        return self.start_slot + int((time.time() - self.t0) * self.slots_per_s)
+
+    def skipped(self, slot: int) -> bool:
+        h = hashlib.blake2b(self.seed + struct.pack(">Q", slot), digest_size=8).digest()
+        return int.from_bytes(h, "big") < self.skip_rate * 2**64
+
+    def blockhash(self, slot: int) -> str:
+        return base58.b58encode(hashlib.sha256(self.seed + struct.pack(">Q", slot)).digest()).decode()
+
+    def _count(self, key: str, n: int = 1):
+        self.stats[key] = self.stats.get(key, 0) + n
+
+    def call(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        """Один JSON-RPC вызов → {result} или {error} (без jsonrpc/id)."""
+        method, params = req.get("method"), req.get("params") or []
+        self._count(f"method.{method}")
+        if self.error_rate and random.random() < self.error_rate:
+            self._count("errors.injected")
+            return {"error": {"code": -32005, "message": "Node is behind (injected)"}}
+        tip = self.tip()
+        if method == "getSlot":
+            return {"result": tip}
+        if method == "getBlocks":
+            lo, hi = int(params[0]), int(params[1] if len(params) > 1 and not isinstance(params[1], dict) else tip)
+            hi = min(hi, tip, lo + 500_000)
+            return {"result": [s for s in range(lo, hi + 1) if not self.skipped(s)]}
+        if method == "getBlock":
+            slot = int(params[0])
+            if slot > tip:
+                return {"error": {"code": -32004, "message": f"Block not available for slot {slot}"}}
+            if self.skipped(slot):
+                self._count("errors.skipped")
+                return {"error": {"code": -32007, "message": f"Slot {slot} was skipped, or missing due to ledger jump"}}
+            return {"result": {
+                "blockhash": self.blockhash(slot),
+                "previousBlockhash": self.blockhash(slot - 1),
+                "parentSlot": slot - 1,
+                "blockTime": int(self.t0 + (slot - self.start_slot) / self.slots_per_s),
+            }}
+        return {"error": {"code": -32601, "message": "Method not found"}}
+
+    async def delay(self):
+        d = self.latency_ms + (random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0)
+        if d > 0:
+            await asyncio.sleep(d / 1000.0)
+
+
+def create_app(chain: FakeChain) -> FastAPI:
+    app = FastAPI(title="Fake Solana RPC")
+
+    @app.post("/")
+    async def rpc(request: Request):
+        chain._count("http.requests")
+        await chain.delay()
+        if chain.http_error_rate and random.random() < chain.http_error_rate:
+            chain._count("errors.http")
+            return JSONResponse(status_code=503, content={"error": "unavailable (injected)"})
+        body = await request.json()
+        if isinstance(body, list):
+            chain._count("http.batch")
+            chain._count("batch.items", len(body))
+            return [{"jsonrpc": "2.0", "id": r.get("id"), **chain.call(r)} for r in body]
+        return {"jsonrpc": "2.0", "id": body.get("id"), **chain.call(body)}
+
+    @app.get("/stats")
+    async def stats():
+        return {"tip": chain.tip(), **chain.stats}
+
+    return app
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fake Solana JSON-RPC server")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8899)
+    ap.add_argument("--slots-per-s", type=float, default=2.5)
+    ap.add_argument("--skip-rate", type=float, default=0.05)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--http-error-rate", type=float, default=0.0)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--seed", default="fake-solana")
+    args = ap.parse_args()
+
+    import uvicorn
+    chain = FakeChain(
+        slots_per_s=args.slots_per_s, skip_rate=args.skip_rate, error_rate=args.error_rate,
+        http_error_rate=args.http_error_rate, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        seed=args.seed.encode(),
+    )
+    uvicorn.run(create_app(chain), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
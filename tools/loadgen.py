@@ -0,0 +1,255 @@
+# tools/loadgen.py
+"""
+Нагрузочный прогон тиражей end-to-end.
+
+По умолчанию поднимает fake RPC (tools.fake_rpc) и приложение (uvicorn main:app) во временном
+STORE_DIR, затем запускает --draws тиражей с параллелизмом --concurrency; на каждый тираж
+до POST подписывается --subscribers SSE-клиентов. Сводка — JSON в stdout:
+  • латентность тиража (POST /draws/solana) p50/p99/max, ошибки по статусам;
+  • задержка доставки block.finalized_all (приём − finalizedAt сервера) p50/p99;
+  • разброс доставки result между подписчиками одного тиража (fan-out skew);
+  • RSS приложения (с дочерними процессами) до/после и пик (Linux, /proc).
+
+    python -m tools.loadgen --draws 200 --concurrency 20 --subscribers 5 --collect-ms 500
+    python -m tools.loadgen --base http://127.0.0.1:8000 --server-pid 1234   # уже запущенный сервер
+"""
+import argparse, asyncio, json, os, socket, statistics, subprocess, sys, tempfile, time
+from typing import Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _children(pid: int) -> List[int]:
+    out = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                out += [int(x) for x in f.read().split()]
+    except OSError:
+        pass
+    return out
+
+def _rss_kb(pid: Optional[int]) -> Optional[int]:
+    """RSS процесса и всех потомков (воркеры uvicorn, пул jitter) в КиБ; None вне Linux."""
+    if not pid:
+        return None
+    total, stack, seen = 0, [pid], False
+    while stack:
+        p = stack.pop()
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+                        seen = True
+                        break
+        except OSError:
+            continue
+        stack += _children(p)
+    return total if seen else None
+
+def _pct(xs: List[float], q: float) -> Optional[float]:
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return round(xs[min(len(xs) - 1, int(len(xs) * q))], 2)
+
+def _dist(xs: List[float]) -> dict:
+    return {"n": len(xs), "p50": _pct(xs, 0.5), "p99": _pct(xs, 0.99),
+            "max": round(max(xs), 2) if xs else None, "mean": round(statistics.fmean(xs), 2) if xs else None}
+
+async def _wait_http(url: str, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as c:
+        while time.monotonic() < deadline:
+            try:
+                await c.get(url, timeout=1.0)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+class Run:
+    def __init__(self, base: str, args):
+        self.base = base
+        self.args = args
+        self.draw_ms: List[float] = []
+        self.statuses: Dict[str, int] = {}
+        self.finalized_lag_ms: List[float] = []
+        self.result_skew_ms: List[float] = []
+        self.events = 0
+        self.sse_errors = 0
+
+    async def _subscriber(self, client: httpx.AsyncClient, draw_id: str, ready: asyncio.Event,
+                          result_at: List[float]):
+        try:
+            async with client.stream("GET", f"{self.base}/draws/{draw_id}/stream", timeout=None) as r:
+                ready.set()
+                async for line in r.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    now_ms = time.time() * 1000.0
+                    ev = json.loads(line[6:])
+                    self.events += 1
+                    kind = ev.get("type")
+                    if kind == "block.finalized_all" and ev.get("finalizedAt"):
+                        self.finalized_lag_ms.append(now_ms - ev["finalizedAt"])
+                    elif kind == "result":
+                        result_at.append(now_ms)
+                        return
+                    elif kind == "error":
+                        return
+        except (httpx.HTTPError, asyncio.CancelledError):
+            self.sse_errors += 1
+        finally:
+            ready.set()
+
+    async def _one(self, client: httpx.AsyncClient, i: int):
+        draw_id = f"load-{int(time.time() * 1000)}-{i}"
+        result_at: List[float] = []
+        readies, subs = [], []
+        for _ in range(self.args.subscribers):
+            ready = asyncio.Event()
+            readies.append(ready)
+            subs.append(asyncio.create_task(self._subscriber(client, draw_id, ready, result_at)))
+        # подписчики подключены до commit (как фронт после анонса в __current__)
+        await asyncio.gather(*(r.wait() for r in readies))
+        t0 = time.perf_counter()
+        try:
+            r = await client.post(f"{self.base}/draws/solana", timeout=self.args.timeout, json={
+                "draw_id": draw_id, "blocks": self.args.blocks, "collect_ms": self.args.collect_ms,
+                "srv_jitter_samples": self.args.jitter_samples,
+            })
+            status = str(r.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.draw_ms.append((time.perf_counter() - t0) * 1000.0)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        try:
+            await asyncio.wait_for(asyncio.gather(*subs), timeout=5.0)
+        except asyncio.TimeoutError:
+            for t in subs:
+                t.cancel()
+        if len(result_at) > 1:
+            self.result_skew_ms.append(max(result_at) - min(result_at))
+
+    async def run(self, server_pid: Optional[int]) -> dict:
+        limits = httpx.Limits(max_connections=self.args.concurrency * (self.args.subscribers + 1) + 10)
+        rss_before = _rss_kb(server_pid)
+        rss_peak = rss_before or 0
+        sem = asyncio.Semaphore(self.args.concurrency)
+        started = time.perf_counter()
+
+        async def sample_rss():
+            nonlocal rss_peak
+            while True:
+                rss_peak = max(rss_peak, _rss_kb(server_pid) or 0)
+                await asyncio.sleep(0.25)
+
+        async def guarded(client, i):
+            async with sem:
+                await self._one(client, i)
+
+        sampler = asyncio.create_task(sample_rss()) if server_pid else None
+        async with httpx.AsyncClient(limits=limits) as client:
+            await asyncio.gather(*(guarded(client, i) for i in range(self.args.draws)))
+        if sampler:
+            sampler.cancel()
+        elapsed = time.perf_counter() - started
+        rss_after = _rss_kb(server_pid)
+        return {
+            "config": {k: getattr(self.args, k) for k in
+                       ("draws", "concurrency", "subscribers", "blocks", "collect_ms", "jitter_samples")},
+            "elapsedS": round(elapsed, 2),
+            "drawsPerS": round(len(self.draw_ms) / elapsed, 2) if elapsed else None,
+            "statuses": self.statuses,
+            "drawLatencyMs": _dist(self.draw_ms),
+            "finalizedDeliveryLagMs": _dist(self.finalized_lag_ms),
+            "resultFanoutSkewMs": _dist(self.result_skew_ms),
+            "sseEvents": self.events,
+            "sseErrors": self.sse_errors,
+            "serverRssKb": {"before": rss_before, "after": rss_after, "peak": rss_peak or None,
+                            "growth": (rss_after - rss_before) if rss_before and rss_after else None},
+        }
+
+
+def _spawn(args) -> tuple:
+    """fake RPC + приложение как подпроцессы; вернёт (base_url, rpc_url, app_pid, процессы, tmp)."""
+    rpc_port, app_port = _free_port(), _free_port()
+    tmp = tempfile.TemporaryDirectory(prefix="loadgen-")
+    rpc = subprocess.Popen([
+        sys.executable, "-m", "tools.fake_rpc", "--port", str(rpc_port),
+        "--latency-ms", str(args.rpc_latency_ms), "--jitter-ms", str(args.rpc_jitter_ms),
+        "--skip-rate", str(args.rpc_skip_rate), "--error-rate", str(args.rpc_error_rate),
+    ], cwd=ROOT, stdout=sys.stderr)
+    env = dict(os.environ,
+               SOLANA_RPC_URL=f"http://127.0.0.1:{rpc_port}",
+               STORE_DIR=os.path.join(tmp.name, "draws"),
+               AUTO_DRAW="false")
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"]
+    if args.workers > 1:
+        cmd += ["--workers", str(args.workers)]
+        env.update(CLUSTER="true", CLUSTER_DIR=os.path.join(tmp.name, "run"))
+    # stdout подпроцессов — в stderr: в stdout только JSON-сводка
+    app = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=sys.stderr)
+    return f"http://127.0.0.1:{app_port}", f"http://127.0.0.1:{rpc_port}", app.pid, [app, rpc], tmp
+
+
+async def _main(args) -> dict:
+    procs, tmp, rpc_base = [], None, None
+    base, pid = args.base, args.server_pid
+    if not base:
+        base, rpc_base, pid, procs, tmp = _spawn(args)
+    try:
+        await _wait_http(f"{base}/health")
+        if rpc_base:
+            await _wait_http(f"{rpc_base}/stats")
+        if args.warmup:
+            warm = argparse.Namespace(**{**vars(args), "draws": args.warmup, "subscribers": 0})
+            await Run(base, warm).run(None)
+        report = await Run(base, args).run(pid)
+        if rpc_base:
+            async with httpx.AsyncClient() as c:
+                report["rpc"] = (await c.get(f"{rpc_base}/stats")).json()
+        return report
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        if tmp is not None:
+            tmp.cleanup()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="End-to-end draw load generator")
+    ap.add_argument("--base", help="running server URL; default: spawn fake RPC + app")
+    ap.add_argument("--server-pid", type=int, help="PID to sample RSS from when using --base")
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn workers for the spawned app (cluster mode if >1)")
+    ap.add_argument("--draws", type=int, default=50)
+    ap.add_argument("--concurrency", type=int, default=10)
+    ap.add_argument("--subscribers", type=int, default=3, help="SSE subscribers per draw")
+    ap.add_argument("--blocks", type=int, default=3)
+    ap.add_argument("--collect-ms", type=int, default=500)
+    ap.add_argument("--jitter-samples", type=int, default=4000)
+    ap.add_argument("--warmup", type=int, default=2, help="draws before measuring")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--rpc-latency-ms", type=float, default=30.0)
+    ap.add_argument("--rpc-jitter-ms", type=float, default=10.0)
+    ap.add_argument("--rpc-skip-rate", type=float, default=0.05)
+    ap.add_argument("--rpc-error-rate", type=float, default=0.0)
+    args = ap.parse_args()
+    print(json.dumps(asyncio.run(_main(args)), indent=2))
+
+if __name__ == "__main__":
+    main()